@@ -1,8 +1,19 @@
-import json
-import tkinter as tk
+from __future__ import annotations
 import copy
-from Gui import Gui
+import numpy as np
 from Body import *
+from Engine import Engine, pairForce
+from Worker import PhysicsWorker
+from Trajectory import TrajectoryBuffer
+from Recorder import Recorder
+from Replay import Replay
+from Sprite import Sprite
+from Profiler import Profiler
+from Diagnostics import ConservationMonitor
+from Renderer import RasterRenderer, toPPM
+from Camera import Camera, FOLLOW_BODY, FOLLOW_CENTER_OF_MASS
+import Renderer
+import Scenario
 import Colors
 
 class CelestialBody:
@@ -10,53 +21,104 @@ class CelestialBody:
     __maxPointsInTrajectory = 3
     @classmethod
     def setPointsInTrajectory(cls, value):
-        if value < 0:
+        if value < 1:
             raise ValueError("MaxPointsInTrajectory cannot be lower than 1")
         cls.__maxPointsInTrajectory = value
 
     def __init__(self, body, app):
         self.__body = body
-        self.__trajectory = []              # list of points ( list(Vector) )
-        self.__trajectoryIDs = []
+        self.__trajectory = TrajectoryBuffer(CelestialBody.__maxPointsInTrajectory)
+        self.__trajectoryID = None          # whole trajectory is one polyline on canvas
         self.__app = app                    # handler to app
 
-    def updateTrajectory(self):
-        self.__trajectory.append(copy.deepcopy(self.__body.position))
-        while len(self.__trajectory) > CelestialBody.__maxPointsInTrajectory:
-            self.__app.removeShape(self.__trajectoryIDs[0])
-            self.__trajectory.pop(0)
-            self.__trajectoryIDs.pop(0)
-        if len(self.__trajectory) >= 3:     # at least two points to create trajectory
-            coords = (
-                self.__trajectory[-2].x,
-                self.__trajectory[-2].y,
-                self.__trajectory[-1].x,
-                self.__trajectory[-1].y
-            )
-            id = self.__app.addLine(coords, self.__body.color)
-            self.__trajectoryIDs.append(id)
+    def updateTrajectory(self):             # returns (line id, new point, oldest points to drop) for the polyline or None
+        length = len(self.__trajectory)
+        if self.__trajectory.capacity != CelestialBody.__maxPointsInTrajectory:    # trajectory length was changed
+            self.__trajectory.resize(CelestialBody.__maxPointsInTrajectory)
+        point = self.__body.position.toPair()
+        self.__trajectory.append(point)
+        if len(self.__trajectory) < 2:      # at least two points to create trajectory
+            return None
+        if self.__trajectoryID is None:
+            self.__trajectoryID = self.__app.addLine(self.__trajectory.toArray().ravel(), self.__body.color)
+            return None
+        return self.__trajectoryID, point, length + 1 - len(self.__trajectory)
 
     def eraseTrajectory(self):
-        for i in self.__trajectoryIDs:
-            self.__app.removeShape(i)
-        self.__trajectoryIDs = []
-        self.__trajectory = []
+        trajectoryID = self.releaseTrajectory()
+        if trajectoryID is not None:
+            self.__app.removeShape(trajectoryID)
+
+    def releaseTrajectory(self):            # clears the trajectory, returns id of its polyline for the caller to remove
+        trajectoryID = self.__trajectoryID
+        self.__trajectoryID = None
+        self.__trajectory.clear()
+        return trajectoryID
 
     @property
     def body(self):
         return self.__body
 
+    @property
+    def trajectoryID(self):
+        return self.__trajectoryID
+
+    @property
+    def trajectory(self):                   # points as contiguous (n, 2) array, oldest first
+        return self.__trajectory.toArray()
+
     def toDict(self):
         return self.__body.toDict()
 
 class App:
 
-    def __init__(self):
+    def __init__(self, forceSolver=None, integrator=None, collisionHandler=None):
         self.__celestialBodies = {}             # int : CelestialBody
-        self.__maxCalculationDeltaTime = 1000.0/20.0       # we don't want to go below 20FPS to avoid inaccurate calculations
+        self.__shapeIds = {}                    # engine handle : canvas id of its sprite
+        self.__profiler = Profiler()            # per-phase frame timings, the engine reports forces, integration and collisions
+        self.__profilerOverlay = False          # show timings in the status bar
+        self.__lastFrameEnd = None              # perf_counter time the previous update returned to Tk
+        self.__engine = Engine(forceSolver, integrator, collisionHandler, profiler=self.__profiler)     # bodies' state lives here, Body objects are views into it
+        self.__maxFrameDeltaTime = 0.25         # longer frames are not caught up, otherwise slow steps would pile up
+        self.__physicsDeltaTime = 0.025         # fixed simulation time of one physics step
+        self.__MIN_PHYSICS_DELTA_TIME = 0.025 / 64      # automatic timestep reduction stops here
+        self.__monitor = None                   # ConservationMonitor while conserved quantities are tracked
+        self.__MONITOR_EVERY = 10               # physics steps between monitor updates
+        self.__MAX_STEPS_PER_FRAME = 64
+        self.__targetFps = 60
+        self.__previousPositions = None         # positions and handles before the last physics step, for interpolation
+        self.__previousHandles = None
+        self.__worker = None                    # PhysicsWorker when physics runs in a background process
+        self.__workerDirty = False              # local engine changed, worker has to get the new state
+        self.__pendingTrajectories = []         # (line id, point, points to drop, CelestialBody) sent to canvas with the next sprite update
+        self.__trailView = None                 # camera view and canvas size the trajectory polylines on canvas are drawn in
+        self.__exactTrails = set()              # polylines holding every trajectory point, new points are appended in place
+        self.__TRAIL_MARGIN = 50                # pixels around the canvas trail points are kept in
+        self.__steps = 0                        # physics steps done so far
+        self.__simulationTime = 0.0
+        self.__recorder = None                  # Recorder while the simulation is being recorded
+        self.__replay = None                    # Replay while a recording is played back instead of the simulation
+        self.__replayShapes = {}                # recorded handle : canvas id of its sprite
+        self.__replayShownStep = None
+        self.__hiddenBodies = {}                # handle : simulated body, their shapes are removed during replay
+        self.__renderer = None                  # RasterRenderer when all bodies are drawn into one image
+        self.__nextVirtualShapeId = -1          # bodies get negative ids without canvas items while rendering to image
+        self.__rgb = {}                         # color name : (r, g, b)
+        self.__rasterHandles = None             # handles the cached raster colors belong to
+        self.__rasterColors = None
+        self.__rasterView = None                # camera view the trails of the renderer were drawn in
+        self.__camera = Camera()                # world to canvas mapping, sprites and trails outside of it are not updated
+        self.__lastView = None                  # camera view and canvas size of the last drawn frame
+        self.__parkedShapes = set()             # canvas ids moved out of sight, skipped until visible again
+        self.__aggregateIds = []                # pool of canvas items standing for clusters of sub-pixel bodies
+        self.__aggregatesInUse = 0
+        self.__PARKED_COORDS = (-10.0, -10.0, -10.0, -10.0)
+        self.__MIN_SPRITE_HALF_SIZE = 0.5       # pixels, smaller bodies are drawn as aggregated points
+        self.__AGGREGATE_CELL = 2               # pixels, sub-pixel bodies in one cell share a point
+        self.__AGGREGATE_COLOR = "#C0C0C0"
         self.__speedFactor = 5
         self.__lastTime = None                  # time since last __resetClock method
-        self.__timeAcc = 0                      # accumulator for time
+        self.__timeAcc = 0                      # simulation time not yet consumed by physics steps
         self.__pause = False
         self.__resetClock()
         self.__MAX_SPEED_FACTOR = 40
@@ -81,16 +143,67 @@ class App:
 
     @staticmethod
     def calculateForceVector(body1, body2) -> Vector:
-        deltaS = body2.position - body1.position
-        distanceValue =  Vector.distance(body1.position, body2.position).len()
-        if distanceValue < body1.radius + body2.radius:
-            distanceValue = body1.radius + body2.radius
-        forceValue = Const.getGValue() * body1.mass * body2.mass / distanceValue
-        force = Vector(
-            forceValue * deltaS.x / distanceValue,
-            forceValue * deltaS.y / distanceValue
-        )
-        return force
+        return pairForce(body1, body2)
+
+    @property
+    def engine(self):
+        return self.__engine
+
+    @property
+    def profiler(self):
+        return self.__profiler
+
+    @property
+    def profilerOverlay(self) -> bool:
+        return self.__profilerOverlay
+
+    @profilerOverlay.setter
+    def profilerOverlay(self, value):
+        self.__profilerOverlay = value
+
+    @property
+    def conservationMonitor(self) -> bool:
+        return self.__monitor is not None
+
+    def useConservationMonitor(self, enabled: bool, energyTolerance=None):  # with tolerance, drift halves physicsDeltaTime
+        if self.__monitor is not None:
+            self.__monitor.close()
+        self.__monitor = ConservationMonitor(self.__MONITOR_EVERY, energyTolerance) if enabled else None
+        if enabled and hasattr(self.__engine.forceSolver, "withPotential"):
+            self.__engine.forceSolver.withPotential = True      # potential energy comes with the forces
+        if self.__worker is not None:
+            self.__configureWorker()
+            self.__worker.setMonitor(self.__monitor, self.__MIN_PHYSICS_DELTA_TIME)
+
+    def saveProfilerTrace(self, filename):
+        self.__profiler.dumpTrace(filename)
+
+    @property
+    def forceSolver(self):
+        return self.__engine.forceSolver
+
+    @forceSolver.setter
+    def forceSolver(self, solver):
+        self.__engine.forceSolver = solver
+        self.__configureWorker()
+
+    @property
+    def collisionHandler(self):
+        return self.__engine.collisionHandler
+
+    @collisionHandler.setter
+    def collisionHandler(self, handler):
+        self.__engine.collisionHandler = handler
+        self.__configureWorker()
+
+    @property
+    def integrator(self):
+        return self.__engine.integrator
+
+    @integrator.setter
+    def integrator(self, integrator):
+        self.__engine.integrator = integrator
+        self.__configureWorker()
 
     @property
     def newBodyRadius(self):
@@ -104,6 +217,27 @@ class App:
             raise ValueError(f'Radius canot be greater than {self.MAX_BODY_RADIUS}')
         self.__newBodyRadius = value
 
+    @property
+    def physicsDeltaTime(self):
+        return self.__physicsDeltaTime
+
+    @physicsDeltaTime.setter
+    def physicsDeltaTime(self, value):
+        if value <= 0:
+            raise ValueError("Physics delta time has to be positive value")
+        self.__physicsDeltaTime = value
+        self.__configureWorker()
+
+    @property
+    def targetFps(self):
+        return self.__targetFps
+
+    @targetFps.setter
+    def targetFps(self, value):
+        if value < 1:
+            raise ValueError("Target fps cannot be lower than 1")
+        self.__targetFps = value
+
     @property
     def fps(self):
         return self.__fps
@@ -198,42 +332,449 @@ class App:
             self.__speedFactor = self.MAX_SPEED_FACTOR
         else:
             self.__speedFactor = value
+        if self.__worker is not None:
+            self.__worker.setSpeedFactor(self.__speedFactor)
+
+    @property
+    def backgroundWorker(self) -> bool:
+        return self.__worker is not None
+
+    def useBackgroundWorker(self, enabled: bool):
+        if enabled and self.__worker is None:
+            self.__worker = PhysicsWorker(self.__engine.forceSolver, self.__engine.integrator,
+                                          self.__engine.collisionHandler, self.__physicsDeltaTime)
+            self.__worker.start()
+            self.__worker.setSpeedFactor(self.__speedFactor)
+            if self.__monitor is not None:
+                self.__worker.setMonitor(self.__monitor, self.__MIN_PHYSICS_DELTA_TIME)
+            self.__worker.push(self.__engine, self.__steps, self.__simulationTime)
+            self.__workerDirty = False
+            self.__previousPositions = None
+            if not self.__pause:
+                self.__worker.resume()
+        elif not enabled and self.__worker is not None:
+            self.__syncFromWorker()
+            self.__worker.stop()
+            self.__worker = None
+            self.__resetClock()
+
+    def shutdown(self):
+        self.stopRecording()
+        self.useBackgroundWorker(False)
+
+    @property
+    def recording(self) -> bool:
+        return self.__recorder is not None
+
+    def startRecording(self, path, every=1, compressionLevel=0):
+        self.stopRecording()
+        self.__syncFromWorker()
+        self.__recorder = Recorder(path, every, compressionLevel=compressionLevel)
+        self.__recorder.addColors(self.__engine.handles, [self.__colorOf(handle) for handle in self.__engine.handles])
+        self.__recorder.recordEngine(self.__steps, self.__simulationTime, self.__engine)
+
+    def stopRecording(self):
+        if self.__recorder is not None:
+            self.__recorder.close()
+            self.__recorder = None
+
+    @property
+    def replaying(self) -> bool:
+        return self.__replay is not None
+
+    def openReplay(self, path):                 # simulation is paused and hidden until closeReplay
+        replay = Replay(path)
+        self.closeReplay()
+        self.pause()
+        self.__syncFromWorker()
+        self.__hiddenBodies = {body.handle: body for body in self.__hideBodies()}
+        self.__rasterHandles = None
+        self.__replay = replay
+
+    def closeReplay(self):
+        if self.__replay is None:
+            return
+        for id in self.__replayShapes.values():
+            self.removeShape(id)
+        self.__replayShapes.clear()
+        self.__replayShownStep = None
+        self.__replay = None
+        self.__rasterHandles = None
+        self.__showBodies(self.__hiddenBodies.values())
+        self.__hiddenBodies = {}
+
+    def __hideBodies(self):                     # removes shapes of all bodies, returns the bodies
+        bodies = [cbody.body for cbody in self.__celestialBodies.values()]
+        self.__removeBodyShapes(list(self.__shapeIds.keys()))
+        self.__pendingTrajectories = []
+        return bodies
+
+    def __showBodies(self, bodies):
+        for body in bodies:
+            id = self.__addBodyShape(body.sprite)
+            self.__celestialBodies.update({id : CelestialBody(body, self)})
+            self.__shapeIds[body.handle] = id
+
+    def __addBodyShape(self, sprite) -> int:
+        self.__lastView = None                  # new shape is placed by the next frame even when paused
+        if self.__renderer is None:
+            return self.__gui.addSprite(sprite)
+        self.__nextVirtualShapeId -= 1
+        return self.__nextVirtualShapeId + 1
+
+    def __addBodyShapes(self, positions, radii, colors) -> list:    # bulk __addBodyShape
+        self.__lastView = None
+        if self.__renderer is None:
+            halfSizes = (np.asarray(radii, dtype=float) / 2)[:, np.newaxis]     # same box as Sprite.getBoundingBoxCoords
+            positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+            return self.__gui.addSprites(np.hstack((positions - halfSizes, positions + halfSizes)), colors)
+        first = self.__nextVirtualShapeId
+        self.__nextVirtualShapeId -= len(colors)
+        return list(range(first, self.__nextVirtualShapeId, -1))
+
+    @property
+    def renderMode(self):                       # "sprites" or one of Renderer.MODES
+        return "sprites" if self.__renderer is None else self.__renderer.mode
+
+    @property
+    def trails(self) -> bool:
+        return self.__renderer is not None and self.__renderer.trails
+
+    def setRenderMode(self, mode, trails=False):    # trails only in image modes
+        if mode != "sprites" and mode not in Renderer.MODES:
+            raise ValueError(f'Unknown render mode {mode}')
+        if (mode == "sprites") != (self.__renderer is None):     # bodies switch between canvas items and the image
+            bodies = self.__hideBodies()
+            self.__removeAggregates()
+            for id in self.__replayShapes.values():
+                self.removeShape(id)
+            self.__replayShapes.clear()
+            self.__replayShownStep = None
+            if mode == "sprites":
+                self.__renderer = None
+                self.__gui.clearImage()
+            else:
+                self.__renderer = RasterRenderer(*self.__gui.canvasSize(), mode, trails)
+            self.__showBodies(bodies)
+        elif self.__renderer is not None:
+            self.__renderer.mode = mode
+            self.__renderer.trails = trails
+            self.__replayShownStep = None
+
+    def __rgbOf(self, color):
+        if color not in self.__rgb:
+            self.__rgb[color] = self.__gui.colorToRgb(color)
+        return self.__rgb[color]
+
+    def __rasterColorsOf(self, handles, colorOf):   # (n, 3) uint8 in handles order, rebuilt only when handles change
+        if self.__rasterHandles is None or not np.array_equal(self.__rasterHandles, handles):
+            self.__rasterHandles = handles.copy()
+            self.__rasterColors = np.array([self.__rgbOf(colorOf(int(handle))) for handle in handles],
+                                           dtype=np.uint8).reshape(-1, 3)
+        return self.__rasterColors
+
+    def __drawImage(self, positions, radii, colors):
+        size = self.__gui.canvasSize()
+        if size != self.__renderer.size:
+            self.__renderer.resize(*size)
+        view = self.__camera.view
+        if self.__renderer.trails and self.__rasterView is not None and view != self.__rasterView:
+            originX, originY, zoom = self.__rasterView      # trails of the old view follow the camera
+            scale = view[2] / zoom
+            self.__renderer.moveTrails(scale, ((originX - view[0]) * view[2], (originY - view[1]) * view[2]))
+        self.__rasterView = view
+        image = self.__renderer.render(self.__camera.toScreen(positions), radii * self.__camera.zoom, colors)
+        self.__gui.drawImage(toPPM(image))
+
+    @property
+    def camera(self):
+        return self.__camera
+
+    def followNearestBody(self, position : Vector):     # camera follows the simulated body closest to position
+        if self.__replay is not None or self.__engine.count == 0:
+            return
+        offsets = self.__engine.positions - position.toPair()
+        row = int(np.argmin(np.einsum('ij,ij->i', offsets, offsets)))
+        self.__camera.followBody(self.__engine.handles[row])
+
+    def __currentView(self):
+        return self.__camera.view + tuple(self.__gui.canvasSize())
+
+    def __trackCamera(self, handles, positions, masses):    # moves the camera onto its followed target, masses None weighs all alike
+        width, height = self.__gui.canvasSize()
+        if self.__camera.following == FOLLOW_BODY:
+            rows = np.flatnonzero(handles == self.__camera.followedHandle)
+            if len(rows) == 0:              # followed body merged or was removed
+                self.__camera.stopFollowing()
+                return
+            self.__camera.track(positions[rows[0]], width, height)
+        elif self.__camera.following == FOLLOW_CENTER_OF_MASS and len(handles):
+            self.__camera.track(np.average(positions, axis=0, weights=masses), width, height)
+
+    def __spriteCoords(self, ids, centers, radii):  # (ids, coords) of sprites to move, off-screen and sub-pixel ones are skipped
+        width, height = self.__gui.canvasSize()
+        screen = self.__camera.toScreen(centers)
+        halfSizes = (radii * (self.__camera.zoom / 2))[:, np.newaxis]    # same box as Sprite.getBoundingBoxCoords
+        onScreen = np.all((screen + halfSizes >= 0) & (screen - halfSizes <= (width, height)), axis=1)
+        resolved = halfSizes[:, 0] >= self.__MIN_SPRITE_HALF_SIZE
+        shown = onScreen & resolved
+        shownIds = ids[shown].tolist()
+        parkedIds = [id for id in ids[~shown].tolist() if id not in self.__parkedShapes]
+        self.__parkedShapes.difference_update(shownIds)
+        self.__parkedShapes.update(parkedIds)
+        coords = list(np.hstack((screen[shown] - halfSizes[shown], screen[shown] + halfSizes[shown])))
+        coords += [self.__PARKED_COORDS] * len(parkedIds)
+        aggregateIds, aggregateCoords = self.__aggregates(screen[onScreen & ~resolved])
+        return shownIds + parkedIds + aggregateIds, coords + aggregateCoords
+
+    def __aggregates(self, screen):             # one point per canvas cell holding sub-pixel bodies
+        cell = self.__AGGREGATE_CELL
+        corners = np.unique(np.floor(screen / cell), axis=0) * cell
+        while len(self.__aggregateIds) < len(corners):
+            self.__aggregateIds.append(self.__gui.addPoint(self.__AGGREGATE_COLOR))
+        ids = self.__aggregateIds[:max(len(corners), self.__aggregatesInUse)]
+        coords = list(np.hstack((corners, corners + cell))) + [self.__PARKED_COORDS] * (len(ids) - len(corners))
+        self.__aggregatesInUse = len(corners)
+        return ids, coords
+
+    def __removeAggregates(self):
+        for id in self.__aggregateIds:
+            self.removeShape(id)
+        self.__aggregateIds = []
+        self.__aggregatesInUse = 0
+
+    def __nearViewport(self, screen):           # (n, 2) canvas points -> (n,) bool, inside the canvas plus the trail margin
+        width, height = self.__gui.canvasSize()
+        margin = self.__TRAIL_MARGIN
+        return np.all((screen >= -margin) & (screen <= (width + margin, height + margin)), axis=1)
+
+    def __trailCoords(self, points):            # (canvas polyline of the part of a trajectory near the viewport or None, nothing left out)
+        screen = self.__camera.toScreen(points)
+        inside = self.__nearViewport(screen)
+        near = inside.copy()                    # segments with one end inside are kept whole
+        near[1:] |= inside[:-1]
+        near[:-1] |= inside[1:]
+        rows = np.flatnonzero(near)
+        if len(rows) < 2:
+            return None, False
+        if rows[0] == 0 and rows[-1] == len(points) - 1:   # whole line, kept complete so new points can be appended
+            return screen.ravel(), True
+        screen = screen[rows[0]:rows[-1] + 1]
+        pixels = np.floor(screen)
+        keep = np.ones(len(screen), dtype=bool)     # points in the pixel of their predecessor add nothing
+        keep[1:-1] = np.any(pixels[1:-1] != pixels[:-2], axis=1)
+        return screen[keep].ravel(), False
+
+    def __redrawTrail(self, lineId, points, ids, coords):  # adds coords of a polyline from its world points, parks it off the viewport
+        lineCoords, exact = self.__trailCoords(points)
+        if exact:
+            self.__exactTrails.add(lineId)
+        else:
+            self.__exactTrails.discard(lineId)
+        if lineCoords is None:
+            if lineId not in self.__parkedShapes:
+                self.__parkedShapes.add(lineId)
+                ids.append(lineId)
+                coords.append(self.__PARKED_COORDS)
+            return
+        self.__parkedShapes.discard(lineId)
+        ids.append(lineId)
+        coords.append(lineCoords)
+
+    def __redrawTrails(self):                   # (ids, coords) of all polylines after the camera or the canvas changed
+        self.__pendingTrajectories = []
+        ids, coords = [], []
+        for cbody in self.__celestialBodies.values():
+            if cbody.trajectoryID is not None:
+                self.__redrawTrail(cbody.trajectoryID, cbody.trajectory, ids, coords)
+        return ids, coords
+
+    # New trajectory points. Complete polylines near the viewport get the point appended in place,
+    # clipped ones are drawn again from their world points, lines off the viewport are parked once
+    # and left alone. Returns (ids, coords) of the redrawn lines, the appends go in one canvas call.
+    def __flushTrajectories(self):
+        ids, coords = [], []
+        if not self.__pendingTrajectories:
+            return ids, coords
+        lineIds, points, drops, cbodies = zip(*self.__pendingTrajectories)
+        self.__pendingTrajectories = []
+        screen = self.__camera.toScreen(np.array(points))
+        appended = []
+        for lineId, point, near, drop, cbody in zip(lineIds, screen, self.__nearViewport(screen), drops, cbodies):
+            if lineId in self.__exactTrails and near:
+                appended.append((lineId, point, drop))
+            elif lineId not in self.__parkedShapes or near:
+                self.__redrawTrail(lineId, cbody.trajectory, ids, coords)
+        if appended:
+            self.__gui.extendLines(*zip(*appended))
+        return ids, coords
+
+    @property
+    def replayReversed(self) -> bool:
+        return self.__replay is not None and self.__replay.reversed
+
+    @replayReversed.setter
+    def replayReversed(self, value):
+        if self.__replay is not None:
+            self.__replay.reversed = value
+
+    def seekReplay(self, fraction):             # 0 is the start of the recording, 1 its end
+        if self.__replay is not None:
+            self.__replay.seekFraction(fraction)
+
+    def stepReplay(self, frames):               # whole recorded frames, negative goes back
+        if self.__replay is not None:
+            self.__replay.stepFrames(frames)
+
+    def __updateReplay(self, deltaTime):
+        self.__replay.advance(min(deltaTime, self.__maxFrameDeltaTime) * self.__speedFactor)
+        frame = self.__replay.frame()
+        if frame.step == self.__replayShownStep and self.__currentView() == self.__lastView:
+            return
+        self.__replayShownStep = frame.step
+        colors = self.__replay.reader.colors
+        self.__trackCamera(frame.handles, frame.positions, None)    # recordings have no masses, centroid instead
+        self.__lastView = self.__currentView()
+        if self.__renderer is not None:
+            self.__drawImage(frame.positions, frame.radii,
+                             self.__rasterColorsOf(frame.handles, lambda handle: colors.get(handle, "white")))
+            return
+        shown = set(int(handle) for handle in frame.handles)
+        for handle in [handle for handle in self.__replayShapes if handle not in shown]:
+            self.removeShape(self.__replayShapes.pop(handle))
+        for handle, position, radius in zip(frame.handles, frame.positions, frame.radii):
+            if int(handle) not in self.__replayShapes:
+                sprite = Sprite(radius, colors.get(int(handle), Colors.getRandomColor()), Vector(*position))
+                self.__replayShapes[int(handle)] = self.__gui.addSprite(sprite)
+        ids = np.array([self.__replayShapes[int(handle)] for handle in frame.handles], dtype=np.int64)
+        self.__gui.setShapesCoords(*self.__spriteCoords(ids, frame.positions, frame.radii))
+
+    def __colorOf(self, handle):                # also of bodies hidden by a replay, which have no shape
+        handle = int(handle)
+        if handle in self.__hiddenBodies:
+            return self.__hiddenBodies[handle].color
+        return self.__celestialBodies[self.__shapeIds[handle]].body.color
+
+    def __syncFromWorker(self):                 # copies worker state into the local engine
+        if self.__worker is None or self.__workerDirty:
+            return
+        handles, masses, radii, positions, velocities = self.__worker.collect()
+        removed = np.setdiff1d(self.__engine.handles, handles)
+        for handle in removed:                  # one by one like the worker, so rows stay in the same order
+            self.__engine.remove(int(handle))
+        self.__removeBodyShapes(int(handle) for handle in removed)
+        rows = [self.__engine.rowOf(int(handle)) for handle in handles]
+        self.__engine.masses[rows] = masses
+        self.__engine.radii[rows] = radii
+        self.__engine.positions[rows] = positions
+        self.__engine.velocities[rows] = velocities
+        self.__engine.invalidateAccelerations()
+
+    def __configureWorker(self):                # the worker steps with copies, they are sent again after every change
+        if self.__worker is not None:
+            self.__worker.configure(self.__engine.forceSolver, self.__engine.integrator,
+                                    self.__engine.collisionHandler, self.__physicsDeltaTime)
+
+    def __beforeStructureChange(self):
+        self.closeReplay()
+        if self.__worker is not None:
+            self.__syncFromWorker()
+            self.__workerDirty = True           # pushed to worker on next update
+
+    def __updateFromWorker(self):
+        if self.__workerDirty:
+            self.__worker.push(self.__engine, self.__steps, self.__simulationTime)
+            self.__workerDirty = False
+        snapshot = self.__worker.latest()
+        if snapshot is None:
+            return
+        handles, positions, velocities, radii, simulationTime, steps = snapshot
+        if self.__recorder is not None and steps != self.__steps:
+            self.__recorder.record(steps, simulationTime, handles, positions, velocities, radii)
+        for row, monitor, deltaTime in self.__worker.diagnostics():     # monitor runs in the worker, see __updateMonitor
+            if self.__monitor is None:
+                break
+            self.__monitor, self.__physicsDeltaTime = monitor, deltaTime
+            if self.__recorder is not None:
+                self.__recorder.recordDiagnostics(row)
+        self.__steps, self.__simulationTime = steps, simulationTime
+        if len(handles) < self.__engine.count:          # worker merged some bodies
+            removed = np.setdiff1d(self.__engine.handles, handles)
+            for handle in removed:
+                self.__engine.remove(int(handle))
+            self.__removeBodyShapes(int(handle) for handle in removed)
+        if np.array_equal(handles, self.__engine.handles):
+            self.__engine.positions[:] = positions
+            self.__engine.radii[:] = radii
+        else:
+            rows = [self.__engine.rowOf(int(handle)) for handle in handles]
+            self.__engine.positions[rows] = positions
+            self.__engine.radii[rows] = radii
 
     def assignGui(self, gui : Gui):             # handler to gui instance
         self.__gui = gui
 
     def pause(self):
+        if self.__replay is not None:
+            self.__replay.playing = False
+            return
         self.__pause = True
+        if self.__worker is not None:
+            self.__worker.pause()
 
     def resume(self):
+        if self.__replay is not None:
+            self.__replay.playing = True
+            return
         self.__pause = False
         self.__resetClock()
+        if self.__worker is not None:
+            self.__worker.resume()
 
     def removeAllBodies(self):
-        for id,body in self.__celestialBodies.items():
-            body.eraseTrajectory()
-            self.removeShape(id)
-        self.__celestialBodies.clear()
+        self.__beforeStructureChange()
+        self.__pendingTrajectories = []
+        self.__removeBodyShapes(list(self.__shapeIds.keys()))
+        self.__engine.clear()
+
+    def removeCelestialBodies(self, handles):   # bulk removal by engine handles, handles of other bodies stay valid
+        self.__beforeStructureChange()
+        handles = [int(handle) for handle in handles]
+        self.__engine.removeMany(handles)
+        self.__removeBodyShapes(handles)
+
+    def addCelestialBodies(self, masses, radii, positions, velocities, colors):    # bulk addCelestialBody from arrays, returns handles
+        self.__beforeStructureChange()
+        handles = self.__engine.addMany(masses, radii, positions, velocities)
+        ids = self.__addBodyShapes(positions, radii, colors)
+        self.__celestialBodies.update(zip(ids, (CelestialBody(Body.fromEngine(self.__engine, handle, color), self)
+                                                for handle, color in zip(handles.tolist(), colors))))
+        self.__shapeIds.update(zip(handles.tolist(), ids))
+        if self.__recorder is not None:
+            self.__recorder.addColors(handles, colors)
+        return handles
 
     def __resetClock(self):
         self.__lastTime = time.time()
 
     def addCelestialBody(self, radius: float, mass: float, position: Vector, color: str, initSpeed: Vector):
+        self.__beforeStructureChange()
         body = Body(radius, mass, color, copy.deepcopy(position), copy.deepcopy(initSpeed))
-        id = self.__gui.addSprite(body._sprite)
+        body.attach(self.__engine)
+        id = self.__addBodyShape(body.sprite)
         self.__celestialBodies.update({id : CelestialBody(body, self)})
+        self.__shapeIds[body.handle] = id
+        if self.__recorder is not None:
+            self.__recorder.addColors([body.handle], [color])
 
     def addExistingCelestialBody(self, cbody : CelestialBody):
-        id = self.__gui.addSprite(cbody.body.sprite)
+        self.__beforeStructureChange()
+        cbody.body.attach(self.__engine)
+        id = self.__addBodyShape(cbody.body.sprite)
         self.__celestialBodies.update({id : CelestialBody(cbody.body, self)})
-
-    def __calculateForce(self, bodyId: int):
-        force = Vector()
-        for id, cbody in self.__celestialBodies.items():
-            if bodyId != id:
-                force += App.calculateForceVector(self.__celestialBodies[bodyId].body, cbody.body)
-        return force
-
+        self.__shapeIds[cbody.body.handle] = id
+        if self.__recorder is not None:
+            self.__recorder.addColors([cbody.body.handle], [cbody.body.color])
 
     def __resetTrajectoryTimer(self):
         self.__timeToUpdateTrajectory = self.__UPDATE_TRAJECTORY_DT / self.__speedFactor        # the faster simulation goes, the rarer we
@@ -243,52 +784,154 @@ class App:
         self.__secondsToUpdateFpsCounter -= deltaTime
         if self.__secondsToUpdateFpsCounter <= 0:
             self.__secondsToUpdateFpsCounter = 0.5
-            self.__gui.setStatusBarText("Fps: "+str(self.__fps))
+            text = "Fps: "+str(self.__fps)
+            if self.__monitor is not None:
+                text += "    " + self.__monitor.statusText()
+            if self.__profilerOverlay:
+                text += "    " + self.__profiler.summaryText()
+            if self.__replay is not None:
+                text += f'    Replay: {self.__replay.time:.2f} / {self.__replay.endTime:.2f}' + (" (reversed)" if self.__replay.reversed else "")
+            self.__gui.setStatusBarText(text)
             self.__fps = 0
         self.__fps += 1
 
     def update(self):
+        frameStart = time.time()
+        self.__profiler.beginFrame()
+        if self.__lastFrameEnd is not None:     # time Tk spent outside of update since the last frame
+            self.__profiler.record("idle", self.__lastFrameEnd, time.perf_counter())
         deltaTime = secondsSince(self.__lastTime)
         self.__updateFpsCounter(deltaTime)
         self.__resetClock()
-        if not self.__pause:
-            self.__timeAcc += deltaTime
+        if self.__replay is not None:
+            self.__updateReplay(deltaTime)
+        elif not self.__pause:
             self.__timeToUpdateTrajectory -= deltaTime
-            if self.__timeAcc > self.__maxCalculationDeltaTime:
-                self.__timeAcc = self.__maxCalculationDeltaTime
-            self.__timeAcc *= self.__speedFactor
 
             if (self.__timeToUpdateTrajectory <= 0):
-                self.__updateTrajectory()
+                with self.__profiler.phase("trajectories"):
+                    self.__updateTrajectory()
                 self.__resetTrajectoryTimer()
 
-            self.__updatePhysics()
+            if self.__worker is not None:
+                with self.__profiler.phase("worker sync"):
+                    self.__updateFromWorker()
+                self.__updateGui()
+            else:
+                self.__stepPhysics(deltaTime)
+        elif self.__currentView() != self.__lastView:  # camera moved while paused
             self.__updateGui()
-            self.__timeAcc = 0
-        self.__gui.guiLoop(self.update)
+        self.__profiler.endFrame()
+        self.__lastFrameEnd = time.perf_counter()
+        frameTime = secondsSince(frameStart)
+        self.__gui.guiLoop(self.update, max(1, int(1000 * (1.0 / self.__targetFps - frameTime))))
+
+    def __stepPhysics(self, deltaTime):
+        self.__timeAcc += min(deltaTime, self.__maxFrameDeltaTime) * self.__speedFactor
+        steps = 0
+        while self.__timeAcc >= self.__physicsDeltaTime and steps < self.__MAX_STEPS_PER_FRAME:
+            self.__updatePhysics()
+            self.__timeAcc -= self.__physicsDeltaTime
+            steps += 1
+        if steps == self.__MAX_STEPS_PER_FRAME:    # physics cannot keep up, drop the backlog
+            self.__timeAcc = min(self.__timeAcc, self.__physicsDeltaTime)
+        self.__updateGui(self.__timeAcc / self.__physicsDeltaTime)
 
     def __updateTrajectory(self):
+        if self.__renderer is not None:         # the renderer draws trails itself
+            return
         for cbody in self.__celestialBodies.values():
-            cbody.updateTrajectory()
+            trajectory = cbody.updateTrajectory()
+            if trajectory is not None:
+                self.__pendingTrajectories.append(trajectory + (cbody,))
 
     def __updatePhysics(self):
-        for id, cbody in self.__celestialBodies.items():
-            force = self.__calculateForce(id)
-            cbody.body.updatePhysics(force, self.__timeAcc)
-        for cbody in self.__celestialBodies.values():
-            cbody.body.updatePosition(self.__timeAcc)
-
-    def __updateGui(self):
-        for id, cbody in self.__celestialBodies.items():
-            self.__gui.setSpritePosition(id, cbody.body.boundingBoxCoords)
-
-    def addLine(self, coords_, color_) -> int:         # return shape id
-        return self.__gui.addLine(coords_, color_)
+        self.__previousPositions = self.__engine.positions.copy()
+        self.__previousHandles = self.__engine.handles.copy()
+        self.__removeBodyShapes(self.__engine.step(self.__physicsDeltaTime))
+        self.__steps += 1
+        self.__simulationTime += self.__physicsDeltaTime
+        if self.__recorder is not None:
+            self.__recorder.recordEngine(self.__steps, self.__simulationTime, self.__engine)
+        if self.__monitor is not None:
+            self.__updateMonitor()
+
+    def __updateMonitor(self):
+        with self.__profiler.phase("diagnostics"):
+            row = self.__monitor.update(self.__engine, self.__steps, self.__simulationTime)
+        if row is None:
+            return
+        if self.__recorder is not None:
+            self.__recorder.recordDiagnostics(row)
+        if self.__monitor.exceeded and self.__physicsDeltaTime / 2 >= self.__MIN_PHYSICS_DELTA_TIME:
+            self.__physicsDeltaTime /= 2
+            self.__monitor.rebase(self.__engine)
+
+    def __removeBodyShapes(self, handles):     # bodies already gone from engine, only their shapes are left
+        ids = []
+        erasedLines = set()
+        for handle in handles:
+            id = self.__shapeIds.pop(handle)
+            trajectoryID = self.__celestialBodies.pop(id).releaseTrajectory()
+            if trajectoryID is not None:
+                erasedLines.add(trajectoryID)
+            ids.append(id)
+        self.__removeShapes(ids + list(erasedLines))
+        if erasedLines:
+            self.__pendingTrajectories = [line for line in self.__pendingTrajectories if line[0] not in erasedLines]
+
+    def __renderPositions(self, alpha):        # positions between the last two physics steps
+        positions = self.__engine.positions
+        if self.__previousPositions is None or not np.array_equal(self.__previousHandles, self.__engine.handles):
+            return positions
+        return self.__previousPositions + (positions - self.__previousPositions) * alpha
+
+    def __updateGui(self, alpha=1.0):
+        with self.__profiler.phase("canvas"):
+            self.__updateCanvas(alpha)
+
+    def __updateCanvas(self, alpha):            # all canvas changes of a frame go in one batch
+        positions = self.__renderPositions(alpha)
+        self.__trackCamera(self.__engine.handles, positions, self.__engine.masses)
+        self.__lastView = self.__currentView()
+        if self.__renderer is not None:
+            self.__drawImage(positions, self.__engine.radii, self.__rasterColorsOf(self.__engine.handles, self.__colorOf))
+            return
+        ids = np.fromiter(self.__celestialBodies.keys(), dtype=np.int64, count=len(self.__celestialBodies))
+        rows = [self.__engine.rowOf(cbody.body.handle) for cbody in self.__celestialBodies.values()]
+        ids, coords = self.__spriteCoords(ids, positions[rows], self.__engine.radii[rows])
+        if self.__lastView != self.__trailView:     # trails are drawn again from world points, never moved on canvas
+            self.__trailView = self.__lastView
+            trailIds, trailCoords = self.__redrawTrails()
+        else:
+            trailIds, trailCoords = self.__flushTrajectories()
+        self.__gui.setShapesCoords(ids + trailIds, coords + trailCoords)
+
+    def addLine(self, coords_, color_) -> int:         # return shape id, coords in simulation space
+        points = np.reshape(coords_, (-1, 2))
+        lineCoords, exact = self.__trailCoords(points) if self.__trailView == self.__currentView() else (None, False)
+        if lineCoords is None:                  # off the viewport or a view the next frame redraws all trails in
+            lineCoords = self.__camera.toScreen(points).ravel()
+        id = self.__gui.addLine(lineCoords, color_)
+        if exact:
+            self.__exactTrails.add(id)
+        return id
 
     def removeShape(self, shapeId):
-        self.__gui.removeShape(shapeId)
+        if shapeId >= 0:                        # negative ids have no canvas item
+            self.__gui.removeShape(shapeId)
+            self.__parkedShapes.discard(shapeId)
+            self.__exactTrails.discard(shapeId)
+
+    def __removeShapes(self, shapeIds):         # many shapes in one canvas call
+        shapeIds = [id for id in shapeIds if id >= 0]
+        self.__gui.removeShapes(shapeIds)
+        self.__parkedShapes.difference_update(shapeIds)
+        self.__exactTrails.difference_update(shapeIds)
 
     def addUserDefinedCelestialBody(self, position_ : Vector):
+        if self.__replay is not None:           # canvas shows the recording, clicks do not edit it
+            return
         self.addCelestialBody(
             radius=self.__newBodyRadius,
             mass=self.__newBodyMass,
@@ -298,38 +941,18 @@ class App:
         )
 
     def loadFromFile(self, filename):
-        with open(filename, "r") as file:
-            data = file.read()
-        file.close()
-        self.__createBodiesFromJsonFile(data)
-
-    def __createBodiesFromJsonFile(self, data):
-        data = data.split('\n')
-        for i in data:
-            if i:
-                try:
-                    parsed = json.loads(i)
-                    self.addExistingCelestialBody(
-                        CelestialBody(Body.createFromDict(parsed), app))
-                except:
-                    print('Cannot read from file')
-
-
-    def __createJsonData(self):
-        output = ""
-        for i in self.__celestialBodies.values():
-            output += json.dumps(i.toDict()) + "\n"
-        return output
+        self.addCelestialBodies(*Scenario.readArrays(filename))
 
     def saveCurrentStateToFile(self, filename):
-        data = self.__createJsonData()
-        with open(filename, 'w') as file:
-            file.write(data)
+        self.__syncFromWorker()
+        Scenario.writeBodies(filename, [cbody.body for cbody in self.__celestialBodies.values()] + list(self.__hiddenBodies.values()))
 
 
 
 
 if __name__ == "__main__":
+    import tkinter as tk                    # only the interactive app needs Tk, the simulation core imports without it
+    from Gui import Gui
     root = tk.Tk()
     root.wm_geometry("1500x700+0+0")
     root.resizable(0,0)
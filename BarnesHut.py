@@ -0,0 +1,165 @@
+import numpy as np
+from utility import *
+from Engine import pairPotentials
+
+
+def _spreadBits(values):                    # inserts a zero bit between each of the lower 32 bits
+    values = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+class QuadTree:                             # built level by level from morton-sorted bodies, nodes stored as arrays
+
+    def __init__(self, positions, masses, radii, leafSize=8, maxDepth=16):
+        lower = positions.min(axis=0)
+        self.rootSize = max(float((positions.max(axis=0) - lower).max()), 1e-9) * (1 + 1e-9)
+        cells = np.floor((positions - lower) / self.rootSize * (1 << maxDepth)).astype(np.int64)
+        keys = _spreadBits(cells[:, 0]) | (_spreadBits(cells[:, 1]) << np.uint64(1))
+        self.order = np.argsort(keys, kind='stable')
+        self.rankOf = np.empty(len(keys), dtype=np.int64)              # position of every body in sorted order
+        self.rankOf[self.order] = np.arange(len(keys))
+        keys = keys[self.order]
+        sortedMasses = masses[self.order]
+        massSum = np.concatenate(([0.0], np.cumsum(sortedMasses)))
+        momentSum = np.vstack(([0.0, 0.0], np.cumsum(positions[self.order] * sortedMasses[:, np.newaxis], axis=0)))
+        radiusSum = np.concatenate(([0.0], np.cumsum(radii[self.order] * sortedMasses)))
+
+        starts, ends, levels, leaves, childFirst, childCount = [], [], [], [], [], []
+        parentStarts, parentEnds = np.array([0]), np.array([len(keys)])
+        parentInternal = np.array([True])
+        nodesBefore = 0
+        for level in range(maxDepth + 1):
+            prefixes = keys >> np.uint64(2 * (maxDepth - level))
+            groupStarts = np.flatnonzero(np.concatenate(([True], prefixes[1:] != prefixes[:-1])))
+            groupEnds = np.append(groupStarts[1:], len(keys))
+            parents = np.maximum(np.searchsorted(parentStarts, groupStarts, side='right') - 1, 0)
+            kept = (groupStarts >= parentStarts[parents]) & parentInternal[parents] & (groupStarts < parentEnds[parents])   # skip groups below leaves
+            groupStarts, groupEnds, parents = groupStarts[kept], groupEnds[kept], parents[kept]
+            if len(groupStarts) == 0:
+                break
+            if level > 0:                                              # children of one parent are contiguous
+                firstChild = np.searchsorted(parents, np.arange(len(parentStarts)))
+                childFirst[-1] = np.where(parentInternal, nodesBefore + len(parentStarts) + firstChild, -1)
+                childCount[-1] = np.bincount(parents, minlength=len(parentStarts))
+                nodesBefore += len(parentStarts)
+            isLeaf = (groupEnds - groupStarts <= leafSize) | (level == maxDepth)
+            starts.append(groupStarts)
+            ends.append(groupEnds)
+            levels.append(np.full(len(groupStarts), level))
+            leaves.append(isLeaf)
+            childFirst.append(np.full(len(groupStarts), -1))
+            childCount.append(np.zeros(len(groupStarts), dtype=np.int64))
+            parentStarts, parentEnds, parentInternal = groupStarts, groupEnds, ~isLeaf
+
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.isLeaf = np.concatenate(leaves)
+        self.childFirst = np.concatenate(childFirst)
+        self.childCount = np.concatenate(childCount)
+        self.size = self.rootSize / 2.0**np.concatenate(levels)
+        self.mass = massSum[self.end] - massSum[self.start]
+        self.centerOfMass = (momentSum[self.end] - momentSum[self.start]) / self.mass[:, np.newaxis]
+        self.radius = (radiusSum[self.end] - radiusSum[self.start]) / self.mass     # mass weighted mean radius
+
+
+# Barnes-Hut approximation, O(N log N). A node is used as a single pseudo body when
+# size / distance < theta, smaller theta means better accuracy and more work. With withPotential
+# full passes also sum the potential energy over the same pseudo bodies, as approximate as the forces.
+class BarnesHutSolver:
+
+    def __init__(self, theta=0.5, leafSize=8, withPotential=False):
+        if theta < 0:
+            raise ValueError("Opening angle theta cannot be negative")
+        if leafSize < 1:
+            raise ValueError("Leaf size cannot be lower than 1")
+        self.__theta = theta
+        self.__leafSize = leafSize
+        self.withPotential = withPotential
+        self.__lastPotentialEnergy = None
+
+    @property
+    def lastPotentialEnergy(self):          # of the last full pass with withPotential, otherwise None
+        return self.__lastPotentialEnergy
+
+    @property
+    def theta(self):
+        return self.__theta
+
+    @theta.setter
+    def theta(self, value):
+        if value < 0:
+            raise ValueError("Opening angle theta cannot be negative")
+        self.__theta = value
+
+    @staticmethod
+    def __pairAccelerations(gValue, targetPositions, targetRadii, sourcePositions, sourceMasses, sourceRadii):
+        deltaS = sourcePositions - targetPositions
+        distance = np.sqrt(np.einsum('ij,ij->i', deltaS, deltaS))
+        np.maximum(distance, targetRadii + sourceRadii, out=distance)
+        return deltaS * (gValue * sourceMasses / distance**2)[:, np.newaxis]
+
+    @staticmethod
+    def __pairPotential(targetPositions, targetMasses, targetRadii, sourcePositions, sourceMasses, sourceRadii):
+        deltaS = sourcePositions - targetPositions
+        distance = np.sqrt(np.einsum('ij,ij->i', deltaS, deltaS))
+        return float(np.sum(targetMasses * sourceMasses * pairPotentials(distance, targetRadii + sourceRadii)))
+
+    def accelerations(self, positions, masses, radii, targets=None):     # targets: rows to compute, all by default
+        count = len(masses)
+        result = np.zeros((count, 2))
+        withPotential = targets is None and self.withPotential
+        self.__lastPotentialEnergy = 0.0 if withPotential else None
+        bodies = np.arange(count) if targets is None else np.asarray(targets)
+        if count < 2:
+            return result[bodies]
+        potential = 0.0                     # every pair is seen from both ends
+        tree = QuadTree(positions, masses, radii, self.__leafSize)
+        gValue = Const.getGValue()
+        requested = bodies
+        nodes = np.zeros(len(bodies), dtype=np.int64)
+        while len(bodies):
+            deltaS = tree.centerOfMass[nodes] - positions[bodies]
+            distance = np.sqrt(np.einsum('ij,ij->i', deltaS, deltaS))
+            rank = tree.rankOf[bodies]
+            contains = (tree.start[nodes] <= rank) & (rank < tree.end[nodes])
+            accepted = ~contains & (tree.size[nodes] < self.__theta * distance)
+
+            if accepted.any():
+                acc = self.__pairAccelerations(gValue, positions[bodies[accepted]], radii[bodies[accepted]],
+                    tree.centerOfMass[nodes[accepted]], tree.mass[nodes[accepted]], tree.radius[nodes[accepted]])
+                result[:, 0] += np.bincount(bodies[accepted], acc[:, 0], count)
+                result[:, 1] += np.bincount(bodies[accepted], acc[:, 1], count)
+                if withPotential:
+                    potential += self.__pairPotential(positions[bodies[accepted]], masses[bodies[accepted]],
+                        radii[bodies[accepted]], tree.centerOfMass[nodes[accepted]], tree.mass[nodes[accepted]],
+                        tree.radius[nodes[accepted]])
+
+            opened = ~accepted
+            leaf = opened & tree.isLeaf[nodes]
+            if leaf.any():                                             # sum leaf bodies directly
+                leafBodies, leafNodes = bodies[leaf], nodes[leaf]
+                sizes = tree.end[leafNodes] - tree.start[leafNodes]
+                offsets = np.cumsum(sizes) - sizes
+                targets = np.repeat(leafBodies, sizes)
+                sources = tree.order[np.arange(sizes.sum()) - np.repeat(offsets, sizes) + np.repeat(tree.start[leafNodes], sizes)]
+                other = targets != sources
+                targets, sources = targets[other], sources[other]
+                acc = self.__pairAccelerations(gValue, positions[targets], radii[targets],
+                    positions[sources], masses[sources], radii[sources])
+                result[:, 0] += np.bincount(targets, acc[:, 0], count)
+                result[:, 1] += np.bincount(targets, acc[:, 1], count)
+                if withPotential:
+                    potential += self.__pairPotential(positions[targets], masses[targets], radii[targets],
+                        positions[sources], masses[sources], radii[sources])
+
+            internal = opened & ~tree.isLeaf[nodes]
+            counts = tree.childCount[nodes[internal]]
+            offsets = np.cumsum(counts) - counts
+            bodies = np.repeat(bodies[internal], counts)
+            nodes = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(tree.childFirst[nodes[internal]], counts)
+        if withPotential:
+            self.__lastPotentialEnergy = 0.5 * gValue * potential
+        return result[requested]
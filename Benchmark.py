@@ -0,0 +1,271 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from utility import *
+from Engine import Engine
+from Headless import HeadlessSimulation, createSolver
+from Integrators import INTEGRATORS, createIntegrator
+from Trajectory import TrajectoryBuffer
+from Diagnostics import momentum
+
+# Every result is one dict with "benchmark", "case", "bodies" and "seconds" (median time of one
+# call) plus benchmark specific fields. compareResults matches results of two runs by these keys.
+
+SCENARIOS = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenario*.JSON")))
+SOLVERS = ("reference", "direct", "compiled", "barnes-hut")
+TOLERANCES = {"direct": 1e-10, "compiled": 1e-10, "barnes-hut": 5e-2}     # max relative error to the reference solver
+MAX_PAIRS = {"reference": 10**5, "direct": 10**9, "compiled": 10**10}     # limit of count^2 per solver, none for the rest
+# Cold import of the simulation without the GUI, sweep workers pay it once per process.
+STARTUP_CASES = {"core": ("utility", "Sprite", "Body", "Engine", "Integrators", "Collisions", "Headless"), "app": ("App",)}
+STARTUP_BUDGET = 0.5                        # seconds
+STARTUP_FORBIDDEN = ("tkinter", "pyparsing", "numba")      # modules only the GUI or the compiled solver may load
+
+
+def syntheticSystem(count, seed=0):         # (masses, radii, positions, velocities), bodies spread evenly over a disc
+    rng = np.random.default_rng(seed)
+    discRadius = 20.0 * np.sqrt(count)
+    angles = rng.uniform(0.0, 2 * np.pi, count)
+    distances = discRadius * np.sqrt(rng.uniform(0.0, 1.0, count))
+    positions = np.column_stack((distances * np.cos(angles), distances * np.sin(angles)))
+    return rng.uniform(10.0, 100.0, count), rng.uniform(1.0, 3.0, count), positions, rng.uniform(-1.0, 1.0, (count, 2))
+
+
+def syntheticEngine(count, solver="direct", integrator="leapfrog", theta=0.5, seed=0):
+    engine = Engine(createSolver(solver, theta), createIntegrator(integrator), capacity=max(count, 1))
+    masses, radii, positions, velocities = syntheticSystem(count, seed)
+    engine.replaceState(np.arange(count), masses, radii, positions, velocities)
+    return engine
+
+
+def timeCall(function, minTime=0.2, maxCalls=1000):     # median seconds of one call, called at least once
+    times = []
+    started = time.perf_counter()
+    while not times or (time.perf_counter() - started < minTime and len(times) < maxCalls):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), len(times)
+
+
+def benchmarkForces(sizes, solvers=SOLVERS, maxPairs=MAX_PAIRS, theta=0.5, minTime=0.2):
+    results = []
+    for solver in solvers:
+        limit = maxPairs.get(solver)        # O(N^2) solvers would take hours
+        for count in sizes:
+            if limit is not None and count * count > limit:
+                continue
+            engine = syntheticEngine(count, solver, theta=theta)
+            seconds, calls = timeCall(engine.computeAccelerations, minTime)
+            results.append({"benchmark": "forces", "case": solver, "bodies": count, "seconds": seconds,
+                            "calls": calls, "bodiesPerSecond": count / seconds})
+    return results
+
+
+def benchmarkAgreement(sizes=(10, 100, 500), solvers=SOLVERS[1:], theta=0.5):     # errors against the per-pair reference
+    results = []
+    for count in sizes:
+        engine = syntheticEngine(count, "reference")
+        reference = engine.computeAccelerations().copy()
+        scale = np.sqrt(np.mean(np.sum(reference**2, axis=1)))
+        for solver in solvers:
+            engine.forceSolver = createSolver(solver, theta)
+            start = time.perf_counter()
+            accelerations = engine.computeAccelerations()
+            seconds = time.perf_counter() - start
+            error = float(np.max(np.sqrt(np.sum((accelerations - reference)**2, axis=1)))) / scale
+            results.append({"benchmark": "agreement", "case": solver, "bodies": count, "seconds": seconds,
+                            "maxRelativeError": error, "tolerance": TOLERANCES[solver], "passed": bool(error <= TOLERANCES[solver])})
+    return results
+
+
+def benchmarkStartup(cases=STARTUP_CASES, repeats=5, budget=STARTUP_BUDGET):     # every import in a fresh interpreter
+    script = ("import sys, time, json\nstart = time.perf_counter()\n{imports}\n"
+              "print(json.dumps([time.perf_counter() - start, [name for name in {forbidden!r} if name in sys.modules]]))")
+    results = []
+    for case, modules in cases.items():
+        code = script.format(imports="\n".join(f'import {module}' for module in modules), forbidden=STARTUP_FORBIDDEN)
+        runs = [json.loads(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                          cwd=os.path.dirname(os.path.abspath(__file__))).stdout)
+                for _ in range(repeats)]
+        seconds = float(np.median([seconds for seconds, _ in runs]))
+        loaded = sorted(set(name for _, names in runs for name in names))
+        results.append({"benchmark": "startup", "case": case, "bodies": 0, "seconds": seconds, "modules": list(modules),
+                        "budget": budget, "forbiddenLoaded": loaded, "passed": bool(seconds <= budget and not loaded)})
+    return results
+
+
+def benchmarkSteps(sizes, integrators=tuple(INTEGRATORS), maxDirect=4000, deltaTime=0.025, minTime=0.2):
+    results = []
+    for integrator in integrators:
+        for count in sizes:
+            solver = "direct" if count <= maxDirect else "barnes-hut"
+            engine = syntheticEngine(count, solver, integrator)
+            seconds, calls = timeCall(lambda: engine.step(deltaTime), minTime)
+            results.append({"benchmark": "step", "case": integrator, "bodies": count, "seconds": seconds,
+                            "calls": calls, "solver": solver, "stepsPerSecond": 1.0 / seconds})
+    return results
+
+
+def benchmarkTrajectories(sizes, points=750, minTime=0.2):     # App.__updateTrajectory: append to every buffer, one new point per polyline
+    try:
+        from Gui import Gui                 # only the script builder, no window is opened
+    except Exception as err:                # no tkinter or no gui dependencies
+        return [{"benchmark": "trajectories", "case": "skipped", "bodies": 0, "seconds": 0.0, "reason": str(err)}]
+    results = []
+    for count in sizes:
+        engine = syntheticEngine(count)
+        buffers = [TrajectoryBuffer(points) for _ in range(count)]
+        for _ in range(points):             # full buffers, steady state of a running app
+            for buffer, position in zip(buffers, engine.positions):
+                buffer.append(position)
+        ids = list(range(count))
+
+        def update():
+            for buffer, position in zip(buffers, engine.positions):
+                buffer.append(position)
+            Gui.extendLinesScript(".canvas", ids, engine.positions, [1] * count)
+        seconds, calls = timeCall(update, minTime)
+        results.append({"benchmark": "trajectories", "case": f'{points} points', "bodies": count, "seconds": seconds,
+                        "calls": calls, "updatesPerSecond": 1.0 / seconds})
+    return results
+
+
+def benchmarkCanvas(sizes, minTime=0.2):    # Gui.setShapesCoords and redraw, needs a display
+    try:
+        import tkinter as tk
+        from Gui import Gui
+        root = tk.Tk()
+    except Exception as err:                # no display, no tkinter or no gui dependencies
+        return [{"benchmark": "canvas", "case": "skipped", "bodies": 0, "seconds": 0.0, "reason": str(err)}]
+    results = []
+    try:
+        canvas = tk.Canvas(root, width=1500, height=700)
+        canvas.pack()
+        for count in sizes:
+            canvas.delete("all")
+            engine = syntheticEngine(count)
+            ids = [canvas.create_oval(0, 0, 1, 1, fill="white") for _ in range(count)]
+            halfSizes = (engine.radii / 2)[:, np.newaxis]
+
+            def update():
+                engine.positions[:] += 0.5
+                boxes = np.hstack((engine.positions - halfSizes, engine.positions + halfSizes))
+                canvas.tk.eval(Gui.coordsScript(str(canvas), ids, boxes))
+                root.update_idletasks()
+            seconds, calls = timeCall(update, minTime)
+            results.append({"benchmark": "canvas", "case": "setShapesCoords", "bodies": count, "seconds": seconds,
+                            "calls": calls, "framesPerSecond": 1.0 / seconds})
+    finally:
+        root.destroy()
+    return results
+
+
+def benchmarkAccuracy(scenarios, syntheticSizes, integrators=tuple(INTEGRATORS), steps=2000, deltaTime=0.025):
+    cases = [(os.path.basename(scenario), scenario) for scenario in scenarios]
+    cases += [(f'synthetic {count}', count) for count in syntheticSizes]
+    results = []
+    for integrator in integrators:
+        for name, source in cases:
+            if isinstance(source, str):
+                simulation = HeadlessSimulation(integrator=createIntegrator(integrator))
+                simulation.loadFromFile(source)
+                engine = simulation.engine
+                step = simulation.step
+            else:
+                engine = syntheticEngine(source, integrator=integrator)
+                step = engine.step
+            initialEnergy = engine.totalEnergy()
+            initialMomentum = momentum(engine)
+            momentumScale = float(np.sum(engine.masses * np.sqrt(np.sum(engine.velocities**2, axis=1)))) or 1.0
+            start = time.perf_counter()
+            for _ in range(steps):
+                step(deltaTime)
+            seconds = (time.perf_counter() - start) / steps
+            energyDrift = abs(engine.totalEnergy() - initialEnergy) / (abs(initialEnergy) or 1.0)
+            momentumDrift = float(np.linalg.norm(momentum(engine) - initialMomentum)) / momentumScale
+            results.append({"benchmark": "accuracy", "case": f'{integrator} {name}', "bodies": engine.count,
+                            "seconds": seconds, "steps": steps, "energyDrift": energyDrift, "momentumDrift": momentumDrift})
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def resultKey(result):
+    return result["benchmark"], result["case"], result["bodies"]
+
+
+def compareResults(old, new):               # (key, new seconds / old seconds, accuracy changes) of results in both runs
+    oldResults = {resultKey(result): result for result in old["results"]}
+    comparison = []
+    for result in new["results"]:
+        previous = oldResults.get(resultKey(result))
+        if previous is None or not previous["seconds"]:
+            continue
+        drifts = {name: (previous[name], result[name]) for name in ("energyDrift", "momentumDrift") if name in result}
+        comparison.append((resultKey(result), result["seconds"] / previous["seconds"], drifts))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure speed and accuracy of physics and render paths")
+    parser.add_argument("output", help="json file for the results")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--accuracy-sizes", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--accuracy-steps", type=int, default=1000)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds every measurement is repeated for")
+    parser.add_argument("--skip", nargs="+", default=[],
+                        choices=("startup", "agreement", "forces", "step", "trajectories", "canvas", "accuracy"))
+    parser.add_argument("--compare", default=None, help="results of an earlier run, time ratios are printed")
+    args = parser.parse_args(argv)
+
+    results = []
+    if "startup" not in args.skip:
+        results += benchmarkStartup()
+    if "agreement" not in args.skip:
+        results += benchmarkAgreement()
+    if "forces" not in args.skip:
+        results += benchmarkForces(args.sizes, minTime=args.min_time)
+    if "step" not in args.skip:
+        results += benchmarkSteps(args.sizes, minTime=args.min_time)
+    if "trajectories" not in args.skip:
+        results += benchmarkTrajectories(args.sizes, minTime=args.min_time)
+    if "canvas" not in args.skip:
+        results += benchmarkCanvas(args.sizes, minTime=args.min_time)
+    if "accuracy" not in args.skip:
+        results += benchmarkAccuracy(SCENARIOS, args.accuracy_sizes, steps=args.accuracy_steps)
+    report = {"environment": environment(), "results": results}
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=1)
+
+    for result in results:
+        print(f'{result["benchmark"]:13} {result["case"]:40} {result["bodies"]:7} {1000 * result["seconds"]:10.3f} ms')
+    if args.compare:
+        with open(args.compare) as file:
+            for key, ratio, drifts in compareResults(json.load(file), report):
+                changes = "  ".join(f'{name} {old:.2e} -> {new:.2e}' for name, (old, new) in drifts.items())
+                print(f'{" ".join(map(str, key)):60} x{ratio:6.2f}  {changes}')
+    failed = [result for result in results if result.get("passed") is False]
+    for result in failed:
+        if result["benchmark"] == "startup":
+            print(f'importing {result["case"]} took {result["seconds"]:.3f} s of {result["budget"]} s and loaded {result["forbiddenLoaded"]}')
+        else:
+            print(f'{result["case"]} differs from the reference solver by {result["maxRelativeError"]:.2e} with {result["bodies"]} bodies')
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -7,9 +7,36 @@ class Body:
         self._velocity = initialSpeed
         self._acceleration = Vector()
         self._sprite = Sprite(r, color, position)
+        self._engine = None                 # engine holding the state once attached
+        self._handle = None
+
+    def attach(self, engine, handle=None):  # moves state into engine arrays, body becomes a view of its row
+        if self._engine is not None:
+            return
+        self._handle = engine.add(self._mass, self.radius, self.position, self._velocity, handle)
+        self._engine = engine
+        self._velocity = engine.vectorView(self._handle, 'velocities')
+        self._sprite.position = engine.vectorView(self._handle, 'positions')
+
+    @classmethod
+    def fromEngine(cls, engine, handle, color):    # view of a row added with Engine.addMany, nothing is copied
+        body = cls.__new__(cls)
+        body._mass = None
+        body._velocity = engine.vectorView(handle, 'velocities')
+        body._acceleration = Vector()
+        body._sprite = Sprite(float(engine.radii[engine.rowOf(handle)]), color, engine.vectorView(handle, 'positions'))
+        body._engine = engine
+        body._handle = handle
+        return body
+
+    @property
+    def handle(self):
+        return self._handle
 
     @property
     def mass(self) -> float:
+        if self._engine is not None:
+            return float(self._engine.masses[self._engine.rowOf(self._handle)])
         return self._mass
 
     @mass.setter
@@ -17,9 +44,14 @@ class Body:
         if newMass <= 0:
             raise ValueError("Mass has to be positive value")
         self._mass = newMass
+        if self._engine is not None:
+            self._engine.masses[self._engine.rowOf(self._handle)] = newMass
+            self._engine.invalidateAccelerations()
 
     @property
     def radius(self) -> float:
+        if self._engine is not None:
+            return float(self._engine.radii[self._engine.rowOf(self._handle)])
         return self.sprite.radius
 
     @radius.setter
@@ -27,6 +59,9 @@ class Body:
         if newRadius <= 0:
             raise ValueError("Radius has to be positive value")
         self.sprite.radius = newRadius
+        if self._engine is not None:
+            self._engine.radii[self._engine.rowOf(self._handle)] = newRadius
+            self._engine.invalidateAccelerations()
 
     @property
     def velocity(self) -> float:
@@ -49,7 +84,7 @@ class Body:
         return self._sprite
 
     def __updateAcceleration(self, force : Vector):
-        deltaAcc = force / self._mass
+        deltaAcc = force / self.mass
         self._acceleration = deltaAcc
 
     def __updateVelocity(self, deltaTime: float):
@@ -64,8 +99,8 @@ class Body:
 
     def toDict(self):
         return {
-            "mass" : self._mass,
-            "radius" : self._sprite.radius,
+            "mass" : self.mass,
+            "radius" : self.radius,
             "color" : self._sprite.color,
             "posX" : self._sprite.position.x,
             "posY" : self._sprite.position.y,
@@ -76,9 +111,9 @@ class Body:
     @staticmethod
     def createFromDict(data):
         return Body(
-            int(data["radius"]),
-            int(data["mass"]),
+            float(data["radius"]),
+            float(data["mass"]),
             data["color"],
-            Vector(int(data["posX"]), int(data["posY"])),
-            Vector(int(data["velX"]), int(data["velY"]))
+            Vector(float(data["posX"]), float(data["posY"])),
+            Vector(float(data["velX"]), float(data["velY"]))
         )
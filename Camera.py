@@ -0,0 +1,79 @@
+import numpy as np
+
+# Maps simulation coordinates to canvas pixels: screen = (world - origin) * zoom, origin being the
+# world point in the top left corner. The default camera is the identity, the mapping the canvas
+# always had. A followed target (one body or the center of mass) is kept in the middle of the
+# viewport, App passes its position every frame through track.
+
+FOLLOW_NONE = "none"
+FOLLOW_BODY = "body"
+FOLLOW_CENTER_OF_MASS = "center of mass"
+
+
+class Camera:
+
+    def __init__(self, minZoom=1e-3, maxZoom=1e3):
+        if not 0 < minZoom <= 1 <= maxZoom:
+            raise ValueError("Zoom limits have to satisfy 0 < minZoom <= 1 <= maxZoom")
+        self.__minZoom = minZoom
+        self.__maxZoom = maxZoom
+        self.__origin = np.zeros(2)
+        self.__zoom = 1.0
+        self.__following = FOLLOW_NONE
+        self.__followedHandle = None
+
+    @property
+    def origin(self):                       # world point in the top left corner of the canvas
+        return tuple(self.__origin)
+
+    @property
+    def zoom(self) -> float:                # pixels per world unit
+        return self.__zoom
+
+    @property
+    def following(self) -> str:
+        return self.__following
+
+    @property
+    def followedHandle(self):               # engine handle of the followed body, None unless following a body
+        return self.__followedHandle
+
+    @property
+    def view(self):                         # (origin x, origin y, zoom), changes whenever the mapping changes
+        return self.__origin[0], self.__origin[1], self.__zoom
+
+    def toScreen(self, points):             # (n, 2) world -> (n, 2) canvas pixels
+        return (np.asarray(points, dtype=float) - self.__origin) * self.__zoom
+
+    def toWorld(self, x, y):                # canvas pixel -> world point as (x, y)
+        return self.__origin[0] + x / self.__zoom, self.__origin[1] + y / self.__zoom
+
+    def reset(self):
+        self.__origin = np.zeros(2)
+        self.__zoom = 1.0
+        self.stopFollowing()
+
+    def pan(self, dx, dy):                  # moves the picture by (dx, dy) pixels, stops following
+        self.__origin = self.__origin - np.array((dx, dy), dtype=float) / self.__zoom
+        self.stopFollowing()
+
+    def zoomAt(self, factor, x, y):         # the world point under pixel (x, y) stays there
+        zoom = min(max(self.__zoom * factor, self.__minZoom), self.__maxZoom)
+        anchor = np.array(self.toWorld(x, y))
+        self.__origin = anchor - np.array((x, y), dtype=float) / zoom
+        self.__zoom = zoom
+
+    def followBody(self, handle):
+        self.__following = FOLLOW_BODY
+        self.__followedHandle = int(handle)
+
+    def followCenterOfMass(self):
+        self.__following = FOLLOW_CENTER_OF_MASS
+        self.__followedHandle = None
+
+    def stopFollowing(self):
+        self.__following = FOLLOW_NONE
+        self.__followedHandle = None
+
+    def track(self, target, width, height):    # centers the viewport of the given size on target, a world point
+        self.__origin = np.asarray(target, dtype=float) - np.array((width, height), dtype=float) / (2 * self.__zoom)
@@ -0,0 +1,53 @@
+import collections
+import json
+import os
+import random
+import numpy as np
+from utility import Const
+
+# A checkpoint is a numpy .npz archive: engine arrays (rows in engine order), body colors and
+# a json "metadata" entry with scalars and the state of integrator, collision handler and globals.
+# Written to a temporary file first and renamed, so a crash never leaves a torn checkpoint.
+
+VERSION = 1
+_ARRAYS = ("handles", "masses", "radii", "positions", "velocities", "accelerations")
+
+CheckpointData = collections.namedtuple("CheckpointData", "engineState colors metadata")
+
+
+def captureGlobalState() -> dict:           # process wide state the simulation depends on
+    version, state, gauss = random.getstate()
+    return {"gValueFactor": Const.getGValueFactor(), "random": [version, list(state), gauss]}
+
+
+def restoreGlobalState(state):
+    Const.setGValueFactor(state["gValueFactor"])
+    version, randomState, gauss = state["random"]
+    random.setstate((version, tuple(randomState), gauss))
+
+
+def writeCheckpoint(filename, engine, colors, metadata):   # colors in engine row order
+    state = engine.getState()
+    metadata = dict(metadata, version=VERSION, accelerationsValid=state["accelerationsValid"],
+                    nextHandle=state["nextHandle"], globals=captureGlobalState())
+    arrays = {name: state[name] for name in _ARRAYS}
+    arrays["colors"] = np.array(colors, dtype=str)
+    arrays["metadata"] = np.frombuffer(json.dumps(metadata).encode("utf-8"), dtype=np.uint8)
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, filename)
+
+
+def readCheckpoint(filename) -> CheckpointData:
+    with np.load(filename, allow_pickle=False) as archive:
+        metadata = json.loads(bytes(archive["metadata"]).decode("utf-8"))
+        if metadata.get("version") != VERSION:
+            raise ValueError(f'Unsupported checkpoint version {metadata.get("version")}')
+        engineState = {name: archive[name] for name in _ARRAYS}
+        colors = [str(color) for color in archive["colors"]]
+    engineState["accelerationsValid"] = metadata["accelerationsValid"]
+    engineState["nextHandle"] = metadata["nextHandle"]
+    return CheckpointData(engineState, colors, metadata)
@@ -0,0 +1,169 @@
+import numpy as np
+
+# Bodies collide when distance <= radius1 + radius2, same test as Sprite.collision.
+
+_HALF_NEIGHBOURHOOD = ((1, -1), (1, 0), (1, 1), (0, 1))   # with the own cell every pair of cells is visited once
+
+
+def _cellKeys(cells):
+    return (cells[:, 0] << np.int64(32)) + cells[:, 1]
+
+
+def _gridPairs(positions, cellSize):        # pairs of bodies in the same or neighbouring cells
+    count = len(positions)
+    cells = np.floor(positions / cellSize).astype(np.int64)
+    keys = _cellKeys(cells)
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+    first, second = [], []
+    for offset in ((0, 0),) + _HALF_NEIGHBOURHOOD:
+        neighbourKeys = _cellKeys(cells + np.array(offset, dtype=np.int64))
+        low = np.searchsorted(sortedKeys, neighbourKeys, side='left')
+        counts = np.searchsorted(sortedKeys, neighbourKeys, side='right') - low
+        starts = np.cumsum(counts) - counts
+        bodies = np.repeat(np.arange(count), counts)
+        others = order[np.arange(counts.sum()) - np.repeat(starts, counts) + np.repeat(low, counts)]
+        if offset == (0, 0):
+            keep = bodies < others
+            bodies, others = bodies[keep], others[keep]
+        first.append(bodies)
+        second.append(others)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def _crossPairs(positions, radii, large, small, tileElements=1 << 20):   # large x small pairs in contact, tiled
+    first, second = [], []
+    rows = max(tileElements // max(len(small), 1), 1)
+    for start in range(0, len(large), rows):
+        tile = large[start:start + rows]
+        deltaS = positions[small][np.newaxis, :, :] - positions[tile][:, np.newaxis, :]
+        reach = radii[tile][:, np.newaxis] + radii[small][np.newaxis, :]
+        bodies, others = np.nonzero(np.einsum('ijk,ijk->ij', deltaS, deltaS) <= reach * reach)
+        first.append(tile[bodies])
+        second.append(small[others])
+    return np.concatenate(first), np.concatenate(second)
+
+
+# Uniform grid broad phase, O(N) for evenly spread bodies. Cells are sized from the median radius
+# so one huge body does not put everything into a single cell; bodies too large for that grid are
+# paired among themselves on a coarser grid (recursively) and against the rest by direct tests.
+def candidatePairs(positions, radii):
+    count = len(radii)
+    if count < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    cellSize = max(4.0 * float(np.median(radii)), 1e-9)     # contacts between grid bodies reach the next cell at most
+    oversized = radii > cellSize / 2
+    if not oversized.any():
+        return _gridPairs(positions, cellSize)
+    small, large = np.flatnonzero(~oversized), np.flatnonzero(oversized)
+    smallFirst, smallSecond = _gridPairs(positions[small], cellSize)
+    largeFirst, largeSecond = candidatePairs(positions[large], radii[large])
+    crossFirst, crossSecond = _crossPairs(positions, radii, large, small)
+    return (np.concatenate((small[smallFirst], large[largeFirst], crossFirst)),
+            np.concatenate((small[smallSecond], large[largeSecond], crossSecond)))
+
+
+def collidingPairs(positions, radii):
+    first, second = candidatePairs(positions, radii)
+    deltaS = positions[second] - positions[first]
+    touching = np.einsum('ij,ij->i', deltaS, deltaS) <= (radii[first] + radii[second])**2
+    return first[touching], second[touching]
+
+
+def groupLabels(count, first, second):      # connected components, every body labelled with the lowest row in its group
+    labels = np.arange(count)
+    while True:
+        pairLabels = np.minimum(labels[first], labels[second])
+        newLabels = labels.copy()
+        np.minimum.at(newLabels, first, pairLabels)
+        np.minimum.at(newLabels, second, pairLabels)
+        newLabels = newLabels[newLabels]
+        if np.array_equal(newLabels, labels):
+            return labels
+        labels = newLabels
+
+
+# Resolves collisions after every engine step. "merge" joins touching bodies into the heaviest
+# one conserving mass and momentum (radius conserves area), "bounce" applies an impulse along
+# the contact normal to approaching pairs.
+class CollisionHandler:
+    MODES = ("merge", "bounce")
+
+    def __init__(self, mode="merge", restitution=1.0):
+        if mode not in CollisionHandler.MODES:
+            raise ValueError(f'Unknown collision mode {mode}')
+        self.__mode = mode
+        self.__restitution = restitution
+        self.__collisions = 0
+
+    @property
+    def mode(self):
+        return self.__mode
+
+    @property
+    def restitution(self):
+        return self.__restitution
+
+    @property
+    def collisions(self) -> int:            # colliding pairs found so far
+        return self.__collisions
+
+    def getState(self) -> dict:
+        return {"mode": self.__mode, "restitution": self.__restitution, "collisions": self.__collisions}
+
+    def setState(self, state):
+        if state["mode"] not in CollisionHandler.MODES:
+            raise ValueError(f'Unknown collision mode {state["mode"]}')
+        self.__mode = state["mode"]
+        self.__restitution = state["restitution"]
+        self.__collisions = state["collisions"]
+
+    def resolve(self, engine):              # returns handles of removed bodies
+        first, second = collidingPairs(engine.positions, engine.radii)
+        self.__collisions += len(first)
+        if len(first) == 0:
+            return []
+        if self.__mode == "bounce":
+            self.__bounce(engine, first, second)
+            return []
+        return self.__merge(engine, first, second)
+
+    def __bounce(self, engine, first, second):
+        masses = engine.masses
+        normals = engine.positions[second] - engine.positions[first]
+        distance = np.sqrt(np.einsum('ij,ij->i', normals, normals))
+        valid = distance > 0
+        first, second = first[valid], second[valid]
+        normals = normals[valid] / distance[valid, np.newaxis]
+        approaching = np.einsum('ij,ij->i', engine.velocities[second] - engine.velocities[first], normals)
+        hit = approaching < 0
+        first, second, normals = first[hit], second[hit], normals[hit]
+        impulses = ((1.0 + self.__restitution) * approaching[hit] / (1.0 / masses[first] + 1.0 / masses[second]))[:, np.newaxis] * normals
+        np.add.at(engine.velocities, first, impulses / masses[first, np.newaxis])
+        np.add.at(engine.velocities, second, -impulses / masses[second, np.newaxis])
+
+    def __merge(self, engine, first, second):
+        labels = groupLabels(engine.count, first, second)
+        masses = engine.masses
+        totalMass = np.bincount(labels, masses, engine.count)
+        momentum = np.column_stack([np.bincount(labels, masses * engine.velocities[:, axis], engine.count) for axis in (0, 1)])
+        moment = np.column_stack([np.bincount(labels, masses * engine.positions[:, axis], engine.count) for axis in (0, 1)])
+        area = np.bincount(labels, engine.radii**2, engine.count)
+
+        order = np.lexsort((-masses, labels))                  # heaviest body of every group first
+        isFirst = np.concatenate(([True], labels[order][1:] != labels[order][:-1]))
+        survivors = order[isFirst]
+        survivors = survivors[np.bincount(labels, minlength=engine.count)[labels[survivors]] > 1]
+        groups = labels[survivors]
+        engine.velocities[survivors] = momentum[groups] / totalMass[groups, np.newaxis]
+        engine.positions[survivors] = moment[groups] / totalMass[groups, np.newaxis]
+        engine.masses[survivors] = totalMass[groups]
+        engine.radii[survivors] = np.sqrt(area[groups])
+
+        merged = np.ones(engine.count, dtype=bool)
+        merged[survivors] = False
+        merged &= np.bincount(labels, minlength=engine.count)[labels] > 1
+        removed = [int(handle) for handle in engine.handles[merged]]
+        for handle in removed:
+            engine.remove(handle)
+        return removed
@@ -0,0 +1,141 @@
+import collections
+import csv
+import os
+import numpy as np
+
+# Conserved quantities of an engine. All O(N) except potential energy, which Engine takes from
+# the last force pass when the solver provides it (DirectSolver or BarnesHutSolver with withPotential=True,
+# the latter as approximate as its forces), other solvers pay a tiled O(N^2) sweep per measurement.
+
+Quantities = collections.namedtuple("Quantities", "kinetic potential energy momentum angularMomentum centerOfMass")
+FIELDS = ("step", "time", "bodies", "kinetic", "potential", "energy", "momentumX", "momentumY", "angularMomentum",
+          "centerOfMassX", "centerOfMassY", "energyDrift", "momentumDrift", "angularMomentumDrift")
+
+
+def momentum(engine):
+    return np.sum(engine.masses[:, np.newaxis] * engine.velocities, axis=0)
+
+
+def angularMomentum(engine):                # about the origin, z component of sum m (r x v)
+    positions, velocities = engine.positions, engine.velocities
+    return float(np.sum(engine.masses * (positions[:, 0] * velocities[:, 1] - positions[:, 1] * velocities[:, 0])))
+
+
+def centerOfMass(engine):
+    if engine.count == 0:
+        return np.zeros(2)
+    return np.average(engine.positions, axis=0, weights=engine.masses)
+
+
+def measure(engine) -> Quantities:
+    kinetic = engine.kineticEnergy()
+    potential = engine.potentialEnergy()
+    return Quantities(kinetic, potential, kinetic + potential, momentum(engine), angularMomentum(engine), centerOfMass(engine))
+
+
+# Drift of the quantities against a baseline. Merges lose energy on purpose and added bodies bring
+# their own, so the baseline is taken again whenever the body count changes. Drifts are relative:
+# energy to |E0|, momenta to the sum of |m v| and |m r x v| of the baseline. With resumeStep an
+# existing csv is continued, rows after that step are dropped.
+class ConservationMonitor:
+
+    def __init__(self, every=1, energyTolerance=None, csvPath=None, resumeStep=None):
+        if every < 1:
+            raise ValueError("Monitor interval cannot be lower than 1")
+        self.__every = every
+        self.__energyTolerance = energyTolerance    # None never reports exceeded drift
+        self.__baseline = None
+        self.__baselineCount = None
+        self.__scales = None
+        self.__latest = None                # last row, dict with FIELDS
+        self.__exceeded = False
+        self.__csvFile = self.__openCsv(csvPath, resumeStep) if csvPath else None
+        self.__csv = csv.DictWriter(self.__csvFile, fieldnames=FIELDS) if csvPath else None
+        if self.__csv is not None and self.__csvFile.tell() == 0:
+            self.__csv.writeheader()
+
+    @staticmethod
+    def __openCsv(path, resumeStep):
+        if resumeStep is None or not os.path.exists(path):
+            return open(path, "w", newline="")
+        with open(path, newline="") as file:
+            rows = [row for row in csv.reader(file) if row]
+        with open(path, "w", newline="") as file:
+            if rows and rows[0] == list(FIELDS):
+                csv.writer(file).writerows([rows[0]] + [row for row in rows[1:] if int(row[0]) <= resumeStep])
+        return open(path, "a", newline="")
+
+    @property
+    def every(self):
+        return self.__every
+
+    @property
+    def latest(self):
+        return self.__latest
+
+    @property
+    def exceeded(self) -> bool:             # energy drift of the last update was over the tolerance
+        return self.__exceeded
+
+    def rebase(self, engine):
+        self.__baseline = measure(engine)
+        self.__baselineCount = engine.count
+        speeds = np.sqrt(np.einsum('ij,ij->i', engine.velocities, engine.velocities))
+        distances = np.sqrt(np.einsum('ij,ij->i', engine.positions, engine.positions))
+        # the log potential has no natural zero, so energy drifts are relative to kinetic + |potential|
+        self.__scales = (self.__baseline.kinetic + abs(self.__baseline.potential) or 1.0,
+                         float(np.sum(engine.masses * speeds)) or 1.0,
+                         float(np.sum(engine.masses * speeds * distances)) or 1.0)
+        self.__exceeded = False
+
+    def getState(self) -> dict:             # json serializable, what the drifts and the update steps depend on
+        baseline = None if self.__baseline is None else {field: np.asarray(value).tolist()
+                                                         for field, value in self.__baseline._asdict().items()}
+        return {"every": self.__every, "baseline": baseline, "baselineCount": self.__baselineCount,
+                "scales": None if self.__scales is None else list(self.__scales), "exceeded": self.__exceeded}
+
+    def setState(self, state):
+        if state["every"] < 1:
+            raise ValueError("Monitor interval cannot be lower than 1")
+        self.__every = state["every"]
+        baseline = state["baseline"]
+        self.__baseline = None if baseline is None else Quantities(**{field: np.array(value) if isinstance(value, list) else value
+                                                                      for field, value in baseline.items()})
+        self.__baselineCount = state["baselineCount"]
+        self.__scales = None if state["scales"] is None else tuple(state["scales"])
+        self.__exceeded = state["exceeded"]
+
+    def update(self, engine, step, time):   # row with FIELDS on every every-th step, otherwise None
+        if step % self.__every:
+            return None
+        if self.__baseline is None or engine.count != self.__baselineCount:
+            self.rebase(engine)
+        quantities = measure(engine)
+        energyScale, momentumScale, angularScale = self.__scales
+        row = {
+            "step": step, "time": time, "bodies": engine.count,
+            "kinetic": quantities.kinetic, "potential": quantities.potential, "energy": quantities.energy,
+            "momentumX": float(quantities.momentum[0]), "momentumY": float(quantities.momentum[1]),
+            "angularMomentum": quantities.angularMomentum,
+            "centerOfMassX": float(quantities.centerOfMass[0]), "centerOfMassY": float(quantities.centerOfMass[1]),
+            "energyDrift": abs(quantities.energy - self.__baseline.energy) / energyScale,
+            "momentumDrift": float(np.linalg.norm(quantities.momentum - self.__baseline.momentum)) / momentumScale,
+            "angularMomentumDrift": abs(quantities.angularMomentum - self.__baseline.angularMomentum) / angularScale
+        }
+        self.__exceeded = self.__energyTolerance is not None and row["energyDrift"] > self.__energyTolerance
+        self.__latest = row
+        if self.__csv is not None:
+            self.__csv.writerow(row)
+        return row
+
+    def statusText(self):
+        if self.__latest is None:
+            return ""
+        row = self.__latest
+        return (f'E {row["energy"]:.4g} (drift {row["energyDrift"]:.1e})  P drift {row["momentumDrift"]:.1e}'
+                f'  L drift {row["angularMomentumDrift"]:.1e}  COM ({row["centerOfMassX"]:.1f}, {row["centerOfMassY"]:.1f})')
+
+    def close(self):
+        if self.__csvFile is not None:
+            self.__csvFile.close()
+            self.__csvFile = None
@@ -0,0 +1,263 @@
+import argparse
+import multiprocessing as mp
+import numpy as np
+import Scenario
+from utility import *
+from BarnesHut import QuadTree
+from Headless import SOLVERS, createSolver
+
+# Domain decomposition over worker processes. Space is cut into slabs along x holding equal
+# body counts. Every step each domain
+#   kicks and drifts its bodies (leapfrog, half kicks around one force evaluation),
+#   hands bodies that left its slab to their new owner,
+#   exports to every other domain a summary of itself: tree nodes that are small enough seen
+#   from the other domain's bounding box (size < theta * distance), bodies of opened leaves as they are,
+#   computes forces on its bodies from own bodies plus everything imported and kicks again.
+# With theta 0 every body is exported and results match the single process engine up to summation order.
+# Messages go through a transport, LocalTransport runs workers as local processes.
+
+
+def _concatenate(parts, width):             # list of (handles, masses, radii, positions, velocities)
+    if not parts:
+        return (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty((0, width)), np.empty((0, width)))
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def _ranges(starts, counts):                # concatenated aranges start .. start + count
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(int(np.sum(counts)))
+
+
+def _boxDistance(points, box):              # distance of every point to an axis aligned box, 0 inside
+    lower, upper = box
+    outside = np.maximum(np.maximum(lower - points, points - upper), 0.0)
+    return np.sqrt(np.einsum('ij,ij->i', outside, outside))
+
+
+def exportSummary(tree, positions, masses, radii, box, theta):    # (positions, masses, radii) of pseudo bodies seen from box
+    exported = ([], [], [])
+    nodes = np.array([0])
+    while len(nodes):
+        accepted = tree.size[nodes] < theta * _boxDistance(tree.centerOfMass[nodes], box)
+        done = nodes[accepted]
+        exported[0].append(tree.centerOfMass[done])
+        exported[1].append(tree.mass[done])
+        exported[2].append(tree.radius[done])
+        opened = nodes[~accepted]
+        leaves = opened[tree.isLeaf[opened]]
+        bodies = tree.order[_ranges(tree.start[leaves], tree.end[leaves] - tree.start[leaves])]
+        exported[0].append(positions[bodies])
+        exported[1].append(masses[bodies])
+        exported[2].append(radii[bodies])
+        internal = opened[~tree.isLeaf[opened]]
+        nodes = _ranges(tree.childFirst[internal], tree.childCount[internal])
+    return np.concatenate(exported[0]), np.concatenate(exported[1]), np.concatenate(exported[2])
+
+
+def _domainLoop(connection, rank, forceSolver, theta, leafSize):
+    handles, masses, radii = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    positions, velocities, accelerations = np.empty((0, 2)), np.empty((0, 2)), np.empty((0, 2))
+    while True:
+        command, argument = connection.recv()
+        if command == "stop":
+            return
+        elif command == "load":
+            handles, masses, radii, positions, velocities = argument
+            accelerations = np.zeros_like(positions)
+            connection.send(None)
+        elif command == "drift":            # opening half kick and drift, returns bodies leaving the slab per owner
+            deltaTime, edges, gValueFactor = argument
+            Const.setGValueFactor(gValueFactor)
+            velocities = velocities + accelerations * (deltaTime / 2)
+            positions = positions + velocities * deltaTime
+            owners = np.searchsorted(edges, positions[:, 0], side='right')
+            leaving = owners != rank
+            emigrants = {int(owner): (handles[owners == owner], masses[owners == owner], radii[owners == owner],
+                                      positions[owners == owner], velocities[owners == owner])
+                         for owner in np.unique(owners[leaving])}
+            staying = ~leaving
+            handles, masses, radii = handles[staying], masses[staying], radii[staying]
+            positions, velocities = positions[staying], velocities[staying]
+            connection.send(emigrants)
+        elif command == "immigrate":        # returns the bounding box of the domain or None when empty
+            handles, masses, radii, positions, velocities = _concatenate(
+                [(handles, masses, radii, positions, velocities)] + argument, 2)
+            connection.send((positions.min(axis=0), positions.max(axis=0)) if len(handles) else None)
+        elif command == "export":           # summaries of this domain for every box, None for own rank and empty domains
+            tree = QuadTree(positions, masses, radii, leafSize) if len(handles) else None
+            connection.send([None if box is None or other == rank or tree is None
+                             else exportSummary(tree, positions, masses, radii, box, theta)
+                             for other, box in enumerate(argument)])
+        elif command == "forces":           # imported pseudo bodies are sources only, then closing half kick
+            imports, deltaTime = argument
+            sources = [(positions, masses, radii)] + [summary for summary in imports if summary is not None]
+            allPositions, allMasses, allRadii = (np.concatenate(column) for column in zip(*sources))
+            accelerations = forceSolver.accelerations(allPositions, allMasses, allRadii, np.arange(len(handles))) \
+                if len(handles) else np.empty((0, 2))
+            velocities = velocities + accelerations * (deltaTime / 2)
+            connection.send(len(handles))
+        elif command == "collect":
+            connection.send((handles, masses, radii, positions, velocities))
+
+
+# Workers as local processes, one pipe each. Another transport (sockets, MPI) only has to provide
+# the same four methods and run _domainLoop with a connection offering send and recv.
+class LocalTransport:
+
+    def __init__(self):
+        self.__connections = []
+        self.__processes = []
+
+    def start(self, count, target, arguments):     # target(connection, rank, *arguments) in every worker
+        for rank in range(count):
+            connection, workerConnection = mp.Pipe()
+            process = mp.Process(target=target, args=(workerConnection, rank) + tuple(arguments), daemon=True)
+            process.start()
+            self.__connections.append(connection)
+            self.__processes.append(process)
+
+    def send(self, rank, message):
+        self.__connections[rank].send(message)
+
+    def receive(self, rank):
+        return self.__connections[rank].recv()
+
+    def close(self):
+        for process in self.__processes:
+            process.join()
+        self.__connections, self.__processes = [], []
+
+
+class DistributedSimulation:
+
+    def __init__(self, workers=2, forceSolver=None, theta=0.5, leafSize=8, rebalanceEvery=50, transport=None):
+        if workers < 1:
+            raise ValueError("Worker count cannot be lower than 1")
+        if theta < 0:
+            raise ValueError("Opening angle theta cannot be negative")
+        self.__workers = workers
+        self.__transport = transport if transport is not None else LocalTransport()
+        self.__transport.start(workers, _domainLoop, (forceSolver if forceSolver is not None else createSolver("direct"),
+                                                       theta, leafSize))
+        self.__rebalanceEvery = rebalanceEvery
+        self.__edges = np.empty(0)          # x coordinates between slabs
+        self.__colors = {}                  # handle : color
+        self.__accelerationsValid = False
+        self.__steps = 0
+        self.__time = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @property
+    def steps(self):
+        return self.__steps
+
+    @property
+    def time(self):
+        return self.__time
+
+    def __broadcast(self, messages):        # one message per rank, replies in rank order
+        for rank, message in enumerate(messages):
+            self.__transport.send(rank, message)
+        return [self.__transport.receive(rank) for rank in range(self.__workers)]
+
+    def __distribute(self, handles, masses, radii, positions, velocities):
+        quantiles = np.linspace(0.0, 1.0, self.__workers + 1)[1:-1]
+        self.__edges = np.quantile(positions[:, 0], quantiles) if len(handles) else np.zeros(self.__workers - 1)
+        owners = np.searchsorted(self.__edges, positions[:, 0], side='right')
+        self.__broadcast([("load", (handles[owners == rank], masses[owners == rank], radii[owners == rank],
+                                    positions[owners == rank], velocities[owners == rank]))
+                          for rank in range(self.__workers)])
+        self.__accelerationsValid = False
+
+    def loadArrays(self, masses, radii, positions, velocities, colors):    # adds bodies, returns their handles
+        current = self.collect()
+        first = int(current[0].max()) + 1 if len(current[0]) else 0
+        handles = np.arange(first, first + len(colors), dtype=np.int64)
+        self.__colors.update(zip(handles.tolist(), colors))
+        added = (handles, np.asarray(masses, dtype=float), np.asarray(radii, dtype=float),
+                 np.asarray(positions, dtype=float).reshape(-1, 2), np.asarray(velocities, dtype=float).reshape(-1, 2))
+        self.__distribute(*_concatenate([current, added], 2))
+        return handles
+
+    def loadBodies(self, bodies):
+        return self.loadArrays([body.mass for body in bodies], [body.radius for body in bodies],
+                               [body.position.toPair() for body in bodies], [body.velocity.toPair() for body in bodies],
+                               [body.color for body in bodies])
+
+    def loadFromFile(self, filename):
+        self.loadArrays(*Scenario.readArrays(filename))
+
+    def collect(self):                      # (handles, masses, radii, positions, velocities) sorted by handle
+        handles, masses, radii, positions, velocities = _concatenate(
+            self.__broadcast([("collect", None)] * self.__workers), 2)
+        order = np.argsort(handles)
+        return handles[order], masses[order], radii[order], positions[order], velocities[order]
+
+    def bodies(self):                       # (masses, radii, positions, velocities, colors) sorted by handle, as Scenario.readArrays
+        handles, masses, radii, positions, velocities = self.collect()
+        return masses, radii, positions, velocities, [self.__colors[handle] for handle in handles.tolist()]
+
+    def saveCurrentStateToFile(self, filename):
+        Scenario.writeArrays(filename, *self.bodies())
+
+    def __driftAndExchange(self, deltaTime):
+        emigrants = self.__broadcast([("drift", (deltaTime, self.__edges, Const.getGValueFactor()))] * self.__workers)
+        immigrants = [[moving[rank] for moving in emigrants if rank in moving] for rank in range(self.__workers)]
+        boxes = self.__broadcast([("immigrate", immigrants[rank]) for rank in range(self.__workers)])
+        exports = self.__broadcast([("export", boxes)] * self.__workers)
+        self.__broadcast([("forces", ([exports[other][rank] for other in range(self.__workers)], deltaTime))
+                          for rank in range(self.__workers)])
+
+    def step(self, deltaTime):
+        if not self.__accelerationsValid:   # accelerations at the current positions for the first half kick
+            self.__driftAndExchange(0.0)
+            self.__accelerationsValid = True
+        self.__driftAndExchange(deltaTime)
+        self.__steps += 1
+        self.__time += deltaTime
+        if self.__rebalanceEvery and self.__steps % self.__rebalanceEvery == 0:
+            self.__distribute(*self.collect())      # slabs follow the bodies, next step computes forces of the new layout
+
+    def run(self, steps, deltaTime):
+        for _ in range(steps):
+            self.step(deltaTime)
+
+    def close(self):
+        if self.__transport is None:
+            return
+        for rank in range(self.__workers):
+            self.__transport.send(rank, ("stop", None))
+        self.__transport.close()
+        self.__transport = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a scenario split over several worker processes")
+    parser.add_argument("scenario", help="scenario file in the format used by App.loadFromFile")
+    parser.add_argument("output", help="file for the final state")
+    parser.add_argument("--workers", type=int, default=mp.cpu_count())
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--dt", type=float, default=0.025, help="fixed timestep")
+    parser.add_argument("--solver", choices=SOLVERS, default="direct", help="solver inside every domain")
+    parser.add_argument("--theta", type=float, default=0.5, help="opening angle of exported summaries, 0 is exact")
+    parser.add_argument("--rebalance-every", type=int, default=50, help="steps between recomputing slabs, 0 never")
+    args = parser.parse_args(argv)
+
+    with DistributedSimulation(args.workers, createSolver(args.solver, args.theta), args.theta,
+                               rebalanceEvery=args.rebalance_every) as simulation:
+        simulation.loadFromFile(args.scenario)
+        simulation.run(args.steps, args.dt)
+        simulation.saveCurrentStateToFile(args.output)
+
+
+if __name__ == "__main__":
+    main()
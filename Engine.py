@@ -0,0 +1,375 @@
+import numpy as np
+from utility import *
+from Integrators import EulerIntegrator
+import Profiler
+
+
+def pairPotentials(distance, contact):       # potential of the clamped 1/r force divided by G m1 m2, continuous at contact
+    ratio = distance / contact
+    return np.where(ratio < 1.0, 0.5 * ratio**2, np.log(np.maximum(ratio, 1.0)) + 0.5)
+
+
+def pairForce(body1, body2) -> Vector:     # force on body1 from body2, distance clamped to the sum of radii
+    deltaS = body2.position - body1.position
+    distanceValue =  Vector.distance(body1.position, body2.position).len()
+    if distanceValue < body1.radius + body2.radius:
+        distanceValue = body1.radius + body2.radius
+    forceValue = Const.getGValue() * body1.mass * body2.mass / distanceValue
+    force = Vector(
+        forceValue * deltaS.x / distanceValue,
+        forceValue * deltaS.y / distanceValue
+    )
+    return force
+
+
+# All pairwise forces with batched numpy, O(N^2). Targets are processed in tiles of about
+# tileElements / N rows, so temporaries stay near tileElements pairs instead of N^2.
+class DirectSolver:
+
+    def __init__(self, withPotential=False, tileElements=1 << 20):
+        if tileElements < 1:
+            raise ValueError("Tile size cannot be lower than 1")
+        self.withPotential = withPotential  # full passes also sum potential energy from the same distances
+        self.tileElements = tileElements
+        self.__lastPotentialEnergy = None
+
+    @property
+    def lastPotentialEnergy(self):          # of the last full pass with withPotential, otherwise None
+        return self.__lastPotentialEnergy
+
+    def accelerations(self, positions, masses, radii, targets=None):   # targets: rows to compute, all by default
+        full = targets is None
+        if targets is None:
+            targets = np.arange(len(masses))
+        gValue = Const.getGValue()
+        result = np.empty((len(targets), 2))
+        potential = 0.0
+        tileRows = max(1, self.tileElements // max(len(masses), 1))
+        for first in range(0, len(targets), tileRows):
+            tile = targets[first:first + tileRows]
+            deltaS = positions[np.newaxis, :, :] - positions[tile, np.newaxis, :]     # deltaS[i, j] = position[j] - position[target i]
+            distance = np.sqrt(np.einsum('ijk,ijk->ij', deltaS, deltaS))
+            contact = radii[tile, np.newaxis] + radii[np.newaxis, :]
+            if full and self.withPotential:     # diagonal is 0, every pair is counted twice over all tiles
+                potential += float(np.einsum('ij,i,j->', pairPotentials(distance, contact), masses[tile], masses))
+            np.maximum(distance, contact, out=distance)     # same softening as pairForce
+            factor = gValue * masses[np.newaxis, :] / distance**2
+            factor[np.arange(len(tile)), tile] = 0.0
+            result[first:first + len(tile)] = np.einsum('ij,ijk->ik', factor, deltaS)
+        self.__lastPotentialEnergy = 0.5 * gValue * potential if full and self.withPotential else None
+        return result
+
+
+class ReferenceSolver:                      # per-pair python loop, kept to compare other solvers against
+
+    def accelerations(self, positions, masses, radii, targets=None):
+        count = len(masses)
+        targets = range(count) if targets is None else targets
+        result = np.zeros((len(targets), 2))
+        gValue = Const.getGValue()
+        for row, i in enumerate(targets):
+            for j in range(count):
+                if i == j:
+                    continue
+                deltaX = positions[j, 0] - positions[i, 0]
+                deltaY = positions[j, 1] - positions[i, 1]
+                distanceValue = math.sqrt(deltaX**2 + deltaY**2)
+                if distanceValue < radii[i] + radii[j]:
+                    distanceValue = radii[i] + radii[j]
+                accValue = gValue * masses[j] / distanceValue
+                result[row, 0] += accValue * deltaX / distanceValue
+                result[row, 1] += accValue * deltaY / distanceValue
+        return result
+
+
+class EngineVector(Vector):                 # Vector whose components live in a row of one of the engine arrays
+
+    def __init__(self, engine, handle, arrayName):
+        self.__engine = engine
+        self.__handle = handle
+        self.__arrayName = arrayName
+
+    def __row(self):
+        return getattr(self.__engine, self.__arrayName)[self.__engine.rowOf(self.__handle)]
+
+    @property
+    def x(self):
+        return float(self.__row()[0])
+
+    @x.setter
+    def x(self, value):
+        self.__row()[0] = value
+
+    @property
+    def y(self):
+        return float(self.__row()[1])
+
+    @y.setter
+    def y(self, value):
+        self.__row()[1] = value
+
+    def __copy__(self):                     # copies are detached from the engine
+        return Vector(self.x, self.y)
+
+    def __deepcopy__(self, memo):
+        return Vector(self.x, self.y)
+
+
+# Struct-of-arrays storage of all bodies. Rows are kept contiguous (removal moves the last row
+# into the freed one), handles returned by add() stay valid until the body is removed.
+class Engine:
+
+    def __init__(self, forceSolver=None, integrator=None, collisionHandler=None, capacity=64, profiler=None):
+        self.__forceSolver = forceSolver if forceSolver is not None else DirectSolver()
+        self.__integrator = integrator if integrator is not None else EulerIntegrator()
+        self.__collisionHandler = collisionHandler      # None means bodies pass through each other
+        self.__profiler = profiler if profiler is not None else Profiler.DISABLED
+        self.__accelerationsValid = False   # accelerations match current positions
+        self.__potentialEnergy = None       # from the force pass which made accelerations valid, if the solver gives it
+        self.__count = 0
+        self.__nextHandle = 0
+        self.__rows = {}                    # handle : row
+        self.__allocate(capacity)
+
+    def __allocate(self, capacity):
+        old = None if self.__count == 0 else (
+            self.__positions, self.__velocities, self.__accelerations,
+            self.__masses, self.__radii, self.__handles)
+        self.__positions = np.zeros((capacity, 2))
+        self.__velocities = np.zeros((capacity, 2))
+        self.__accelerations = np.zeros((capacity, 2))
+        self.__masses = np.zeros(capacity)
+        self.__radii = np.zeros(capacity)
+        self.__handles = np.zeros(capacity, dtype=np.int64)
+        if old is not None:
+            for new, array in zip((self.__positions, self.__velocities, self.__accelerations,
+                                   self.__masses, self.__radii, self.__handles), old):
+                new[:self.__count] = array[:self.__count]
+
+    @property
+    def forceSolver(self):
+        return self.__forceSolver
+
+    @forceSolver.setter
+    def forceSolver(self, solver):
+        self.__forceSolver = solver
+        self.__accelerationsValid = False
+
+    @property
+    def integrator(self):
+        return self.__integrator
+
+    @integrator.setter
+    def integrator(self, integrator):
+        self.__integrator = integrator
+
+    @property
+    def collisionHandler(self):
+        return self.__collisionHandler
+
+    @collisionHandler.setter
+    def collisionHandler(self, handler):
+        self.__collisionHandler = handler
+
+    @property
+    def profiler(self):
+        return self.__profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self.__profiler = profiler if profiler is not None else Profiler.DISABLED
+
+    @property
+    def accelerationsValid(self) -> bool:
+        return self.__accelerationsValid
+
+    def invalidateAccelerations(self):      # has to be called after positions or masses are changed from outside
+        self.__accelerationsValid = False
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    @property
+    def positions(self):
+        return self.__positions[:self.__count]
+
+    @property
+    def velocities(self):
+        return self.__velocities[:self.__count]
+
+    @property
+    def accelerations(self):
+        return self.__accelerations[:self.__count]
+
+    @property
+    def masses(self):
+        return self.__masses[:self.__count]
+
+    @property
+    def radii(self):
+        return self.__radii[:self.__count]
+
+    @property
+    def handles(self):
+        return self.__handles[:self.__count]
+
+    def rowOf(self, handle) -> int:
+        return self.__rows[handle]
+
+    def vectorView(self, handle, arrayName) -> EngineVector:
+        return EngineVector(self, handle, arrayName)
+
+    def add(self, mass: float, radius: float, position: Vector, velocity: Vector, handle=None) -> int:    # returns handle
+        if self.__count == len(self.__masses):
+            self.__allocate(2 * len(self.__masses))
+        row = self.__count
+        if handle is None:
+            handle = self.__nextHandle
+        elif handle in self.__rows:
+            raise ValueError(f'Handle {handle} is already used')
+        self.__nextHandle = max(self.__nextHandle, handle + 1)
+        self.__positions[row] = position.toPair()
+        self.__velocities[row] = velocity.toPair()
+        self.__accelerations[row] = 0.0
+        self.__masses[row] = mass
+        self.__radii[row] = radius
+        self.__handles[row] = handle
+        self.__rows[handle] = row
+        self.__count += 1
+        self.__accelerationsValid = False
+        return handle
+
+    def addMany(self, masses, radii, positions, velocities, handles=None):     # bulk add, returns handles
+        count = len(masses)
+        if handles is None:
+            handles = np.arange(self.__nextHandle, self.__nextHandle + count, dtype=np.int64)
+        else:
+            handles = np.asarray(handles, dtype=np.int64)
+            if len(np.unique(handles)) != count or any(handle in self.__rows for handle in handles.tolist()):
+                raise ValueError("Handles are already used or repeated")
+        end = self.__count + count
+        if end > len(self.__masses):        # one reallocation for all of them
+            self.__allocate(max(end, 2 * len(self.__masses)))
+        rows = slice(self.__count, end)
+        self.__positions[rows] = positions
+        self.__velocities[rows] = velocities
+        self.__accelerations[rows] = 0.0
+        self.__masses[rows] = masses
+        self.__radii[rows] = radii
+        self.__handles[rows] = handles
+        self.__rows.update(zip(handles.tolist(), range(self.__count, end)))
+        self.__count = end
+        if count:
+            self.__nextHandle = max(self.__nextHandle, int(handles.max()) + 1)
+        self.__accelerationsValid = False
+        return handles
+
+    def removeMany(self, handles):          # bulk remove, remaining rows keep their order
+        rows = [self.__rows[int(handle)] for handle in handles]
+        if not rows:
+            return
+        keep = np.ones(self.__count, dtype=bool)
+        keep[rows] = False
+        remaining = int(np.count_nonzero(keep))
+        for array in (self.__positions, self.__velocities, self.__accelerations,
+                      self.__masses, self.__radii, self.__handles):
+            array[:remaining] = array[:self.__count][keep]
+        self.__count = remaining
+        self.__rows = dict(zip(self.handles.tolist(), range(remaining)))
+        self.__accelerationsValid = False
+
+    def remove(self, handle):
+        row = self.__rows.pop(handle)
+        last = self.__count - 1
+        if row != last:
+            for array in (self.__positions, self.__velocities, self.__accelerations,
+                          self.__masses, self.__radii, self.__handles):
+                array[row] = array[last]
+            self.__rows[int(self.__handles[row])] = row
+        self.__count -= 1
+        self.__accelerationsValid = False
+
+    def replaceState(self, handles, masses, radii, positions, velocities):     # bulk replacement of all bodies
+        count = len(handles)
+        if count > len(self.__masses):
+            self.__count = 0
+            self.__allocate(max(count, 2 * len(self.__masses)))
+        self.__count = count
+        self.handles[:] = handles
+        self.masses[:] = masses
+        self.radii[:] = radii
+        self.positions[:] = positions
+        self.velocities[:] = velocities
+        self.accelerations[:] = 0.0
+        self.__rows = {int(handle): row for row, handle in enumerate(self.handles)}
+        self.__nextHandle = max(self.__nextHandle, int(self.handles.max()) + 1 if count else 0)
+        self.__accelerationsValid = False
+
+    def getState(self) -> dict:             # copies of everything step() depends on, rows in current order
+        return {
+            "handles": self.handles.copy(),
+            "masses": self.masses.copy(),
+            "radii": self.radii.copy(),
+            "positions": self.positions.copy(),
+            "velocities": self.velocities.copy(),
+            "accelerations": self.accelerations.copy(),
+            "accelerationsValid": self.__accelerationsValid,
+            "nextHandle": self.__nextHandle
+        }
+
+    def setState(self, state):              # inverse of getState, following steps are bit identical
+        self.replaceState(state["handles"], state["masses"], state["radii"], state["positions"], state["velocities"])
+        self.accelerations[:] = state["accelerations"]
+        self.__potentialEnergy = None
+        self.__accelerationsValid = bool(state["accelerationsValid"])
+        self.__nextHandle = int(state["nextHandle"])
+
+    def clear(self):
+        self.__rows.clear()
+        self.__count = 0
+        self.__accelerationsValid = False
+
+    def accelerationsAt(self, positions):  # accelerations for other positions of the same bodies
+        with self.__profiler.phase("forces"):
+            return self.__forceSolver.accelerations(positions, self.masses, self.radii)
+
+    def computeAccelerations(self, targets=None):      # targets: rows to update, all rows by default
+        with self.__profiler.phase("forces"):
+            if targets is not None:
+                self.accelerations[targets] = self.__forceSolver.accelerations(self.positions, self.masses, self.radii, targets)
+                return self.accelerations
+            if self.__count:
+                self.accelerations[:] = self.__forceSolver.accelerations(self.positions, self.masses, self.radii)
+            self.__potentialEnergy = getattr(self.__forceSolver, "lastPotentialEnergy", None) if self.__count else 0.0
+        self.__accelerationsValid = True
+        return self.accelerations
+
+    def kineticEnergy(self) -> float:
+        return 0.5 * float(np.sum(self.masses * np.einsum('ij,ij->i', self.velocities, self.velocities)))
+
+    def potentialEnergy(self) -> float:    # reused from the force pass when possible, otherwise one more O(N^2) sweep
+        if self.__accelerationsValid and self.__potentialEnergy is not None:
+            return self.__potentialEnergy
+        positions, masses, radii = self.positions, self.masses, self.radii
+        tileRows = max(1, getattr(self.__forceSolver, "tileElements", 1 << 20) // max(self.__count, 1))
+        potential = 0.0
+        for first in range(0, self.__count, tileRows):     # rows first.. against columns first.., pairs j > i
+            last = min(first + tileRows, self.__count)
+            deltaS = positions[np.newaxis, first:, :] - positions[first:last, np.newaxis, :]
+            distance = np.sqrt(np.einsum('ijk,ijk->ij', deltaS, deltaS))
+            contact = radii[first:last, np.newaxis] + radii[np.newaxis, first:]
+            pairs = np.triu(pairPotentials(distance, contact), 1)
+            potential += float(np.einsum('ij,i,j->', pairs, masses[first:last], masses[first:]))
+        return Const.getGValue() * potential
+
+    def totalEnergy(self) -> float:
+        return self.kineticEnergy() + self.potentialEnergy()
+
+    def step(self, deltaTime: float):      # returns handles of bodies removed by collisions
+        with self.__profiler.phase("integration"):
+            self.__integrator.step(self, deltaTime)
+        if self.__collisionHandler is None or self.__count == 0:
+            return []
+        with self.__profiler.phase("collisions"):
+            return self.__collisionHandler.resolve(self)
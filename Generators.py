@@ -0,0 +1,230 @@
+import argparse
+import collections
+import json
+import numpy as np
+from utility import *
+import Snapshot
+
+# Initial conditions built directly as arrays, no Body objects. The engine's force law is
+# a = G m / d (clamped at contact), which gives two shortcuts used throughout:
+#   a ring pulls nothing inside it and acts as its mass at its center outside it, so in a
+#   system symmetric about a center a circular orbit at radius r needs v^2 = G M(<r)
+#   the virial theorem reads 2K = G * sum over pairs m_i m_j, so velocities in equilibrium
+#   carry K = G (M^2 - sum m^2) / 4 whatever the size of the system
+# Clamping is ignored, it only matters where bodies overlap.
+
+System = collections.namedtuple("System", "masses radii positions velocities colorIndices colorTable")
+DEFAULT_CENTER = (750.0, 350.0)             # middle of the default window
+
+
+def _system(masses, radii, positions, velocities, color):
+    return System(masses, radii, positions, velocities, np.zeros(len(masses), dtype=np.uint32), [color])
+
+
+def _directions(rng, count):                # (count, 2) unit vectors with uniform angles
+    angles = rng.uniform(0.0, 2 * np.pi, count)
+    return np.column_stack((np.cos(angles), np.sin(angles)))
+
+
+def virialKineticEnergy(masses):
+    total = float(np.sum(masses))
+    return Const.getGValue() * (total**2 - float(np.sum(np.square(masses)))) / 4
+
+
+def circularVelocities(offsets, masses, centralMass=0.0, clockwise=False):    # offsets: positions relative to the center
+    distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+    order = np.argsort(distances, kind="stable")
+    enclosed = np.empty(len(masses))
+    enclosed[order] = np.cumsum(masses[order]) - masses[order]
+    speeds = np.sqrt(Const.getGValue() * (enclosed + centralMass)) / np.maximum(distances, np.finfo(float).tiny)
+    velocities = np.column_stack((-offsets[:, 1], offsets[:, 0])) * speeds[:, np.newaxis]
+    return -velocities if clockwise else velocities
+
+
+def isotropicVelocities(rng, masses):       # random directions, no net momentum, virial kinetic energy
+    velocities = rng.normal(0.0, 1.0, (len(masses), 2))
+    velocities -= np.average(velocities, axis=0, weights=masses)
+    kinetic = 0.5 * float(np.sum(masses * np.einsum('ij,ij->i', velocities, velocities)))
+    return velocities * np.sqrt(virialKineticEnergy(masses) / kinetic) if kinetic > 0 else velocities
+
+
+def uniformDisc(count, radius=300.0, totalMass=1e4, center=DEFAULT_CENTER, rotating=True, bodyRadius=1.0,
+                color="white", seed=None):  # rotating on circular orbits, otherwise random virial velocities
+    rng = np.random.default_rng(seed)
+    offsets = radius * np.sqrt(rng.uniform(0.0, 1.0, count))[:, np.newaxis] * _directions(rng, count)
+    masses = np.full(count, totalMass / count)
+    velocities = circularVelocities(offsets, masses) if rotating else isotropicVelocities(rng, masses)
+    return _system(masses, np.full(count, float(bodyRadius)), offsets + center, velocities, color)
+
+
+def plummer(count, scaleRadius=100.0, totalMass=1e4, center=DEFAULT_CENTER, cutoff=10.0, bodyRadius=1.0,
+            color="white", seed=None):      # surface density of a projected Plummer sphere, cut at cutoff scale radii
+    rng = np.random.default_rng(seed)
+    fractions = rng.uniform(0.0, cutoff**2 / (1 + cutoff**2), count)     # enclosed mass M R^2 / (R^2 + a^2), inverted
+    offsets = scaleRadius * np.sqrt(fractions / (1 - fractions))[:, np.newaxis] * _directions(rng, count)
+    masses = np.full(count, totalMass / count)
+    return _system(masses, np.full(count, float(bodyRadius)), offsets + center, isotropicVelocities(rng, masses), color)
+
+
+def keplerian(planets, starMass=1e4, planetMass=1.0, innerRadius=50.0, outerRadius=300.0, center=DEFAULT_CENTER,
+              starRadius=40.0, planetRadius=5.0, clockwise=False, starColor="yellow", color="blue", seed=None):
+    rng = np.random.default_rng(seed)       # orbit radii log uniform, the star moves so that momentum is zero
+    distances = np.exp(rng.uniform(np.log(innerRadius), np.log(outerRadius), planets))
+    offsets = distances[:, np.newaxis] * _directions(rng, planets)
+    masses = np.full(planets, float(planetMass))
+    velocities = circularVelocities(offsets, masses, starMass, clockwise)
+    starVelocity = -np.sum(masses[:, np.newaxis] * velocities, axis=0) / starMass
+    return System(
+        masses=np.concatenate(([starMass], masses)),
+        radii=np.concatenate(([starRadius], np.full(planets, float(planetRadius)))),
+        positions=np.vstack((np.zeros((1, 2)), offsets)) + center,
+        velocities=np.vstack((starVelocity, velocities)),
+        colorIndices=np.concatenate(([0], np.ones(planets, dtype=np.uint32))).astype(np.uint32),
+        colorTable=[starColor, color]
+    )
+
+
+def galaxy(count, diskMass=1e4, bulgeMass=1e4, scaleLength=60.0, center=DEFAULT_CENTER, velocity=(0.0, 0.0),
+           bulgeRadius=20.0, bodyRadius=1.0, clockwise=False, bulgeColor="yellow", color="white", seed=None):
+    rng = np.random.default_rng(seed)       # one bulge body and an exponential disc on circular orbits
+    distances = rng.gamma(2.0, scaleLength, count)     # radius density of an exponential disc is r exp(-r / h)
+    offsets = distances[:, np.newaxis] * _directions(rng, count)
+    masses = np.full(count, diskMass / count)
+    velocities = circularVelocities(offsets, masses, bulgeMass, clockwise)
+    system = System(
+        masses=np.concatenate(([bulgeMass], masses)),
+        radii=np.concatenate(([bulgeRadius], np.full(count, float(bodyRadius)))),
+        positions=np.vstack((np.zeros((1, 2)), offsets)),
+        velocities=np.vstack((np.zeros((1, 2)), velocities)),
+        colorIndices=np.concatenate(([0], np.ones(count, dtype=np.uint32))).astype(np.uint32),
+        colorTable=[bulgeColor, color]
+    )
+    return moved(system, center, velocity)
+
+
+def collidingGalaxies(count, separation=600.0, impactParameter=150.0, approachSpeed=2.0, massRatio=1.0,
+                      diskMass=1e4, bulgeMass=1e4, scaleLength=60.0, center=DEFAULT_CENTER, bodyRadius=1.0, seed=None):
+    rng = np.random.default_rng(seed)       # count disc bodies split by mass, second galaxy counter rotating
+    secondCount = int(round(count * massRatio / (1 + massRatio)))
+    offset = np.array((separation / 2, impactParameter / 2))
+    approach = np.array((approachSpeed / 2, 0.0))
+    first = galaxy(count - secondCount, diskMass, bulgeMass, scaleLength, -offset, approach,
+                   bodyRadius=bodyRadius, color="light sky blue", seed=rng)
+    second = galaxy(secondCount, diskMass * massRatio, bulgeMass * massRatio, scaleLength * np.sqrt(massRatio), offset,
+                    -approach, bodyRadius=bodyRadius, clockwise=True, color="light salmon", seed=rng)
+    return toCenterOfMassFrame(combine(first, second), center)
+
+
+def hierarchicalBinary(levels, totalMass=1e4, separation=400.0, ratio=0.2, center=DEFAULT_CENTER, bodyRadius=5.0,
+                       color="white", seed=None):   # 2^levels bodies, every pair orbits the pair it belongs to
+    rng = np.random.default_rng(seed)
+    positions = np.zeros((1, 2))
+    velocities = np.zeros((1, 2))
+    masses = np.array([float(totalMass)])
+    for level in range(levels):             # every body splits into two halves orbiting their common center
+        axes = _directions(rng, len(masses)) * (separation * ratio**level / 2)
+        speeds = np.sqrt(Const.getGValue() * masses)[:, np.newaxis] / 2     # relative speed sqrt(G (m1 + m2)), half each
+        orbital = np.column_stack((-axes[:, 1], axes[:, 0])) / np.linalg.norm(axes, axis=1)[:, np.newaxis] * speeds
+        positions = np.stack((positions + axes, positions - axes), axis=1).reshape(-1, 2)
+        velocities = np.stack((velocities + orbital, velocities - orbital), axis=1).reshape(-1, 2)
+        masses = np.repeat(masses / 2, 2)
+    return _system(masses, np.full(len(masses), float(bodyRadius)), positions + center, velocities, color)
+
+
+def moved(system, offset=(0.0, 0.0), velocity=(0.0, 0.0)):
+    return system._replace(positions=system.positions + offset, velocities=system.velocities + velocity)
+
+
+def toCenterOfMassFrame(system, center=DEFAULT_CENTER):    # center of mass at center and at rest
+    centerOfMass = np.average(system.positions, axis=0, weights=system.masses)
+    drift = np.average(system.velocities, axis=0, weights=system.masses)
+    return moved(system, np.asarray(center) - centerOfMass, -drift)
+
+
+def combine(*systems):
+    colorTable = list(dict.fromkeys(color for system in systems for color in system.colorTable))
+    remaps = [np.array([colorTable.index(color) for color in system.colorTable], dtype=np.uint32) for system in systems]
+    return System(
+        masses=np.concatenate([system.masses for system in systems]),
+        radii=np.concatenate([system.radii for system in systems]),
+        positions=np.vstack([system.positions for system in systems]),
+        velocities=np.vstack([system.velocities for system in systems]),
+        colorIndices=np.concatenate([remap[system.colorIndices] for remap, system in zip(remaps, systems)]),
+        colorTable=colorTable
+    )
+
+
+def writeSystem(filename, system):          # snapshot or JSON lines, chosen like Scenario.writeBodies
+    if filename.lower().endswith(Snapshot.EXTENSION):
+        Snapshot.writeIndexedSnapshot(filename, system.masses, system.radii, system.positions, system.velocities,
+                                      system.colorIndices, system.colorTable)
+        return
+    colors = [json.dumps(color) for color in system.colorTable]
+    with open(filename, "w") as file:
+        file.writelines(
+            f'{{"mass": {mass!r}, "radius": {radius!r}, "color": {colors[colorIndex]}, "posX": {x!r}, "posY": {y!r}, '
+            f'"velX": {vx!r}, "velY": {vy!r}}}\n'
+            for mass, radius, colorIndex, (x, y), (vx, vy) in zip(system.masses.tolist(), system.radii.tolist(),
+                                                                 system.colorIndices.tolist(), system.positions.tolist(),
+                                                                 system.velocities.tolist()))
+
+
+def loadIntoEngine(engine, system):         # replaces all bodies of the engine, returns their handles
+    handles = np.arange(len(system.masses), dtype=np.int64)
+    engine.replaceState(handles, system.masses, system.radii, system.positions, system.velocities)
+    return handles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a large scenario file")
+    parser.add_argument("output", help="scenario file, use the .snap extension for big systems")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--center", type=float, nargs=2, default=DEFAULT_CENTER)
+    parser.add_argument("--body-radius", type=float, default=1.0)
+    generators = parser.add_subparsers(dest="generator", required=True)
+    disc = generators.add_parser("disc", help="uniform disc")
+    disc.add_argument("--count", type=int, default=10000)
+    disc.add_argument("--radius", type=float, default=300.0)
+    disc.add_argument("--mass", type=float, default=1e4, help="total mass")
+    disc.add_argument("--random-velocities", action="store_true", help="virial velocities instead of rotation")
+    cluster = generators.add_parser("plummer", help="Plummer cluster")
+    cluster.add_argument("--count", type=int, default=10000)
+    cluster.add_argument("--scale-radius", type=float, default=100.0)
+    cluster.add_argument("--mass", type=float, default=1e4, help="total mass")
+    planetary = generators.add_parser("keplerian", help="planets around a central star")
+    planetary.add_argument("--count", type=int, default=1000, help="planets")
+    planetary.add_argument("--star-mass", type=float, default=1e4)
+    planetary.add_argument("--planet-mass", type=float, default=1.0)
+    planetary.add_argument("--inner-radius", type=float, default=50.0)
+    planetary.add_argument("--outer-radius", type=float, default=300.0)
+    galaxies = generators.add_parser("galaxies", help="two colliding disc galaxies")
+    galaxies.add_argument("--count", type=int, default=20000, help="disc bodies of both galaxies")
+    galaxies.add_argument("--separation", type=float, default=600.0)
+    galaxies.add_argument("--impact-parameter", type=float, default=150.0)
+    galaxies.add_argument("--approach-speed", type=float, default=2.0)
+    galaxies.add_argument("--mass-ratio", type=float, default=1.0)
+    binary = generators.add_parser("binary", help="hierarchical binary of 2^levels bodies")
+    binary.add_argument("--levels", type=int, default=3)
+    binary.add_argument("--mass", type=float, default=1e4, help="total mass")
+    binary.add_argument("--separation", type=float, default=400.0, help="separation of the outermost pair")
+    binary.add_argument("--ratio", type=float, default=0.2, help="separation of a pair relative to the pair above")
+    args = parser.parse_args(argv)
+
+    center = tuple(args.center)
+    if args.generator == "disc":
+        system = uniformDisc(args.count, args.radius, args.mass, center, not args.random_velocities, args.body_radius, seed=args.seed)
+    elif args.generator == "plummer":
+        system = plummer(args.count, args.scale_radius, args.mass, center, bodyRadius=args.body_radius, seed=args.seed)
+    elif args.generator == "keplerian":
+        system = keplerian(args.count, args.star_mass, args.planet_mass, args.inner_radius, args.outer_radius, center,
+                           planetRadius=args.body_radius, seed=args.seed)
+    elif args.generator == "galaxies":
+        system = collidingGalaxies(args.count, args.separation, args.impact_parameter, args.approach_speed, args.mass_ratio,
+                                   center=center, bodyRadius=args.body_radius, seed=args.seed)
+    else:
+        system = hierarchicalBinary(args.levels, args.mass, args.separation, args.ratio, center, args.body_radius, seed=args.seed)
+    writeSystem(args.output, system)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,6 @@ import os
 from tkinter import filedialog
 from tkinter import messagebox
 
-from pyparsing import col
 from utility import *
 from tkinter.constants import NSEW
 
@@ -31,9 +30,13 @@ class Gui:
         self.__app = app
         self.__root = root
         self.__menuBar = tk.Menu(self.__root)
+        self.__image = None                     # PhotoImage of App render modes drawing into an image
+        self.__imageId = None
+        self.__panStart = (0, 0)                # last pointer position of a right button drag
         self.__initCanvas()
         self.__initMenuBar()
         self.__initOptionsBar()
+        self.__initViewMenu()
         self.__initToolbar()
         self.__initStatusBar()
         self.__configureRootColumnsAndRows()
@@ -130,6 +133,17 @@ class Gui:
         length_=self.__app.MAX_TRAJECTORY_POINTS/5
         )
 
+    def __addToolbarReplayPositionSlider(self):
+        variable = tk.IntVar()
+        self.__addToolbarSlider(
+            from__=0,
+            to_=1000,
+            command_=lambda event: self.__app.seekReplay(variable.get() / 1000),
+            labelText_="Replay position",
+            variable_=variable,
+            length_=self.__TIME_FACTOR_SLIDER_LENGTH
+        )
+
     def __addToolbarInitHorizontalVelocitySlider(self):
         variable = tk.DoubleVar()
         self.__addToolbarSlider(
@@ -217,6 +231,7 @@ class Gui:
         self.__addToolbarTrajectoryPointsSlider()
         self.__addToolbarInitHorizontalVelocitySlider()
         self.__addToolbarInitVerticalVelocitySlider()
+        self.__addToolbarReplayPositionSlider()
 
     def __initOptionsBar(self):
         self.__root["menu"] = self.__menuBar
@@ -229,8 +244,41 @@ class Gui:
                 fileMenu.add_command(label=label, underline=0,
                         command=command, accelerator=shortcut_text)
                 self.__root.bind(shortcut, command)
+        self.__backgroundWorkerVariable = tk.BooleanVar(value=self.__app.backgroundWorker)
+        fileMenu.add_checkbutton(label="Background physics", underline=0,
+                variable=self.__backgroundWorkerVariable, command=self.__toggleBackgroundWorker)
+        self.__conservationMonitorVariable = tk.BooleanVar(value=self.__app.conservationMonitor)
+        fileMenu.add_checkbutton(label="Conservation monitor", underline=1,
+                variable=self.__conservationMonitorVariable,
+                command=lambda: self.__app.useConservationMonitor(self.__conservationMonitorVariable.get()))
+        self.__profilerOverlayVariable = tk.BooleanVar(value=self.__app.profilerOverlay)
+        fileMenu.add_checkbutton(label="Profiler overlay", underline=2,
+                variable=self.__profilerOverlayVariable,
+                command=lambda: setattr(self.__app, 'profilerOverlay', self.__profilerOverlayVariable.get()))
+        fileMenu.add_command(label="Save profiler trace...", underline=5, command=self.__saveProfilerTrace)
+        self.__replayReversedVariable = tk.BooleanVar(value=False)
+        fileMenu.add_checkbutton(label="Reverse replay", underline=1,
+                variable=self.__replayReversedVariable,
+                command=lambda: setattr(self.__app, 'replayReversed', self.__replayReversedVariable.get()))
+        fileMenu.add_separator()
+        self.__renderModeVariable = tk.StringVar(value=self.__app.renderMode)
+        self.__trailsVariable = tk.BooleanVar(value=self.__app.trails)
+        for label, mode in (("Draw sprites", "sprites"), ("Draw into image", "bodies"), ("Draw density", "density")):
+            fileMenu.add_radiobutton(label=label, underline=5, value=mode,
+                    variable=self.__renderModeVariable, command=self.__changeRenderMode)
+        fileMenu.add_checkbutton(label="Trails", underline=0,
+                variable=self.__trailsVariable, command=self.__changeRenderMode)
+        for shortcut, frames in (("<Left>", -1), ("<Right>", 1), ("<Shift-Left>", -10), ("<Shift-Right>", 10)):
+            self.__root.bind(shortcut, lambda event, frames=frames: self.__app.stepReplay(frames))
         self.__menuBar.add_cascade(label="Options", menu=fileMenu, underline=0)
 
+    def __changeRenderMode(self):              # trails exist only when drawing into an image
+        self.__app.setRenderMode(self.__renderModeVariable.get(), self.__trailsVariable.get())
+        self.__trailsVariable.set(self.__app.trails)
+
+    def __toggleBackgroundWorker(self):
+        self.__app.useBackgroundWorker(self.__backgroundWorkerVariable.get())
+
     def __initMenuBar(self):
         self.__root["menu"] = self.__menuBar
         fileMenu = tk.Menu(self.__menuBar)
@@ -239,20 +287,62 @@ class Gui:
                 ("Open...", self.__loadFromFile, "Ctrl+O", "<Control-o>"),
                 ("Save", self.__saveToFile, "Ctrl+S", "<Control-s>"),
                 (None, None, None, None),
+                ("Record...", self.__startRecording, None, None),
+                ("Stop recording", self.__app.stopRecording, None, None),
+                ("Open recording...", self.__openReplay, None, None),
+                ("Close recording", self.__app.closeReplay, None, None),
+                (None, None, None, None),
                 ("Quit", self.quit, "Ctrl+Q", "<Control-q>")):
             if label is None:
                 fileMenu.add_separator()
             else:
                 fileMenu.add_command(label=label, underline=0,
                         command=command, accelerator=shortcut_text)
-                self.__root.bind(shortcut, command)
+                if shortcut is not None:
+                    self.__root.bind(shortcut, command)
         self.__menuBar.add_cascade(label="File", menu=fileMenu, underline=0)
 
     def __initCanvas(self):
         self.__canvas = tk.Canvas(self.__root, background=Gui.colorOf("canvas"))
-        self.__canvas.bind("<Button-1>", lambda event: self.__app.addUserDefinedCelestialBody(position_=Vector(event.x, event.y)))
+        self.__canvas.bind("<Button-1>", lambda event: self.__app.addUserDefinedCelestialBody(position_=self.__worldPoint(event)))
+        self.__canvas.bind("<Control-Button-1>", lambda event: self.__app.followNearestBody(self.__worldPoint(event)))
+        self.__canvas.bind("<ButtonPress-3>", self.__startPan)
+        self.__canvas.bind("<B3-Motion>", self.__pan)
+        self.__canvas.bind("<MouseWheel>", lambda event: self.__zoom(event, 1.25 if event.delta > 0 else 0.8))
+        self.__canvas.bind("<Button-4>", lambda event: self.__zoom(event, 1.25))     # X11 wheel
+        self.__canvas.bind("<Button-5>", lambda event: self.__zoom(event, 0.8))
         self.__canvas.grid(row=1, column=0, padx=0, pady=0, sticky=NSEW)
 
+    def __worldPoint(self, event):
+        return Vector(*self.__app.camera.toWorld(event.x, event.y))
+
+    def __startPan(self, event):
+        self.__panStart = (event.x, event.y)
+
+    def __pan(self, event):
+        self.__app.camera.pan(event.x - self.__panStart[0], event.y - self.__panStart[1])
+        self.__panStart = (event.x, event.y)
+
+    def __zoom(self, event, factor):
+        self.__app.camera.zoomAt(factor, event.x, event.y)
+
+    def __zoomCenter(self, factor):
+        width, height = self.canvasSize()
+        self.__app.camera.zoomAt(factor, width / 2, height / 2)
+
+    def __initViewMenu(self):
+        viewMenu = tk.Menu(self.__menuBar)
+        for label, command, shortcut_text, shortcut in (
+                ("Zoom in", lambda *args: self.__zoomCenter(1.25), "+", "<plus>"),
+                ("Zoom out", lambda *args: self.__zoomCenter(0.8), "-", "<minus>"),
+                ("Reset view", lambda *args: self.__app.camera.reset(), "Home", "<Home>"),
+                ("Follow center of mass", lambda *args: self.__app.camera.followCenterOfMass(), None, None),
+                ("Stop following", lambda *args: self.__app.camera.stopFollowing(), None, None)):
+            viewMenu.add_command(label=label, underline=0, command=command, accelerator=shortcut_text)
+            if shortcut is not None:
+                self.__root.bind(shortcut, command)
+        self.__menuBar.add_cascade(label="View", menu=viewMenu, underline=0)
+
     def __configureRootColumnsAndRows(self):
         self.__root.columnconfigure(0, weight=10)
         self.__root.rowconfigure(0, weight=1)
@@ -261,17 +351,44 @@ class Gui:
     def __loadFromFile(self):
         filename = tk.filedialog.askopenfilename(parent=self.__root,
         title="Choose file:",
-        filetypes=[("JSON files", ".json")])
-        self.__app.loadFromFile(filename)
+        filetypes=[("JSON files", ".json"), ("Snapshot files", ".snap")])
+        if filename:
+            self.__app.loadFromFile(filename)
 
     def __saveToFile(self):
-        filename = tk.filedialog.askopenfilename(parent=self.__root,
+        filename = tk.filedialog.asksaveasfilename(parent=self.__root,
         title="Choose file:",
-        filetypes=[("JSON files", ".json")])
-        self.__app.saveCurrentStateToFile(filename)
+        filetypes=[("JSON files", ".json"), ("Snapshot files", ".snap")])
+        if filename:
+            self.__app.saveCurrentStateToFile(filename)
+
+    def __startRecording(self):
+        filename = tk.filedialog.asksaveasfilename(parent=self.__root,
+        title="Record to file:",
+        filetypes=[("Recordings", ".rec")])
+        if filename:
+            self.__app.startRecording(filename)
+
+    def __saveProfilerTrace(self):
+        filename = tk.filedialog.asksaveasfilename(parent=self.__root,
+        title="Save trace:",
+        filetypes=[("Chrome trace", ".json")])
+        if filename:
+            self.__app.saveProfilerTrace(filename)
+
+    def __openReplay(self):
+        filename = tk.filedialog.askopenfilename(parent=self.__root,
+        title="Choose recording:",
+        filetypes=[("Recordings", ".rec")])
+        if filename:
+            try:
+                self.__app.openReplay(filename)
+            except (OSError, ValueError) as err:
+                messagebox.showerror("Cannot open recording", str(err))
+            self.__replayReversedVariable.set(False)
 
-    def guiLoop(self, func):
-        self.__canvas.after(5, func)
+    def guiLoop(self, func, delayMs=5):
+        self.__canvas.after(delayMs, func)
 
     def addSprite(self, sprite : Sprite) -> int:
         return self.__canvas.create_oval(
@@ -286,12 +403,74 @@ class Gui:
         self.__canvas.coords(spriteId, position)
 
 
+    @staticmethod
+    def coordsScript(canvasPath, shapeIds, coords):         # Tcl script setting coords of many canvas items
+        return "\n".join(
+            f'{canvasPath} coords {shapeId} {" ".join(map("{:.2f}".format, shapeCoords))}'
+            for shapeId, shapeCoords in zip(shapeIds, coords)
+        )
+
+    def setShapesCoords(self, shapeIds, coords):            # many canvas coords changes in a single Tcl call
+        script = Gui.coordsScript(str(self.__canvas), shapeIds, coords)
+        if script:
+            self.__canvas.tk.eval(script)
+
+    def canvasSize(self):
+        return self.__canvas.winfo_width(), self.__canvas.winfo_height()
+
+    def colorToRgb(self, color):                # any Tk color name as (r, g, b) in 0..255
+        return tuple(channel >> 8 for channel in self.__root.winfo_rgb(color))
+
+    def drawImage(self, ppmData):               # one PhotoImage in the top left corner, created on first use
+        if self.__image is None:
+            self.__image = tk.PhotoImage(master=self.__root)
+            self.__imageId = self.__canvas.create_image(0, 0, image=self.__image, anchor=NW)
+        self.__image.configure(data=ppmData, format="PPM")
+
+    def clearImage(self):
+        if self.__image is not None:
+            self.__canvas.delete(self.__imageId)
+            self.__image = None
+            self.__imageId = None
+
+    def addPoint(self, color) -> int:           # placed by setShapesCoords with a box
+        return self.__canvas.create_rectangle(0, 0, 0, 0, fill=color, outline="")
+
+    @staticmethod
+    def createOvalsScript(canvasPath, boxes, colors):       # Tcl script creating ovals, its result is the list of their ids
+        return "set ids {}\n" + "".join(
+            f'lappend ids [{canvasPath} create oval {" ".join(map("{:.2f}".format, box))} -fill {{{color}}}]\n'
+            for box, color in zip(boxes, colors)
+        ) + "set ids"
+
+    def addSprites(self, boxes, colors) -> list:           # many ovals in a single Tcl call, ids in the given order
+        if not len(colors):
+            return []
+        result = self.__canvas.tk.eval(Gui.createOvalsScript(str(self.__canvas), boxes, colors))
+        return [int(id) for id in self.__canvas.tk.splitlist(result)]
+
     def addLine(self, coords, color) -> int:
-        return self.__canvas.create_line(coords, fill=color)
+        return self.__canvas.create_line(*coords, fill=color)
+
+    @staticmethod
+    def extendLinesScript(canvasPath, lineIds, points, dropCounts):    # Tcl script appending a point to every line
+        return "\n".join(
+            f'{canvasPath} insert {lineId} end {{{x:.2f} {y:.2f}}}' + (f'\n{canvasPath} dchars {lineId} 0 {2 * drop - 1}' if drop else "")
+            for lineId, (x, y), drop in zip(lineIds, points, dropCounts)
+        )
+
+    def extendLines(self, lineIds, points, dropCounts):    # appends one point per line, drops its oldest dropCounts points
+        script = Gui.extendLinesScript(str(self.__canvas), lineIds, points, dropCounts)
+        if script:
+            self.__canvas.tk.eval(script)
 
     def removeShape(self, shapeId):
         self.__canvas.delete(shapeId)
 
+    def removeShapes(self, shapeIds):
+        if shapeIds:
+            self.__canvas.delete(*shapeIds)
+
     def quit(self):
         reply = tk.messagebox.askyesno(
                     "quit",
@@ -299,4 +478,5 @@ class Gui:
                     parent=self.__root
                     )
         if reply:
+            self.__app.shutdown()
             self.__root.destroy()
@@ -0,0 +1,247 @@
+import argparse
+import os
+import Scenario
+import Checkpoint
+from Body import Body
+from utility import Vector
+from Engine import Engine, DirectSolver, ReferenceSolver
+from BarnesHut import BarnesHutSolver
+from Kernels import CompiledSolver
+from Integrators import INTEGRATORS, createIntegrator, integratorName
+from Collisions import CollisionHandler
+from Recorder import Recorder
+from Profiler import Profiler
+from Diagnostics import ConservationMonitor
+
+
+SOLVERS = ("direct", "compiled", "barnes-hut", "reference")
+
+
+def createSolver(name, theta=0.5):
+    if name == "direct":
+        return DirectSolver()
+    if name == "compiled":
+        return CompiledSolver()
+    if name == "barnes-hut":
+        return BarnesHutSolver(theta)
+    if name == "reference":
+        return ReferenceSolver()
+    raise ValueError(f'Unknown force solver {name}')
+
+
+def solverName(solver):
+    if isinstance(solver, BarnesHutSolver):
+        return "barnes-hut"
+    if isinstance(solver, CompiledSolver):
+        return "compiled"
+    if isinstance(solver, ReferenceSolver):
+        return "reference"
+    if isinstance(solver, DirectSolver):
+        return "direct"
+    raise ValueError(f'Unknown force solver {type(solver).__name__}')
+
+
+# Runs a simulation with a fixed timestep and without any GUI, as fast as the CPU allows
+class HeadlessSimulation:
+
+    def __init__(self, forceSolver=None, integrator=None, collisionHandler=None):
+        self.__engine = Engine(forceSolver, integrator, collisionHandler)
+        self.__bodies = {}                  # handle : Body
+        self.__steps = 0
+        self.__time = 0.0
+        self.__recorder = None
+        self.__monitor = None
+        self.__monitorState = None          # from a checkpoint, applied to the monitor once one is set
+
+    @classmethod
+    def fromCheckpoint(cls, filename):      # returns (simulation, timestep of the checkpointed run)
+        data = Checkpoint.readCheckpoint(filename)
+        metadata = data.metadata
+        integrator = createIntegrator(metadata["integrator"]["name"])
+        if metadata["integrator"]["state"] is not None:
+            integrator.setState(metadata["integrator"]["state"])
+        collisionHandler = None
+        if metadata["collisions"] is not None:
+            collisionHandler = CollisionHandler()
+            collisionHandler.setState(metadata["collisions"])
+        simulation = cls(createSolver(metadata["solver"]["name"], metadata["solver"]["theta"]), integrator, collisionHandler)
+        simulation.__restore(data)
+        return simulation, metadata["deltaTime"]
+
+    def __restore(self, data):
+        state = data.engineState
+        for handle, color, mass, radius, position, velocity in zip(state["handles"], data.colors, state["masses"],
+                                                                   state["radii"], state["positions"], state["velocities"]):
+            body = Body(float(radius), float(mass), color, Vector(*map(float, position)), Vector(*map(float, velocity)))
+            body.attach(self.__engine, int(handle))
+            self.__bodies[body.handle] = body
+        self.__engine.setState(state)       # exact accelerations and handle counter, not only positions
+        self.__steps = data.metadata["steps"]
+        self.__time = data.metadata["time"]
+        self.__monitorState = data.metadata.get("monitor")
+        Checkpoint.restoreGlobalState(data.metadata["globals"])
+
+    def saveCheckpoint(self, filename, deltaTime):
+        integrator = self.__engine.integrator
+        collisionHandler = self.__engine.collisionHandler
+        solver = self.__engine.forceSolver
+        Checkpoint.writeCheckpoint(filename, self.__engine, [self.__bodies[int(handle)].color for handle in self.__engine.handles], {
+            "steps": self.__steps,
+            "time": self.__time,
+            "deltaTime": deltaTime,
+            "solver": {"name": solverName(solver), "theta": getattr(solver, "theta", None)},
+            "integrator": {"name": integratorName(integrator),
+                           "state": integrator.getState() if hasattr(integrator, "getState") else None},
+            "collisions": collisionHandler.getState() if collisionHandler is not None else None,
+            "monitor": self.__monitor.getState() if self.__monitor is not None else None
+        })
+
+    @property
+    def engine(self):
+        return self.__engine
+
+    @property
+    def bodies(self):                       # in engine row order, which a resumed run restores exactly
+        return [self.__bodies[int(handle)] for handle in self.__engine.handles]
+
+    @property
+    def steps(self):
+        return self.__steps
+
+    @property
+    def time(self):
+        return self.__time
+
+    @property
+    def recorder(self):
+        return self.__recorder
+
+    @recorder.setter
+    def recorder(self, recorder):           # records current state right away, then every recorder.every steps
+        self.__recorder = recorder
+        if recorder is not None:
+            recorder.addColors(self.__bodies.keys(), [body.color for body in self.__bodies.values()])
+            recorder.recordEngine(self.__steps, self.__time, self.__engine)
+
+    @property
+    def monitor(self):
+        return self.__monitor
+
+    @monitor.setter
+    def monitor(self, monitor):             # ConservationMonitor updated after every step, continues a checkpointed one
+        self.__monitor = monitor
+        if monitor is not None and self.__monitorState is not None:
+            monitor.setState(self.__monitorState)
+            self.__monitorState = None
+        if monitor is not None and hasattr(self.__engine.forceSolver, "withPotential"):
+            self.__engine.forceSolver.withPotential = True      # potential energy comes with the forces
+
+    def addBody(self, body):
+        body.attach(self.__engine)
+        self.__bodies[body.handle] = body
+        if self.__recorder is not None:
+            self.__recorder.addColors([body.handle], [body.color])
+
+    def addBodies(self, masses, radii, positions, velocities, colors):    # bulk addBody from arrays, returns handles
+        handles = self.__engine.addMany(masses, radii, positions, velocities)
+        self.__bodies.update((handle, Body.fromEngine(self.__engine, handle, color))
+                             for handle, color in zip(handles.tolist(), colors))
+        if self.__recorder is not None:
+            self.__recorder.addColors(handles, colors)
+        return handles
+
+    def removeBodies(self, handles):        # handles of other bodies stay valid
+        handles = [int(handle) for handle in handles]
+        self.__engine.removeMany(handles)
+        for handle in handles:
+            del self.__bodies[handle]
+
+    def loadFromFile(self, filename):
+        self.addBodies(*Scenario.readArrays(filename))
+
+    def saveCurrentStateToFile(self, filename):
+        Scenario.writeBodies(filename, self.bodies)
+
+    def step(self, deltaTime):             # one step is one profiler frame
+        self.__engine.profiler.beginFrame()
+        for handle in self.__engine.step(deltaTime):
+            del self.__bodies[handle]
+        self.__steps += 1
+        self.__time += deltaTime
+        if self.__recorder is not None:
+            with self.__engine.profiler.phase("recording"):
+                self.__recorder.recordEngine(self.__steps, self.__time, self.__engine)
+        if self.__monitor is not None:
+            with self.__engine.profiler.phase("diagnostics"):
+                row = self.__monitor.update(self.__engine, self.__steps, self.__time)
+            if row is not None and self.__recorder is not None:
+                self.__recorder.recordDiagnostics(row)
+        self.__engine.profiler.endFrame()
+
+    # checkpoint every n-th step, 0 never. With minDeltaTime the timestep is halved, down to
+    # minDeltaTime, whenever the monitor reports energy drift over its tolerance. Returns the last timestep.
+    def run(self, steps, deltaTime, checkpointPath=None, checkpointEvery=0, minDeltaTime=None):
+        for _ in range(steps):
+            self.step(deltaTime)
+            if minDeltaTime and self.__monitor is not None and self.__monitor.exceeded and deltaTime / 2 >= minDeltaTime:
+                deltaTime /= 2
+                self.__monitor.rebase(self.__engine)
+            if checkpointPath and checkpointEvery and self.__steps % checkpointEvery == 0:
+                self.saveCheckpoint(checkpointPath, deltaTime)
+        return deltaTime
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a scenario without GUI")
+    parser.add_argument("scenario", help="scenario file in the format used by App.loadFromFile")
+    parser.add_argument("output", help="file for the final state")
+    parser.add_argument("--steps", type=int, default=1000, help="total steps, a resumed run does only the remaining ones")
+    parser.add_argument("--dt", type=float, default=0.025, help="fixed timestep")
+    parser.add_argument("--solver", choices=SOLVERS, default="direct")
+    parser.add_argument("--theta", type=float, default=0.5, help="opening angle for barnes-hut")
+    parser.add_argument("--integrator", choices=tuple(INTEGRATORS), default="euler")
+    parser.add_argument("--collisions", choices=CollisionHandler.MODES, default=None)
+    parser.add_argument("--record", default=None, help="file for the recorded history")
+    parser.add_argument("--record-every", type=int, default=1, help="record every n-th step")
+    parser.add_argument("--compression", type=int, default=0, help="zlib level of recorded chunks, 0 is none")
+    parser.add_argument("--checkpoint", default=None, help="file for periodic checkpoints of the full state")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="steps between checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from --checkpoint if it exists, its solver, integrator, collisions and dt are used")
+    parser.add_argument("--profile", default=None, help="file for a chrome trace of the run, timings are printed")
+    parser.add_argument("--diagnostics", default=None, help="csv file for energy, momenta and center of mass")
+    parser.add_argument("--diagnostics-every", type=int, default=10)
+    parser.add_argument("--energy-tolerance", type=float, default=None, help="relative energy drift which halves dt")
+    parser.add_argument("--min-dt", type=float, default=None, help="dt is not halved below this, required for halving")
+    args = parser.parse_args(argv)
+
+    deltaTime = args.dt
+    resumeStep = None                       # recording and diagnostics of a resumed run are continued from here
+    if args.resume and args.checkpoint and os.path.exists(args.checkpoint):
+        simulation, deltaTime = HeadlessSimulation.fromCheckpoint(args.checkpoint)
+        resumeStep = simulation.steps
+    else:
+        collisionHandler = CollisionHandler(args.collisions) if args.collisions else None
+        simulation = HeadlessSimulation(createSolver(args.solver, args.theta), createIntegrator(args.integrator), collisionHandler)
+        simulation.loadFromFile(args.scenario)
+    if args.profile:
+        simulation.engine.profiler = Profiler()
+    if args.record:
+        simulation.recorder = Recorder(args.record, args.record_every, compressionLevel=args.compression, resumeStep=resumeStep)
+    if args.diagnostics or args.energy_tolerance is not None:
+        simulation.monitor = ConservationMonitor(args.diagnostics_every, args.energy_tolerance, args.diagnostics, resumeStep)
+    deltaTime = simulation.run(max(args.steps - simulation.steps, 0), deltaTime, args.checkpoint, args.checkpoint_every, args.min_dt)
+    if args.checkpoint:
+        simulation.saveCheckpoint(args.checkpoint, deltaTime)
+    simulation.saveCurrentStateToFile(args.output)
+    if simulation.monitor is not None:
+        simulation.monitor.close()
+    if args.profile:
+        simulation.engine.profiler.dumpTrace(args.profile)
+        print(simulation.engine.profiler.summaryText())
+    if args.record:
+        simulation.recorder.close()
+
+
+if __name__ == "__main__":
+    main()
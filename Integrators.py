@@ -0,0 +1,143 @@
+import numpy as np
+
+# Integrators advance all engine bodies by deltaTime. Accelerations always come from the
+# engine's force solver, so every scheme works with every solver.
+
+
+class EulerIntegrator:                      # first order semi-implicit euler, the original Body scheme
+    forceEvaluations = 1
+
+    def step(self, engine, deltaTime):
+        accelerations = engine.computeAccelerations()
+        engine.velocities[:] += accelerations * deltaTime
+        engine.positions[:] += engine.velocities * deltaTime
+        engine.invalidateAccelerations()    # they belong to the positions before the drift
+
+
+class LeapfrogIntegrator:                   # velocity verlet (kick-drift-kick), second order and symplectic
+    forceEvaluations = 1
+
+    def step(self, engine, deltaTime):
+        if not engine.accelerationsValid:   # accelerations from the previous step are reused
+            engine.computeAccelerations()
+        engine.velocities[:] += engine.accelerations * (deltaTime / 2)
+        engine.positions[:] += engine.velocities * deltaTime
+        engine.computeAccelerations()
+        engine.velocities[:] += engine.accelerations * (deltaTime / 2)
+
+
+class YoshidaIntegrator:                    # fourth order symplectic, composition of three leapfrog steps
+    forceEvaluations = 3
+    __W1 = 1.0 / (2.0 - 2.0**(1.0 / 3.0))
+    __W0 = -2.0**(1.0 / 3.0) * __W1
+    __WEIGHTS = (__W1, __W0, __W1)
+
+    def step(self, engine, deltaTime):
+        if not engine.accelerationsValid:   # accelerations from the previous step are reused
+            engine.computeAccelerations()
+        for weight in self.__WEIGHTS:       # kick-drift-kick leapfrog substeps of weight * deltaTime
+            engine.velocities[:] += engine.accelerations * (weight * deltaTime / 2)
+            engine.positions[:] += engine.velocities * (weight * deltaTime)
+            engine.computeAccelerations()
+            engine.velocities[:] += engine.accelerations * (weight * deltaTime / 2)
+
+
+class RK4Integrator:                        # classic runge-kutta, not symplectic, used as accuracy reference
+    forceEvaluations = 4
+
+    def step(self, engine, deltaTime):
+        positions = engine.positions.copy()
+        velocities = engine.velocities.copy()
+        k1x, k1v = velocities, engine.accelerationsAt(positions)
+        k2x = velocities + k1v * (deltaTime / 2)
+        k2v = engine.accelerationsAt(positions + k1x * (deltaTime / 2))
+        k3x = velocities + k2v * (deltaTime / 2)
+        k3v = engine.accelerationsAt(positions + k2x * (deltaTime / 2))
+        k4x = velocities + k3v * deltaTime
+        k4v = engine.accelerationsAt(positions + k3x * deltaTime)
+        engine.positions[:] = positions + (k1x + 2 * k2x + 2 * k3x + k4x) * (deltaTime / 6)
+        engine.velocities[:] = velocities + (k1v + 2 * k2v + 2 * k3v + k4v) * (deltaTime / 6)
+        engine.invalidateAccelerations()    # none of the four passes was at the new positions
+
+
+# Hierarchical (block) timesteps on top of leapfrog. Every body gets the largest step
+# deltaTime / 2^level not exceeding eta * sqrt(radius / |acceleration|), so tightly bound bodies
+# are substepped while the rest is kicked rarely. Only bodies finishing a step on a given tick
+# get their accelerations recomputed, inactive bodies just drift.
+class BlockTimestepIntegrator:
+
+    def __init__(self, eta=0.1, maxLevel=8):
+        if eta <= 0:
+            raise ValueError("Accuracy parameter eta has to be positive value")
+        if maxLevel < 0:
+            raise ValueError("Max level cannot be negative")
+        self.__eta = eta
+        self.__maxLevel = maxLevel
+        self.__lastEvaluations = 0
+
+    @property
+    def forceEvaluations(self):             # body force evaluations of the last step divided by body count
+        return self.__lastEvaluations
+
+    def getState(self) -> dict:
+        return {"eta": self.__eta, "maxLevel": self.__maxLevel, "lastEvaluations": self.__lastEvaluations}
+
+    def setState(self, state):
+        self.__eta = state["eta"]
+        self.__maxLevel = state["maxLevel"]
+        self.__lastEvaluations = state["lastEvaluations"]
+
+    def levels(self, accelerations, radii, deltaTime):
+        magnitude = np.sqrt(np.einsum('ij,ij->i', accelerations, accelerations))
+        with np.errstate(divide='ignore'):
+            wanted = self.__eta * np.sqrt(radii / magnitude)
+            levels = np.ceil(np.log2(deltaTime / wanted))
+        return np.clip(np.nan_to_num(levels, nan=0.0, neginf=0.0), 0, self.__maxLevel).astype(np.int64)
+
+    def step(self, engine, deltaTime):
+        if not engine.accelerationsValid:
+            engine.computeAccelerations()
+        if engine.count == 0:
+            return
+        levels = self.levels(engine.accelerations, engine.radii, deltaTime)
+        finest = int(levels.max())
+        ticks = 1 << finest
+        tickTime = deltaTime / ticks
+        strides = 1 << (finest - levels)                       # ticks per step of every body
+        halfSteps = (deltaTime / (1 << levels) / 2)[:, np.newaxis]
+        evaluations = 0
+
+        engine.velocities[:] += engine.accelerations * halfSteps
+        for tick in range(1, ticks + 1):
+            engine.positions[:] += engine.velocities * tickTime
+            active = np.flatnonzero(tick % strides == 0)
+            if len(active) == engine.count:
+                engine.computeAccelerations()
+            else:
+                engine.computeAccelerations(active)
+            evaluations += len(active)
+            kick = halfSteps[active] if tick == ticks else 2 * halfSteps[active]   # closing half kick + next opening one
+            engine.velocities[active] += engine.accelerations[active] * kick
+        self.__lastEvaluations = evaluations / engine.count
+
+
+INTEGRATORS = {
+    "euler": EulerIntegrator,
+    "leapfrog": LeapfrogIntegrator,
+    "yoshida": YoshidaIntegrator,
+    "rk4": RK4Integrator,
+    "block": BlockTimestepIntegrator
+}
+
+
+def integratorName(integrator):             # key of the integrator's class in INTEGRATORS
+    for name, integratorClass in INTEGRATORS.items():
+        if type(integrator) is integratorClass:
+            return name
+    raise ValueError(f'Unknown integrator {type(integrator).__name__}')
+
+
+def createIntegrator(name):
+    if name not in INTEGRATORS:
+        raise ValueError(f'Unknown integrator {name}')
+    return INTEGRATORS[name]()
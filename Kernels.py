@@ -0,0 +1,83 @@
+import importlib.util
+import math
+import numpy as np
+from utility import *
+from Engine import DirectSolver
+
+# numba is optional and slow to import, so it is only looked up here and imported when a
+# CompiledSolver computes forces for the first time. Processes that never use it do not pay for it.
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+_kernel = None                              # compiled _accelerations, created by _compiledKernel
+prange = range                              # numba.prange once numba is imported
+
+
+def _accelerations(positions, masses, radii, targets, gValue, withPotential, result, potentials):
+    # One target per iteration, spread over all cores by numba.prange. Nothing of size N^2 is
+    # allocated, every target row keeps its sums in registers. Same clamped law as DirectSolver.
+    count = len(masses)
+    for row in prange(len(targets)):
+        i = targets[row]
+        x, y, radius = positions[i, 0], positions[i, 1], radii[i]
+        accelerationX, accelerationY, potential = 0.0, 0.0, 0.0
+        for j in range(count):
+            if j == i:
+                continue
+            deltaX = positions[j, 0] - x
+            deltaY = positions[j, 1] - y
+            distance = math.sqrt(deltaX * deltaX + deltaY * deltaY)
+            contact = radius + radii[j]
+            if withPotential:
+                ratio = distance / contact
+                potential += masses[j] * (0.5 * ratio * ratio if ratio < 1.0 else math.log(ratio) + 0.5)
+            if distance < contact:
+                distance = contact
+            factor = masses[j] / (distance * distance)
+            accelerationX += factor * deltaX
+            accelerationY += factor * deltaY
+        result[row, 0] = gValue * accelerationX
+        result[row, 1] = gValue * accelerationY
+        potentials[row] = masses[i] * potential
+
+
+def _compiledKernel():
+    global _kernel, prange
+    if _kernel is None:
+        import numba
+        prange = numba.prange
+        _kernel = numba.njit(parallel=True, cache=True)(_accelerations)
+    return _kernel
+
+
+# Direct summation compiled with numba when it is installed, otherwise the numpy DirectSolver.
+# Both give the same forces up to floating point summation order.
+class CompiledSolver:
+
+    def __init__(self, withPotential=False, tileElements=1 << 20):
+        self.__fallback = None if NUMBA_AVAILABLE else DirectSolver(withPotential, tileElements)
+        self.withPotential = withPotential
+        self.__lastPotentialEnergy = None
+
+    @property
+    def backend(self):
+        return "numpy" if self.__fallback is not None else "numba"
+
+    @property
+    def lastPotentialEnergy(self):          # of the last full pass with withPotential, otherwise None
+        if self.__fallback is not None:
+            return self.__fallback.lastPotentialEnergy
+        return self.__lastPotentialEnergy
+
+    def accelerations(self, positions, masses, radii, targets=None):   # targets: rows to compute, all by default
+        if self.__fallback is not None:
+            self.__fallback.withPotential = self.withPotential
+            return self.__fallback.accelerations(positions, masses, radii, targets)
+        full = targets is None
+        targets = np.arange(len(masses)) if targets is None else np.asarray(targets, dtype=np.int64)
+        withPotential = full and self.withPotential
+        result = np.empty((len(targets), 2))
+        potentials = np.zeros(len(targets))
+        gValue = Const.getGValue()
+        _compiledKernel()(np.ascontiguousarray(positions, dtype=np.float64), np.ascontiguousarray(masses, dtype=np.float64),
+                          np.ascontiguousarray(radii, dtype=np.float64), targets, gValue, withPotential, result, potentials)
+        self.__lastPotentialEnergy = 0.5 * gValue * float(np.sum(potentials)) if withPotential else None
+        return result
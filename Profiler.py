@@ -0,0 +1,115 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+import numpy as np
+
+# Phases may nest (forces run inside integration), statistics use exclusive time of every phase,
+# so per-frame times of all phases add up to the measured part of the frame. The trace keeps
+# inclusive intervals, chrome://tracing or Perfetto draw them nested.
+
+_NO_PHASE = contextlib.nullcontext()
+
+
+class Profiler:
+
+    def __init__(self, window=300, maxTraceEvents=200000, enabled=True):
+        if window < 1:
+            raise ValueError("Profiler window cannot be lower than 1")
+        self.__enabled = enabled
+        self.__window = window
+        self.__samples = {}                 # phase : deque of per-frame seconds
+        self.__frameTimes = collections.deque(maxlen=window)
+        self.__frame = collections.defaultdict(float)
+        self.__frameStart = None
+        self.__stack = []                   # time spent in children of every open phase
+        self.__trace = collections.deque(maxlen=maxTraceEvents)     # (name, start, duration)
+        self.__origin = time.perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.__enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self.__enabled = value
+
+    @property
+    def phases(self):
+        return list(self.__samples.keys())
+
+    def phase(self, name):                  # context manager timing the block as one phase
+        if not self.__enabled:
+            return _NO_PHASE
+        return self.__phase(name)
+
+    @contextlib.contextmanager
+    def __phase(self, name):
+        self.__stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), self.__stack.pop())
+
+    def record(self, name, start, end, childrenTime=0.0):      # interval measured by the caller, perf_counter seconds
+        if not self.__enabled:
+            return
+        duration = end - start
+        if self.__stack:
+            self.__stack[-1] += duration
+        self.__frame[name] += duration - childrenTime
+        self.__trace.append((name, start, duration))
+
+    def beginFrame(self):
+        self.__frame.clear()
+        self.__frameStart = time.perf_counter()
+
+    def endFrame(self):
+        if not self.__enabled or self.__frameStart is None:
+            return
+        end = time.perf_counter()
+        self.__frameTimes.append(end - self.__frameStart)
+        self.__trace.append(("frame", self.__frameStart, end - self.__frameStart))
+        for name in self.__frame.keys() - self.__samples.keys():
+            self.__samples[name] = collections.deque(maxlen=self.__window)
+        for name, samples in self.__samples.items():
+            samples.append(self.__frame.get(name, 0.0))     # phases which did not run this frame count as 0
+        self.__frameStart = None
+
+    def percentiles(self, name, q=(50, 95, 99)):    # seconds, name "frame" gives whole frames
+        samples = self.__frameTimes if name == "frame" else self.__samples[name]
+        if not samples:
+            return np.zeros(len(q))
+        return np.percentile(np.fromiter(samples, dtype=float, count=len(samples)), q)
+
+    def summary(self) -> dict:              # phase : {"p50", "p95", "p99", "mean"} in seconds
+        result = {}
+        for name in ["frame"] + self.phases:
+            samples = self.__frameTimes if name == "frame" else self.__samples[name]
+            p50, p95, p99 = self.percentiles(name)
+            result[name] = {"p50": p50, "p95": p95, "p99": p99, "mean": float(np.mean(samples)) if samples else 0.0}
+        return result
+
+    def summaryText(self):                  # one line for the status bar, milliseconds
+        return "  ".join(f'{name} {1000 * stats["p50"]:.1f}/{1000 * stats["p95"]:.1f}'
+                         for name, stats in self.summary().items()) + "  (p50/p95 ms)"
+
+    def dumpTrace(self, filename):          # chrome trace event format, timestamps in microseconds
+        pid, tid = os.getpid(), threading.get_ident()
+        events = [{"name": name, "ph": "X", "ts": 1e6 * (start - self.__origin), "dur": 1e6 * duration,
+                   "pid": pid, "tid": tid} for name, start, duration in self.__trace]
+        with open(filename, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    def reset(self):
+        self.__samples.clear()
+        self.__frameTimes.clear()
+        self.__trace.clear()
+        self.__frame.clear()
+        self.__frameStart = None
+
+
+DISABLED = Profiler(window=1, maxTraceEvents=1, enabled=False)     # default of engines nobody profiles
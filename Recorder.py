@@ -0,0 +1,268 @@
+import collections
+import json
+import os
+import queue
+import threading
+import zlib
+import numpy as np
+
+# A recording is three files:
+#   <path>          header followed by append-only chunks of frames, chunks may be zlib compressed
+#   <path>.idx      one INDEX_RECORD per frame, frame i can be found without reading anything else
+#   <path>.colors   json lines {"handle": ..., "color": ...}, one line per body ever recorded
+#   <path>.diagnostics  json lines with Diagnostics.FIELDS, empty when none were recorded
+# Frame layout: handles int64[count], positions float64[count][2], velocities float64[count][2], radii float64[count]
+
+MAGIC = b"PSIMREC1"
+INDEX_RECORD = np.dtype([("step", "<u8"), ("time", "<f8"), ("count", "<u8"),
+                         ("chunkOffset", "<u8"), ("chunkSize", "<u8"), ("frameOffset", "<u8")])
+_FILE_HEADER = np.dtype([("magic", "S8"), ("compressed", "<u4"), ("reserved", "<u4")])
+_BYTES_PER_BODY = 8 + 16 + 16 + 8
+
+Frame = collections.namedtuple("Frame", "step time handles positions velocities radii")
+
+
+def _frameArrays(buffer, offset, count):
+    handles = np.frombuffer(buffer, dtype="<i8", count=count, offset=offset)
+    offset += 8 * count
+    positions = np.frombuffer(buffer, dtype="<f8", count=2 * count, offset=offset).reshape(count, 2)
+    offset += 16 * count
+    velocities = np.frombuffer(buffer, dtype="<f8", count=2 * count, offset=offset).reshape(count, 2)
+    offset += 16 * count
+    radii = np.frombuffer(buffer, dtype="<f8", count=count, offset=offset)
+    return handles, positions, velocities, radii
+
+
+# Records every N-th step. record() only copies arrays into a queue, a background thread
+# packs frames into chunks and writes them, so the step loop waits for the disk only when
+# maxQueued items are still waiting. An error of the writer is raised by the next record or close.
+# With resumeStep an existing recording is continued: everything recorded after that step,
+# by a run that went on past its last checkpoint, is cut off and new frames are appended.
+class Recorder:
+
+    def __init__(self, path, every=1, chunkFrames=64, compressionLevel=0, resumeStep=None, maxQueued=256):
+        if every < 1:
+            raise ValueError("Recording interval cannot be lower than 1")
+        if chunkFrames < 1:
+            raise ValueError("Frames in chunk cannot be lower than 1")
+        self.__path = path
+        self.__every = every
+        self.__chunkFrames = chunkFrames
+        self.__compressionLevel = compressionLevel
+        self.__nextStep = 0
+        self.__knownColors = set()
+        self.__queue = queue.Queue(maxQueued)
+        self.__error = None                 # exception that stopped the writer thread
+        if resumeStep is not None and os.path.exists(path) and os.path.exists(path + ".idx"):
+            self.__truncateAfter(resumeStep)
+        else:
+            header = np.zeros(1, dtype=_FILE_HEADER)
+            header[0] = (MAGIC, 1 if compressionLevel else 0, 0)
+            with open(path, "wb") as file:
+                file.write(header.tobytes())
+            open(path + ".idx", "wb").close()
+            open(path + ".colors", "w").close()
+            open(path + ".diagnostics", "w").close()
+        self.__thread = threading.Thread(target=self.__writerLoop, daemon=True)
+        self.__thread.start()
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def every(self):
+        return self.__every
+
+    def addColors(self, handles, colors):   # colors of bodies, needed only for replay
+        lines = [(int(handle), color) for handle, color in zip(handles, colors) if int(handle) not in self.__knownColors]
+        if lines:
+            self.__knownColors.update(handle for handle, _ in lines)
+            self.__put(("colors", lines))
+
+    def recordDiagnostics(self, row):       # dict of conserved quantities, see Diagnostics.ConservationMonitor
+        self.__put(("diagnostics", dict(row)))
+
+    def record(self, step, time, handles, positions, velocities, radii):
+        if self.__error is not None:
+            raise self.__error
+        if step < self.__nextStep:
+            return False
+        self.__nextStep = step - step % self.__every + self.__every
+        frame = np.concatenate((
+            np.asarray(handles, dtype="<i8").view(np.uint8),
+            np.ascontiguousarray(positions, dtype="<f8").view(np.uint8).ravel(),
+            np.ascontiguousarray(velocities, dtype="<f8").view(np.uint8).ravel(),
+            np.ascontiguousarray(radii, dtype="<f8").view(np.uint8)
+        ))
+        self.__put(("frame", (step, time, len(handles), frame)))
+        return True
+
+    def recordEngine(self, step, time, engine):
+        return self.record(step, time, engine.handles, engine.positions, engine.velocities, engine.radii)
+
+    def close(self):                        # waits until everything queued is on disk
+        self.__put(("close", None))
+        self.__thread.join()
+        if self.__error is not None:
+            raise self.__error
+
+    def __put(self, item):                  # blocks while the queue is full, raises once the writer failed
+        while True:
+            if self.__error is not None:
+                raise self.__error
+            try:
+                self.__queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __truncateAfter(self, step):
+        header = np.fromfile(self.__path, dtype=_FILE_HEADER, count=1)
+        if len(header) == 0 or header[0]["magic"] != MAGIC:
+            raise ValueError(f'{self.__path} is not a recording')
+        if bool(header[0]["compressed"]) != bool(self.__compressionLevel):
+            raise ValueError(f'{self.__path} was recorded {"with" if header[0]["compressed"] else "without"} compression')
+        index = np.fromfile(self.__path + ".idx", dtype=INDEX_RECORD)
+        count = int(np.searchsorted(index["step"], step, side="right"))
+        kept = index[:count]
+        end = _FILE_HEADER.itemsize
+        if len(kept):
+            chunkOffset, chunkSize = int(kept[-1]["chunkOffset"]), int(kept[-1]["chunkSize"])
+            if count < len(index) and index[count]["chunkOffset"] == chunkOffset:     # chunk is cut after the last kept frame
+                chunkSize = int(kept[-1]["frameOffset"]) + _BYTES_PER_BODY * int(kept[-1]["count"])
+                if self.__compressionLevel:
+                    with open(self.__path, "r+b") as data:
+                        data.seek(chunkOffset)
+                        chunk = zlib.compress(zlib.decompress(data.read(int(kept[-1]["chunkSize"])))[:chunkSize],
+                                              self.__compressionLevel)
+                        data.seek(chunkOffset)
+                        data.write(chunk)
+                    chunkSize = len(chunk)
+                kept["chunkSize"][kept["chunkOffset"] == chunkOffset] = chunkSize
+            end = chunkOffset + chunkSize
+        os.truncate(self.__path, end)       # also drops chunks written after the last index record
+        with open(self.__path + ".idx", "wb") as file:
+            file.write(kept.tobytes())
+        if len(kept):
+            lastStep = int(kept[-1]["step"])
+            self.__nextStep = lastStep - lastStep % self.__every + self.__every
+        if os.path.exists(self.__path + ".colors"):
+            with open(self.__path + ".colors") as file:
+                self.__knownColors.update(json.loads(line)["handle"] for line in file if line.strip())
+        if os.path.exists(self.__path + ".diagnostics"):
+            with open(self.__path + ".diagnostics") as file:
+                lines = [line for line in file if line.strip() and json.loads(line)["step"] <= step]
+            with open(self.__path + ".diagnostics", "w") as file:
+                file.writelines(lines)
+
+    def __writerLoop(self):
+        try:
+            self.__write()
+        except Exception as err:
+            self.__error = err
+
+    def __write(self):
+        frames = []
+        with open(self.__path, "ab") as data, open(self.__path + ".idx", "ab") as index, \
+                open(self.__path + ".colors", "a") as colors, open(self.__path + ".diagnostics", "a") as diagnostics:
+            while True:
+                kind, item = self.__queue.get()
+                if kind == "colors":
+                    colors.write("".join(json.dumps({"handle": handle, "color": color}) + "\n" for handle, color in item))
+                    colors.flush()
+                elif kind == "diagnostics":
+                    diagnostics.write(json.dumps(item) + "\n")
+                    diagnostics.flush()
+                elif kind == "frame":
+                    frames.append(item)
+                if frames and (len(frames) >= self.__chunkFrames or kind == "close"):
+                    self.__writeChunk(data, index, frames)
+                    frames = []
+                if kind == "close":
+                    return
+
+    def __writeChunk(self, data, index, frames):
+        chunk = b"".join(frame.tobytes() for _, _, _, frame in frames)
+        if self.__compressionLevel:
+            chunk = zlib.compress(chunk, self.__compressionLevel)
+        chunkOffset = data.tell()
+        data.write(chunk)
+        data.flush()
+        records = np.zeros(len(frames), dtype=INDEX_RECORD)
+        frameOffset = 0
+        for i, (step, time, count, frame) in enumerate(frames):
+            records[i] = (step, time, count, chunkOffset, len(chunk), frameOffset)
+            frameOffset += len(frame)
+        index.write(records.tobytes())      # index goes last, readers never see a frame without data
+        index.flush()
+
+
+# Random access to frames of a recording, also while it is still being written (see refresh).
+# Uncompressed frames are views of a memory map, compressed chunks are inflated on demand.
+class RecordingReader:
+
+    def __init__(self, path):
+        self.__path = path
+        self.refresh()
+
+    def refresh(self):
+        header = np.fromfile(self.__path, dtype=_FILE_HEADER, count=1)
+        if len(header) == 0 or header[0]["magic"] != MAGIC:
+            raise ValueError(f'{self.__path} is not a recording')
+        self.__compressed = bool(header[0]["compressed"])
+        self.__cachedChunk = (None, None)   # (offset, bytes) of the last inflated chunk
+        self.__index = np.fromfile(self.__path + ".idx", dtype=INDEX_RECORD)
+        self.__data = np.memmap(self.__path, dtype=np.uint8, mode="r") if len(self.__index) else None
+        self.__colors = None
+
+    def __len__(self):
+        return len(self.__index)
+
+    @property
+    def steps(self):
+        return self.__index["step"]
+
+    @property
+    def times(self):
+        return self.__index["time"]
+
+    @property
+    def colors(self):                       # handle : color
+        if self.__colors is None:
+            self.__colors = {}
+            if os.path.exists(self.__path + ".colors"):
+                with open(self.__path + ".colors") as file:
+                    for line in file:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self.__colors[entry["handle"]] = entry["color"]
+        return self.__colors
+
+    @property
+    def diagnostics(self):                  # list of dicts with Diagnostics.FIELDS, empty when none were recorded
+        if not os.path.exists(self.__path + ".diagnostics"):
+            return []
+        with open(self.__path + ".diagnostics") as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def frameIndexAtStep(self, step):       # last frame recorded at or before step
+        return max(int(np.searchsorted(self.__index["step"], step, side="right")) - 1, 0)
+
+    def frame(self, i) -> Frame:
+        if not -len(self.__index) <= i < len(self.__index):
+            raise IndexError(f'Frame {i} out of range')
+        record = self.__index[i]
+        count = int(record["count"])
+        if self.__compressed:
+            buffer = self.__chunk(int(record["chunkOffset"]), int(record["chunkSize"]))
+            offset = int(record["frameOffset"])
+        else:
+            buffer = self.__data
+            offset = int(record["chunkOffset"] + record["frameOffset"])
+        return Frame(int(record["step"]), float(record["time"]), *_frameArrays(buffer, offset, count))
+
+    def __chunk(self, offset, size):
+        if self.__cachedChunk[0] != offset:
+            self.__cachedChunk = (offset, zlib.decompress(self.__data[offset:offset + size]))
+        return self.__cachedChunk[1]
@@ -0,0 +1,126 @@
+import numpy as np
+
+# Draws all bodies into one RGB image, which the GUI shows as a single PhotoImage. Cost per
+# frame is a few passes over the pixels plus one vectorized scatter of the bodies, no canvas
+# item per body. Modes:
+#   bodies   every body as a disc of its color, the same box as Sprite.getBoundingBoxCoords
+#   density  bodies per pixel, log scaled through a heat colormap, for regions too dense for discs
+
+MODES = ("bodies", "density")
+_MAX_DISC_RADIUS = 16                       # pixels, bigger bodies are drawn with this radius
+
+
+def _heatColormap():                        # 256 colors black -> red -> yellow -> white
+    levels = np.linspace(0.0, 1.0, 256)
+    return (255 * np.column_stack((np.clip(3 * levels, 0, 1), np.clip(3 * levels - 1, 0, 1),
+                                   np.clip(3 * levels - 2, 0, 1)))).astype(np.uint8)
+
+
+def _discOffsets(radius):                   # (dx, dy) of pixels covered by a disc
+    span = np.arange(-radius, radius + 1)
+    dx, dy = np.meshgrid(span, span)
+    inside = dx * dx + dy * dy <= radius * radius
+    return dx[inside], dy[inside]
+
+
+def toPPM(image) -> bytes:                  # binary PPM, the format Tk PhotoImage reads without extensions
+    height, width, _ = image.shape
+    return f'P6 {width} {height} 255 '.encode("ascii") + np.ascontiguousarray(image, dtype=np.uint8).tobytes()
+
+
+class RasterRenderer:
+
+    def __init__(self, width, height, mode="bodies", trails=False, trailFade=0.85, background=(0, 0, 0)):
+        if mode not in MODES:
+            raise ValueError(f'Unknown render mode {mode}')
+        if not 0.0 <= trailFade < 1.0:
+            raise ValueError("Trail fade has to be in range [0, 1)")
+        self.__mode = mode
+        self.__trails = trails
+        self.__trailFade = trailFade
+        self.__background = np.array(background, dtype=np.float32)
+        self.__colormap = _heatColormap()
+        self.__discs = [_discOffsets(radius) for radius in range(_MAX_DISC_RADIUS + 1)]
+        self.resize(width, height)
+
+    @property
+    def size(self):
+        return self.__width, self.__height
+
+    @property
+    def mode(self):
+        return self.__mode
+
+    @mode.setter
+    def mode(self, value):
+        if value not in MODES:
+            raise ValueError(f'Unknown render mode {value}')
+        self.__mode = value
+        self.clearTrails()
+
+    @property
+    def trails(self) -> bool:
+        return self.__trails
+
+    @trails.setter
+    def trails(self, value):
+        self.__trails = value
+        self.clearTrails()
+
+    def resize(self, width, height):
+        self.__width, self.__height = max(int(width), 1), max(int(height), 1)
+        self.__accumulated = None           # float image with trails of previous frames
+
+    def clearTrails(self):
+        self.__accumulated = None
+
+    def moveTrails(self, scale, offset):    # camera moved: a pixel p of the old trails goes to p * scale + offset
+        if self.__accumulated is None:
+            return
+        x = np.floor((np.arange(self.__width) + 0.5 - offset[0]) / scale).astype(np.int64)
+        y = np.floor((np.arange(self.__height) + 0.5 - offset[1]) / scale).astype(np.int64)
+        insideX = (x >= 0) & (x < self.__width)
+        insideY = (y >= 0) & (y < self.__height)
+        moved = np.empty_like(self.__accumulated)
+        moved[:] = self.__background        # uncovered parts have no trails yet
+        moved[np.ix_(insideY, insideX)] = self.__accumulated[np.ix_(y[insideY], x[insideX])]
+        self.__accumulated = moved
+
+    def render(self, positions, radii, colors=None):    # colors: (n, 3) uint8 for mode bodies, returns (h, w, 3) uint8
+        if self.__mode == "density":
+            frame = self.__density(positions)
+        else:
+            frame = self.__bodies(positions, radii, colors)
+        if not self.__trails:
+            return frame
+        if self.__accumulated is None:
+            self.__accumulated = frame.astype(np.float32)
+        else:                               # old frames fade towards the background, new pixels are drawn over them
+            self.__accumulated -= self.__background
+            self.__accumulated *= self.__trailFade
+            self.__accumulated += self.__background
+            np.maximum(self.__accumulated, frame, out=self.__accumulated)
+        return self.__accumulated.astype(np.uint8)
+
+    def __pixelIndices(self, x, y):         # flat indices of pixels inside the image, others dropped
+        x, y = np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+        inside = (x >= 0) & (x < self.__width) & (y >= 0) & (y < self.__height)
+        return y[inside] * self.__width + x[inside], inside
+
+    def __bodies(self, positions, radii, colors):
+        image = np.empty((self.__height * self.__width, 3), dtype=np.uint8)
+        image[:] = self.__background.astype(np.uint8)
+        pixelRadii = np.clip(np.rint(radii / 2), 0, _MAX_DISC_RADIUS).astype(np.int64)
+        for radius in np.unique(pixelRadii):    # one scatter per disc size
+            bodies = np.flatnonzero(pixelRadii == radius)
+            dx, dy = self.__discs[radius]
+            indices, inside = self.__pixelIndices(positions[bodies, 0, np.newaxis] + dx, positions[bodies, 1, np.newaxis] + dy)
+            image[indices] = np.broadcast_to(colors[bodies, np.newaxis, :], inside.shape + (3,))[inside]
+        return image.reshape(self.__height, self.__width, 3)
+
+    def __density(self, positions):
+        indices, _ = self.__pixelIndices(positions[:, 0], positions[:, 1])
+        counts = np.bincount(indices, minlength=self.__width * self.__height)
+        peak = counts.max() if len(indices) else 0
+        levels = np.log1p(counts) * (255 / np.log1p(peak)) if peak else np.zeros(len(counts))
+        return self.__colormap[levels.astype(np.uint8)].reshape(self.__height, self.__width, 3)
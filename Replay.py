@@ -0,0 +1,74 @@
+import numpy as np
+from Recorder import RecordingReader
+
+
+# Playback cursor over a recording. Position is simulation time, so playback speed does not
+# depend on how often frames were recorded. Frames are read lazily, only the shown one is touched.
+class Replay:
+
+    def __init__(self, path):
+        self.__reader = RecordingReader(path)
+        if len(self.__reader) == 0:
+            raise ValueError(f'{path} has no recorded frames')
+        self.__time = float(self.__reader.times[0])
+        self.__direction = 1                # -1 plays backwards
+        self.__playing = True
+
+    @property
+    def reader(self):
+        return self.__reader
+
+    @property
+    def startTime(self):
+        return float(self.__reader.times[0])
+
+    @property
+    def endTime(self):
+        return float(self.__reader.times[-1])
+
+    @property
+    def time(self):
+        return self.__time
+
+    @property
+    def reversed(self) -> bool:
+        return self.__direction < 0
+
+    @reversed.setter
+    def reversed(self, value):
+        self.__direction = -1 if value else 1
+
+    @property
+    def playing(self) -> bool:
+        return self.__playing
+
+    @playing.setter
+    def playing(self, value):
+        self.__playing = value
+
+    @property
+    def finished(self) -> bool:             # cursor stands at the end it is moving to
+        return self.__time == (self.startTime if self.reversed else self.endTime)
+
+    def seek(self, simulationTime):
+        self.__time = min(max(simulationTime, self.startTime), self.endTime)
+
+    def seekFraction(self, fraction):       # 0 is the first frame, 1 the last one
+        self.seek(self.startTime + fraction * (self.endTime - self.startTime))
+
+    def seekStep(self, step):
+        self.seek(float(self.__reader.times[self.__reader.frameIndexAtStep(step)]))
+
+    def stepFrames(self, count):            # moves the cursor by whole frames, negative goes back
+        index = min(max(self.frameIndex() + count, 0), len(self.__reader) - 1)
+        self.__time = float(self.__reader.times[index])
+
+    def advance(self, simulationTime):      # moves the cursor in the playback direction while playing
+        if self.__playing:
+            self.seek(self.__time + self.__direction * simulationTime)
+
+    def frameIndex(self):                   # last frame recorded at or before the cursor
+        return max(int(np.searchsorted(self.__reader.times, self.__time, side="right")) - 1, 0)
+
+    def frame(self):
+        return self.__reader.frame(self.frameIndex())
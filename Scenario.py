@@ -0,0 +1,78 @@
+import json
+import numpy as np
+from Body import Body
+import Snapshot
+
+# Scenario files hold one JSON object (Body.toDict) per line, files with Snapshot.EXTENSION
+# are binary snapshots
+
+
+def bodiesFromJson(data):
+    bodies = []
+    for line in data.split('\n'):
+        if line:
+            try:
+                bodies.append(Body.createFromDict(json.loads(line)))
+            except (ValueError, KeyError, TypeError):
+                print('Cannot read from file')
+    return bodies
+
+
+def arraysFromJson(data):                   # (masses, radii, positions, velocities, colors), no Body objects
+    rows, colors = [], []
+    for line in data.split('\n'):
+        if line:
+            try:
+                body = json.loads(line)
+                rows.append((float(body["mass"]), float(body["radius"]), float(body["posX"]), float(body["posY"]),
+                             float(body["velX"]), float(body["velY"])))
+                colors.append(body["color"])
+            except (ValueError, KeyError, TypeError):
+                print('Cannot read from file')
+    table = np.array(rows, dtype=float).reshape(-1, 6)
+    return table[:, 0], table[:, 1], table[:, 2:4], table[:, 4:6], colors
+
+
+def bodiesToJson(bodies):
+    return "".join(json.dumps(body.toDict()) + "\n" for body in bodies)
+
+
+def arraysToJson(masses, radii, positions, velocities, colors):     # bodiesToJson from arrays
+    return "".join(json.dumps({"mass": mass, "radius": radius, "color": color, "posX": position[0], "posY": position[1],
+                               "velX": velocity[0], "velY": velocity[1]}) + "\n"
+                   for mass, radius, position, velocity, color in zip(np.asarray(masses, dtype=float).tolist(),
+                                                                     np.asarray(radii, dtype=float).tolist(),
+                                                                     np.asarray(positions, dtype=float).tolist(),
+                                                                     np.asarray(velocities, dtype=float).tolist(), colors))
+
+
+def readBodies(filename):
+    if Snapshot.isSnapshot(filename):
+        return Snapshot.readBodies(filename)
+    with open(filename, "r") as file:
+        return bodiesFromJson(file.read())
+
+
+def readArrays(filename):                   # readBodies as arrays, for loading many bodies at once
+    if Snapshot.isSnapshot(filename):
+        data = Snapshot.readSnapshot(filename)
+        colors = [data.colorTable[index] for index in data.colorIndices.tolist()]
+        return np.array(data.masses), np.array(data.radii), np.array(data.positions), np.array(data.velocities), colors
+    with open(filename, "r") as file:
+        return arraysFromJson(file.read())
+
+
+def writeBodies(filename, bodies):
+    if filename.lower().endswith(Snapshot.EXTENSION):
+        Snapshot.writeBodies(filename, bodies)
+        return
+    with open(filename, "w") as file:
+        file.write(bodiesToJson(bodies))
+
+
+def writeArrays(filename, masses, radii, positions, velocities, colors):    # writeBodies from arrays
+    if filename.lower().endswith(Snapshot.EXTENSION):
+        Snapshot.writeSnapshot(filename, masses, radii, positions, velocities, colors)
+        return
+    with open(filename, "w") as file:
+        file.write(arraysToJson(masses, radii, positions, velocities, colors))
@@ -0,0 +1,90 @@
+import collections
+import numpy as np
+from utility import *
+from Body import Body
+
+# Binary snapshot layout, little endian, every block 8 byte aligned:
+#   header      magic, version, body count, color table size in bytes
+#   float64     mass[count], radius[count], position[count][2], velocity[count][2]
+#   uint32      color index[count] (padded to 8 bytes)
+#   utf-8       color names separated with new lines
+
+MAGIC = b"PSIMSNAP"
+VERSION = 1
+EXTENSION = ".snap"
+_HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("reserved", "<u4"), ("count", "<u8"), ("colorTableSize", "<u8")])
+
+SnapshotData = collections.namedtuple("SnapshotData", "masses radii positions velocities colorIndices colorTable")
+
+
+def isSnapshot(filename):
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def writeSnapshot(filename, masses, radii, positions, velocities, colors):
+    colorTable, colorIndices = np.unique(np.asarray(colors, dtype=object).astype(str), return_inverse=True)
+    writeIndexedSnapshot(filename, masses, radii, positions, velocities, colorIndices, colorTable)
+
+
+def writeIndexedSnapshot(filename, masses, radii, positions, velocities, colorIndices, colorTable):    # colors as indices into colorTable
+    count = len(masses)
+    table = "\n".join(colorTable).encode("utf-8")
+    header = np.zeros(1, dtype=_HEADER)
+    header[0] = (MAGIC, VERSION, 0, count, len(table))
+    indexBytes = 4 * count + (4 * count) % 8
+    data = np.zeros(_HEADER.itemsize + 48 * count + indexBytes + len(table), dtype=np.uint8)
+    offset = _HEADER.itemsize
+    data[:offset] = header.view(np.uint8)
+    for column in (masses, radii, positions, velocities):
+        block = np.ascontiguousarray(column, dtype="<f8").view(np.uint8).ravel()
+        data[offset:offset + len(block)] = block
+        offset += len(block)
+    data[offset:offset + 4 * count] = np.asarray(colorIndices).astype("<u4").view(np.uint8)
+    offset += indexBytes
+    data[offset:] = np.frombuffer(table, dtype=np.uint8)
+    with open(filename, "wb") as file:
+        file.write(data)                    # whole snapshot in one write
+
+
+def readSnapshot(filename):                 # columns are read only views of a memory map, nothing is parsed
+    memory = np.memmap(filename, dtype=np.uint8, mode="r")
+    header = memory[:_HEADER.itemsize].view(_HEADER)[0]
+    if header["magic"] != MAGIC:
+        raise ValueError(f'{filename} is not a snapshot file')
+    if header["version"] != VERSION:
+        raise ValueError(f'Unsupported snapshot version {header["version"]}')
+    count = int(header["count"])
+    offset = _HEADER.itemsize
+    floats = memory[offset:offset + 48 * count].view("<f8")
+    offset += 48 * count
+    colorIndices = memory[offset:offset + 4 * count].view("<u4")
+    offset += 4 * count + (4 * count) % 8
+    table = bytes(memory[offset:offset + int(header["colorTableSize"])]).decode("utf-8")
+    return SnapshotData(
+        masses=floats[:count],
+        radii=floats[count:2 * count],
+        positions=floats[2 * count:4 * count].reshape(count, 2),
+        velocities=floats[4 * count:].reshape(count, 2),
+        colorIndices=colorIndices,
+        colorTable=table.split("\n") if table else []
+    )
+
+
+def writeBodies(filename, bodies):
+    writeSnapshot(
+        filename,
+        [body.mass for body in bodies],
+        [body.radius for body in bodies],
+        [body.position.toPair() for body in bodies],
+        [body.velocity.toPair() for body in bodies],
+        [body.color for body in bodies]
+    )
+
+
+def readBodies(filename):
+    data = readSnapshot(filename)
+    return [
+        Body(float(radius), float(mass), data.colorTable[colorIndex], Vector(*map(float, position)), Vector(*map(float, velocity)))
+        for mass, radius, position, velocity, colorIndex in zip(data.masses, data.radii, data.positions, data.velocities, data.colorIndices)
+    ]
@@ -0,0 +1,104 @@
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utility import *
+from Headless import HeadlessSimulation, createSolver, SOLVERS
+from Integrators import INTEGRATORS, createIntegrator
+from Collisions import collidingPairs
+
+PARAMETERS = ("gFactor", "velocityScale", "massScale")
+
+
+def parameterGrid(grids):                   # dict name : list of values -> list of dicts, one per run
+    for name in grids:
+        if name not in PARAMETERS:
+            raise ValueError(f'Unknown sweep parameter {name}')
+    names = list(grids)
+    return [dict(zip(names, values)) for values in itertools.product(*(grids[name] for name in names))]
+
+
+def overlappingPairs(engine):               # sorted keys of touching pairs, (lower handle << 32) + higher handle
+    first, second = collidingPairs(engine.positions, engine.radii)
+    handles = np.asarray(engine.handles, dtype=np.int64)
+    first, second = handles[first], handles[second]
+    return np.unique((np.minimum(first, second) << np.int64(32)) + np.maximum(first, second))
+
+
+def countEscapes(engine, escapeRadius):     # bodies farther than escapeRadius from the center of mass
+    centerOfMass = np.average(engine.positions, axis=0, weights=engine.masses)
+    distance = np.sqrt(np.sum((engine.positions - centerOfMass)**2, axis=1))
+    return int(np.count_nonzero(distance > escapeRadius))
+
+
+def runCase(scenario, parameters, steps, deltaTime, solver="direct", theta=0.5, integrator="euler", escapeFactor=10.0):
+    Const.setGValueFactor(parameters.get("gFactor", 1.0))       # every run sets it, workers are reused
+    simulation = HeadlessSimulation(createSolver(solver, theta), createIntegrator(integrator))
+    simulation.loadFromFile(scenario)
+    engine = simulation.engine
+    engine.velocities[:] *= parameters.get("velocityScale", 1.0)
+    engine.masses[:] *= parameters.get("massScale", 1.0)
+    engine.invalidateAccelerations()
+
+    centerOfMass = np.average(engine.positions, axis=0, weights=engine.masses)
+    escapeRadius = escapeFactor * max(float(np.max(np.sqrt(np.sum((engine.positions - centerOfMass)**2, axis=1)))), 1.0)
+    initialEnergy = engine.totalEnergy()
+    touching = overlappingPairs(engine)
+    collisions = 0
+    for _ in range(steps):
+        simulation.step(deltaTime)
+        nowTouching = overlappingPairs(engine)
+        collisions += len(np.setdiff1d(nowTouching, touching, assume_unique=True))     # count only new contacts
+        touching = nowTouching
+    finalEnergy = engine.totalEnergy()
+
+    result = dict(parameters)
+    result.update({
+        "energyDrift": abs(finalEnergy - initialEnergy) / abs(initialEnergy) if initialEnergy else abs(finalEnergy),
+        "collisions": collisions,
+        "escapes": countEscapes(engine, escapeRadius)
+    })
+    return result
+
+
+def runSweep(scenario, grids, steps, deltaTime, solver="direct", theta=0.5, integrator="euler", workers=None):
+    cases = parameterGrid(grids)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(runCase, scenario, case, steps, deltaTime, solver, theta, integrator) for case in cases]
+        return [future.result() for future in futures]          # same order as the grid
+
+
+def writeTable(filename, results):
+    with open(filename, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a scenario over a grid of parameters on all cores")
+    parser.add_argument("scenario")
+    parser.add_argument("output", help="csv file for the result table")
+    parser.add_argument("--gfactor", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--velocity-scale", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--mass-scale", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--dt", type=float, default=0.025)
+    parser.add_argument("--solver", choices=SOLVERS, default="direct")
+    parser.add_argument("--theta", type=float, default=0.5)
+    parser.add_argument("--integrator", choices=tuple(INTEGRATORS), default="euler")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    grids = {
+        "gFactor": args.gfactor,
+        "velocityScale": args.velocity_scale,
+        "massScale": args.mass_scale
+    }
+    writeTable(args.output, runSweep(args.scenario, grids, args.steps, args.dt, args.solver, args.theta, args.integrator, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+# Fixed capacity ring buffer of 2D points backed by one numpy array. When full, appending
+# overwrites the oldest point.
+class TrajectoryBuffer:
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Trajectory capacity cannot be lower than 1")
+        self.__points = np.empty((capacity, 2))
+        self.__start = 0                    # index of the oldest point
+        self.__length = 0
+
+    def __len__(self):
+        return self.__length
+
+    @property
+    def capacity(self) -> int:
+        return len(self.__points)
+
+    def append(self, point):
+        capacity = len(self.__points)
+        self.__points[(self.__start + self.__length) % capacity] = point
+        if self.__length < capacity:
+            self.__length += 1
+        else:
+            self.__start = (self.__start + 1) % capacity
+
+    def toArray(self):                      # contiguous copy, oldest point first
+        end = self.__start + self.__length
+        if end <= len(self.__points):
+            return self.__points[self.__start:end].copy()
+        return np.concatenate((self.__points[self.__start:], self.__points[:end - len(self.__points)]))
+
+    def resize(self, capacity):             # keeps the newest points that fit
+        if capacity < 1:
+            raise ValueError("Trajectory capacity cannot be lower than 1")
+        points = self.toArray()[-capacity:]
+        self.__points = np.empty((capacity, 2))
+        self.__points[:len(points)] = points
+        self.__start = 0
+        self.__length = len(points)
+
+    def clear(self):
+        self.__start = 0
+        self.__length = 0
@@ -10,6 +10,16 @@ class Const:
     def getGValue(cls):
         return cls.__GValue * cls.__GValueFactor
 
+    @classmethod
+    def getGValueFactor(cls):
+        return cls.__GValueFactor
+
+    @classmethod
+    def setGValueFactor(cls, value):
+        if value <= 0:
+            raise ValueError("G value factor has to be positive value")
+        cls.__GValueFactor = value
+
 
 class Vector:
     def __init__(self, x = 0, y = 0):
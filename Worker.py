@@ -0,0 +1,245 @@
+import copy
+import multiprocessing as mp
+import queue
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from Engine import Engine
+
+
+# Latest positions published by the worker. A single writer guards every write with a
+# sequence number (odd while writing), readers retry until they copied a stable snapshot.
+# Every snapshot carries the generation of the pushed state it was stepped from.
+class SnapshotBuffer:
+    __HEADER = 5                            # sequence, count, simulation time, steps, generation
+
+    def __init__(self, capacity, name=None):
+        size = 8 * (self.__HEADER + 6 * capacity)
+        self.__memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.__owner = name is None
+        self.__capacity = capacity
+        self.__header = np.ndarray(self.__HEADER, dtype=np.float64, buffer=self.__memory.buf)
+        self.__handles = np.ndarray(capacity, dtype=np.int64, buffer=self.__memory.buf, offset=8 * self.__HEADER)
+        self.__positions = np.ndarray((capacity, 2), dtype=np.float64, buffer=self.__memory.buf,
+                                      offset=8 * (self.__HEADER + capacity))
+        self.__radii = np.ndarray(capacity, dtype=np.float64, buffer=self.__memory.buf,
+                                  offset=8 * (self.__HEADER + 3 * capacity))
+        self.__velocities = np.ndarray((capacity, 2), dtype=np.float64, buffer=self.__memory.buf,
+                                       offset=8 * (self.__HEADER + 4 * capacity))
+        if self.__owner:
+            self.__header[:] = 0
+
+    @property
+    def name(self):
+        return self.__memory.name
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    def write(self, handles, positions, velocities, radii, simulationTime, steps, generation):
+        count = len(handles)
+        self.__header[0] += 1
+        self.__handles[:count] = handles
+        self.__positions[:count] = positions
+        self.__velocities[:count] = velocities
+        self.__radii[:count] = radii
+        self.__header[1:] = (count, simulationTime, steps, generation)
+        self.__header[0] += 1
+
+    def read(self):                         # (handles, positions, velocities, radii, simulation time, steps, generation) or None before first write
+        while True:
+            sequence = self.__header[0]
+            if sequence == 0:
+                return None
+            if sequence % 2:
+                continue
+            count = int(self.__header[1])
+            snapshot = (self.__handles[:count].copy(), self.__positions[:count].copy(), self.__velocities[:count].copy(),
+                        self.__radii[:count].copy(), float(self.__header[2]), int(self.__header[3]), int(self.__header[4]))
+            if self.__header[0] == sequence:
+                return snapshot
+
+    def close(self):
+        del self.__header, self.__handles, self.__positions, self.__velocities, self.__radii
+        self.__memory.close()
+        if self.__owner:
+            self.__memory.unlink()
+
+
+# Commands are read between cycles, a cycle ends after maxStepsPerCycle steps or maxCycleTime
+# seconds, whichever comes first, so even slow steps leave the worker responsive.
+def _workerLoop(commands, replies, diagnostics, bufferName, capacity, forceSolver, integrator, collisionHandler,
+                deltaTime, maxStepsPerCycle, maxCycleTime):
+    snapshots = SnapshotBuffer(capacity, bufferName)
+    engine = Engine(forceSolver, integrator, collisionHandler)
+    running, speedFactor, timeAcc, steps, simulationTime, generation = False, 1.0, 0.0, 0, 0.0, 0
+    monitor, minDeltaTime = None, None
+    lastTime = time.time()
+    while True:
+        try:
+            while True:
+                command, argument = commands.get(block=not running)
+                if command == "stop":
+                    snapshots.close()
+                    return
+                elif command == "state":
+                    state, steps, simulationTime, generation = argument
+                    engine.replaceState(*state)
+                    snapshots.write(engine.handles, engine.positions, engine.velocities, engine.radii, simulationTime, steps,
+                                    generation)
+                elif command == "collect":
+                    replies.put((argument, (engine.handles.copy(), engine.masses.copy(), engine.radii.copy(),
+                                            engine.positions.copy(), engine.velocities.copy())))
+                elif command == "configure":
+                    engine.forceSolver, engine.integrator, engine.collisionHandler, deltaTime = argument
+                elif command == "monitor":
+                    monitor, minDeltaTime = argument
+                elif command == "speed":
+                    speedFactor = argument
+                elif command == "pause":
+                    running = False
+                elif command == "resume":
+                    running = True
+                    lastTime = time.time()
+        except queue.Empty:
+            pass
+
+        now = time.time()
+        timeAcc += (now - lastTime) * speedFactor
+        lastTime = now
+        cycleSteps = 0
+        cycleEnd = time.perf_counter() + maxCycleTime
+        while timeAcc >= deltaTime and cycleSteps < maxStepsPerCycle and time.perf_counter() < cycleEnd:
+            engine.step(deltaTime)
+            timeAcc -= deltaTime
+            simulationTime += deltaTime
+            steps += 1
+            cycleSteps += 1
+            if monitor is not None:         # same as App.__updateMonitor, rows go back with the monitor and timestep
+                row = monitor.update(engine, steps, simulationTime)
+                if row is not None:
+                    if monitor.exceeded and deltaTime / 2 >= minDeltaTime:
+                        deltaTime /= 2
+                        monitor.rebase(engine)
+                    diagnostics.put((generation, row, copy.deepcopy(monitor), deltaTime))   # queue pickles later
+        if timeAcc >= deltaTime:            # physics cannot keep up, drop the backlog
+            timeAcc = min(timeAcc, deltaTime)
+        if cycleSteps:
+            snapshots.write(engine.handles, engine.positions, engine.velocities, engine.radii, simulationTime, steps,
+                            generation)
+        else:
+            time.sleep(min(deltaTime / speedFactor, 0.001))
+
+
+# Steps an engine in a separate process, so physics does not share the Tk main thread.
+# The GUI pushes the full state after structural changes and reads the latest positions.
+# Solver, integrator, collision handler and monitor are copies, configure and setMonitor
+# send them again when the GUI changes them.
+class PhysicsWorker:
+
+    def __init__(self, forceSolver, integrator, collisionHandler, deltaTime, capacity=1024, maxStepsPerCycle=64,
+                 maxCycleTime=0.05):
+        self.__forceSolver = forceSolver
+        self.__integrator = integrator
+        self.__collisionHandler = collisionHandler
+        self.__deltaTime = deltaTime
+        self.__capacity = capacity
+        self.__maxStepsPerCycle = maxStepsPerCycle
+        self.__maxCycleTime = maxCycleTime
+        self.__speedFactor = 1.0
+        self.__running = False
+        self.__process = None
+        self.__monitor = (None, None)       # (ConservationMonitor, minimal timestep) stepped along in the worker
+        self.__generation = 0               # of the last pushed state, older snapshots are not returned
+        self.__request = 0                  # of the last collect, replies to earlier ones are dropped
+
+    @property
+    def alive(self):
+        return self.__process is not None and self.__process.is_alive()
+
+    def start(self):
+        self.__snapshots = SnapshotBuffer(self.__capacity)
+        self.__commands = mp.Queue()
+        self.__replies = mp.Queue()
+        self.__diagnostics = mp.Queue()
+        self.__process = mp.Process(target=_workerLoop, daemon=True, args=(
+            self.__commands, self.__replies, self.__diagnostics, self.__snapshots.name, self.__capacity,
+            self.__forceSolver, self.__integrator, self.__collisionHandler, self.__deltaTime, self.__maxStepsPerCycle,
+            self.__maxCycleTime))
+        self.__process.start()
+        self.__commands.put(("speed", self.__speedFactor))
+        if self.__monitor[0] is not None:
+            self.__commands.put(("monitor", self.__monitor))
+        if self.__running:
+            self.__commands.put(("resume", None))
+
+    def stop(self):
+        if self.__process is None:
+            return
+        self.__commands.put(("stop", None))
+        self.__process.join()
+        self.__process = None
+        self.__snapshots.close()
+
+    def push(self, engine, steps=0, simulationTime=0.0):     # worker continues counting from steps and simulation time
+        if engine.count > self.__capacity:  # snapshot buffer is too small, restart with a bigger one
+            self.stop()
+            self.__capacity = max(engine.count, 2 * self.__capacity)
+            self.start()
+        state = (engine.handles.copy(), engine.masses.copy(), engine.radii.copy(),
+                 engine.positions.copy(), engine.velocities.copy())
+        self.__generation += 1
+        self.__commands.put(("state", (state, steps, simulationTime, self.__generation)))
+
+    def collect(self):                      # (handles, masses, radii, positions, velocities) of the worker engine
+        self.__request += 1
+        self.__commands.put(("collect", self.__request))
+        while True:
+            try:
+                request, state = self.__replies.get(timeout=0.1)
+            except queue.Empty:
+                if not self.__process.is_alive():
+                    raise RuntimeError("Physics worker stopped") from None
+                continue
+            if request == self.__request:
+                return state
+
+    def configure(self, forceSolver, integrator, collisionHandler, deltaTime):
+        self.__forceSolver, self.__integrator, self.__collisionHandler = forceSolver, integrator, collisionHandler
+        self.__deltaTime = deltaTime
+        self.__commands.put(("configure", (forceSolver, integrator, collisionHandler, deltaTime)))
+
+    def setMonitor(self, monitor, minDeltaTime):    # monitor None stops monitoring, see App.__updateMonitor
+        self.__monitor = (monitor, minDeltaTime)
+        self.__commands.put(("monitor", self.__monitor))
+
+    def diagnostics(self):                  # [(row, monitor, timestep)] produced since the last call from the last pushed state
+        results = []
+        while True:
+            try:
+                generation, row, monitor, deltaTime = self.__diagnostics.get_nowait()
+            except queue.Empty:
+                return results
+            if generation == self.__generation:
+                self.__monitor = (monitor, self.__monitor[1])
+                self.__deltaTime = deltaTime
+                results.append((row, monitor, deltaTime))
+
+    def latest(self):                       # (handles, positions, velocities, radii, simulation time, steps) or None
+        snapshot = self.__snapshots.read()  # None also while the worker has not taken the last push yet
+        if snapshot is None or snapshot[6] != self.__generation:
+            return None
+        return snapshot[:6]
+
+    def setSpeedFactor(self, value):
+        self.__speedFactor = value
+        self.__commands.put(("speed", value))
+
+    def pause(self):
+        self.__running = False
+        self.__commands.put(("pause", None))
+
+    def resume(self):
+        self.__running = True
+        self.__commands.put(("resume", None))
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from Camera import Camera
+
+
+def test_camera_round_trip_and_zoom_anchor():
+    camera = Camera()
+    camera.pan(30, -20)
+    camera.zoomAt(2.5, 100, 50)
+    world = np.array([[12.0, -7.0], [300.0, 40.0]])
+    screen = camera.toScreen(world)
+    np.testing.assert_allclose([camera.toWorld(*point) for point in screen], world)
+    anchor = camera.toWorld(100, 50)
+    camera.zoomAt(0.5, 100, 50)
+    np.testing.assert_allclose(camera.toWorld(100, 50), anchor)
+
+
+def test_camera_zoom_limits_and_track():
+    camera = Camera(minZoom=0.5, maxZoom=4)
+    camera.zoomAt(100, 0, 0)
+    assert camera.zoom == 4
+    camera.track((10.0, 20.0), 200, 100)
+    np.testing.assert_allclose(camera.toScreen([[10.0, 20.0]]), [[100.0, 50.0]])
+    with pytest.raises(ValueError):
+        Camera(minZoom=2)
+
+
+def test_pan_moves_the_picture_and_stops_following():
+    camera = Camera()
+    camera.zoomAt(2.0, 0, 0)
+    camera.followCenterOfMass()
+    before = camera.toScreen([[5.0, 5.0]])
+    camera.pan(30, -10)
+    np.testing.assert_allclose(camera.toScreen([[5.0, 5.0]]), before + (30, -10))
+    assert camera.following == "none"
+    camera.followBody(7)
+    assert (camera.following, camera.followedHandle) == ("body", 7)
+    camera.reset()
+    assert camera.view == (0.0, 0.0, 1.0) and camera.following == "none"
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import Scenario
+from Collisions import CollisionHandler
+from Headless import HeadlessSimulation, createSolver, main
+from Integrators import INTEGRATORS, createIntegrator
+from Recorder import RecordingReader
+
+DELTA_TIME = 0.025
+ARRAYS = ("handles", "positions", "velocities", "masses", "radii")
+
+
+def randomArrays(count=40, seed=1):
+    random = np.random.default_rng(seed)
+    return (random.uniform(10, 1000, count), random.uniform(1, 6, count), random.uniform(0, 300, (count, 2)),
+            random.uniform(-5, 5, (count, 2)), [f'color{i}' for i in range(count)])
+
+
+def simulation(integrator, solver, collisions):
+    result = HeadlessSimulation(createSolver(solver, 0.4), createIntegrator(integrator),
+                                CollisionHandler(collisions) if collisions else None)
+    result.addBodies(*randomArrays())
+    return result
+
+
+@pytest.mark.parametrize("solver, collisions", (("direct", None), ("barnes-hut", "merge"), ("direct", "bounce")))
+@pytest.mark.parametrize("integrator", INTEGRATORS)
+def test_resumed_run_is_bit_identical(integrator, solver, collisions, tmp_path):
+    checkpoint = str(tmp_path / "run.npz")
+    whole = simulation(integrator, solver, collisions)
+    whole.run(80, DELTA_TIME)
+    crashed = simulation(integrator, solver, collisions)
+    crashed.run(40, DELTA_TIME)
+    crashed.saveCheckpoint(checkpoint, DELTA_TIME)
+    crashed.run(15, DELTA_TIME)             # lost with the crash
+    resumed, deltaTime = HeadlessSimulation.fromCheckpoint(checkpoint)
+    assert (resumed.steps, deltaTime) == (40, DELTA_TIME)
+    resumed.run(40, deltaTime)
+    assert (resumed.steps, resumed.time) == (whole.steps, whole.time)
+    for name in ARRAYS:
+        np.testing.assert_array_equal(getattr(resumed.engine, name), getattr(whole.engine, name))
+
+
+def test_command_line_resume_matches_uninterrupted_run(tmp_path):
+    scenario = str(tmp_path / "scenario.json")
+    Scenario.writeArrays(scenario, *randomArrays(seed=2))
+
+    def run(name, steps, resume=False):
+        arguments = [scenario, str(tmp_path / f'{name}.json'), "--steps", str(steps), "--dt", "0.05",
+                     "--integrator", "leapfrog", "--collisions", "merge", "--record", str(tmp_path / f'{name}.rec'),
+                     "--record-every", "7", "--diagnostics", str(tmp_path / f'{name}.csv'), "--diagnostics-every", "10",
+                     "--energy-tolerance", "1e-6", "--min-dt", "0.01",
+                     "--checkpoint", str(tmp_path / f'{name}.npz'), "--checkpoint-every", "60"]
+        main(arguments + (["--resume"] if resume else []))
+
+    run("whole", 150)
+    run("resumed", 60)
+    checkpoint = (tmp_path / "resumed.npz").read_bytes()
+    run("resumed", 100, resume=True)        # crashes after step 100, its output after the checkpoint is stale
+    (tmp_path / "resumed.npz").write_bytes(checkpoint)
+    run("resumed", 150, resume=True)
+    for suffix in (".json", ".csv"):
+        assert (tmp_path / f'resumed{suffix}').read_bytes() == (tmp_path / f'whole{suffix}').read_bytes()
+    whole, resumed = RecordingReader(str(tmp_path / "whole.rec")), RecordingReader(str(tmp_path / "resumed.rec"))
+    assert resumed.steps.tolist() == whole.steps.tolist()
+    assert resumed.diagnostics == whole.diagnostics
+    for i in range(len(whole)):
+        for recorded, expected in zip(resumed.frame(i), whole.frame(i)):
+            np.testing.assert_array_equal(recorded, expected)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from Collisions import CollisionHandler, collidingPairs, groupLabels
+from Diagnostics import momentum
+from Engine import Engine
+
+
+def bruteForcePairs(positions, radii):
+    first, second = np.triu_indices(len(radii), 1)
+    deltaS = positions[second] - positions[first]
+    touching = np.einsum('ij,ij->i', deltaS, deltaS) <= (radii[first] + radii[second])**2
+    return {(int(a), int(b)) for a, b in zip(first[touching], second[touching])}
+
+
+def pairSet(first, second):
+    return {(int(min(a, b)), int(max(a, b))) for a, b in zip(first, second)}
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_colliding_pairs_match_brute_force(seed):
+    random = np.random.default_rng(seed)
+    positions = random.uniform(-200, 200, (600, 2))
+    radii = random.uniform(0.5, 6.0, 600)
+    radii[:3] = (40.0, 90.0, 300.0)         # oversized bodies span many grid cells
+    first, second = collidingPairs(positions, radii)
+    assert len(first) == len(pairSet(first, second))   # no pair reported twice
+    assert pairSet(first, second) == bruteForcePairs(positions, radii)
+
+
+def test_group_labels_follow_chains():
+    labels = groupLabels(6, np.array([4, 1, 2]), np.array([5, 2, 3]))
+    assert labels.tolist() == [0, 1, 1, 1, 4, 4]
+
+
+def chainEngine():                          # three touching bodies in a row and one far away
+    engine = Engine()
+    engine.addMany(np.array([5.0, 1.0, 2.0, 3.0]), np.array([2.0, 2.0, 2.0, 1.0]),
+                   np.array([[0.0, 0.0], [3.0, 0.0], [6.0, 1.0], [100.0, 100.0]]),
+                   np.array([[1.0, 0.0], [-2.0, 1.0], [0.0, -3.0], [0.5, 0.5]]))
+    return engine
+
+
+def test_merge_conserves_mass_momentum_and_area():
+    engine = chainEngine()
+    totalMass, totalMomentum = engine.masses.sum(), momentum(engine)
+    center = np.sum(engine.masses[:3, np.newaxis] * engine.positions[:3], axis=0) / engine.masses[:3].sum()
+    handles = engine.handles.copy()
+    removed = CollisionHandler("merge").resolve(engine)
+    assert sorted(removed) == sorted(int(handle) for handle in handles[1:3])
+    assert engine.count == 2
+    assert engine.masses.sum() == pytest.approx(totalMass)
+    np.testing.assert_allclose(momentum(engine), totalMomentum)
+    survivor = engine.rowOf(int(handles[0]))     # the heaviest body keeps its handle
+    np.testing.assert_allclose(engine.positions[survivor], center)
+    assert engine.radii[survivor] == pytest.approx(np.sqrt(12.0))
+
+
+def test_elastic_bounce_conserves_momentum_and_energy():
+    engine = Engine()
+    engine.addMany(np.array([1.0, 3.0]), np.array([1.0, 1.0]), np.array([[0.0, 0.0], [1.5, 0.5]]),
+                   np.array([[2.0, 0.0], [-1.0, 0.0]]))
+    totalMomentum, kinetic = momentum(engine), engine.kineticEnergy()
+    handler = CollisionHandler("bounce", restitution=1.0)
+    assert handler.resolve(engine) == []
+    assert handler.collisions == 1
+    np.testing.assert_allclose(momentum(engine), totalMomentum)
+    assert engine.kineticEnergy() == pytest.approx(kinetic)
+    normal = (engine.positions[1] - engine.positions[0]) / np.linalg.norm(engine.positions[1] - engine.positions[0])
+    assert np.dot(engine.velocities[1] - engine.velocities[0], normal) > 0      # separating after the impulse
@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import pytest
+import Scenario
+from Benchmark import syntheticSystem
+from Distributed import DistributedSimulation
+from Headless import HeadlessSimulation, createSolver
+from Integrators import createIntegrator
+
+SCENARIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scenario2 - simple solar system.JSON")
+STEPS = 60
+DELTA_TIME = 0.05
+
+
+@pytest.fixture(scope="module")
+def system():
+    masses, radii, positions, velocities = syntheticSystem(300, seed=3)
+    return masses, radii, positions, velocities, ["red", "blue", "green"] * 100
+
+
+@pytest.fixture(scope="module")
+def singleProcess(system):
+    simulation = HeadlessSimulation(createSolver("direct"), createIntegrator("leapfrog"))
+    simulation.addBodies(*system)
+    simulation.run(STEPS, DELTA_TIME)
+    order = np.argsort(simulation.engine.handles)
+    return simulation.engine.positions[order], simulation.engine.velocities[order]
+
+
+@pytest.mark.parametrize("workers", (1, 3))
+def test_theta_zero_matches_single_process(system, singleProcess, workers):
+    with DistributedSimulation(workers, theta=0.0, rebalanceEvery=20) as simulation:
+        simulation.loadArrays(*system)
+        simulation.run(STEPS, DELTA_TIME)
+        masses, radii, positions, velocities, colors = simulation.bodies()
+    expectedPositions, expectedVelocities = singleProcess
+    np.testing.assert_allclose(positions, expectedPositions, rtol=0, atol=1e-9 * np.abs(expectedPositions).max())
+    np.testing.assert_allclose(velocities, expectedVelocities, rtol=0, atol=1e-9 * np.abs(expectedVelocities).max())
+    np.testing.assert_array_equal(masses, system[0])
+    assert colors == system[4]
+
+
+def test_scenario_round_trip(tmp_path):
+    path = str(tmp_path / "state.json")
+    with DistributedSimulation(2, theta=0.0) as simulation:
+        simulation.loadFromFile(SCENARIO)
+        simulation.saveCurrentStateToFile(path)
+    for saved, original in zip(Scenario.readArrays(path), Scenario.readArrays(SCENARIO)):
+        if isinstance(original, list):
+            assert saved == original
+        else:
+            np.testing.assert_array_equal(saved, original)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import Generators
+import Scenario
+from Diagnostics import momentum
+from Engine import Engine
+
+
+def engineOf(system):
+    engine = Engine()
+    Generators.loadIntoEngine(engine, system)
+    return engine
+
+
+def kineticEnergy(system):
+    return 0.5 * float(np.sum(system.masses * np.einsum('ij,ij->i', system.velocities, system.velocities)))
+
+
+GENERATORS = {
+    "disc": lambda seed: Generators.uniformDisc(500, seed=seed),
+    "plummer": lambda seed: Generators.plummer(500, seed=seed),
+    "keplerian": lambda seed: Generators.keplerian(200, seed=seed),
+    "galaxies": lambda seed: Generators.collidingGalaxies(600, seed=seed),
+    "binary": lambda seed: Generators.hierarchicalBinary(4, seed=seed)
+}
+
+
+@pytest.mark.parametrize("name", GENERATORS)
+def test_seeded_generators_are_reproducible(name):
+    first, second, other = GENERATORS[name](7), GENERATORS[name](7), GENERATORS[name](8)
+    for column in ("masses", "radii", "positions", "velocities", "colorIndices"):
+        np.testing.assert_array_equal(getattr(first, column), getattr(second, column))
+    assert not np.array_equal(first.positions, other.positions)
+    assert first.colorIndices.max() < len(first.colorTable)
+
+
+@pytest.mark.parametrize("name", ("plummer", "keplerian", "galaxies", "binary"))
+def test_systems_have_no_net_momentum(name):
+    system = GENERATORS[name](3)
+    scale = float(np.sum(system.masses * np.linalg.norm(system.velocities, axis=1)))
+    assert np.abs(momentum(engineOf(system))).max() < 1e-12 * scale
+
+
+def test_random_velocities_are_virial():       # 2K = -sum m r.a for the unclamped force law
+    system = Generators.plummer(400, bodyRadius=1e-6, seed=1)
+    engine = engineOf(system)
+    virial = -float(np.sum(engine.masses * np.einsum('ij,ij->i', engine.positions, engine.computeAccelerations())))
+    assert kineticEnergy(system) == pytest.approx(Generators.virialKineticEnergy(system.masses))
+    assert 2 * kineticEnergy(system) == pytest.approx(virial, rel=1e-9)
+
+
+def radialBalance(system, center, rows=slice(None)):   # centripetal over inward acceleration of the bodies in rows
+    offsets = system.positions[rows] - center
+    distances = np.linalg.norm(offsets, axis=1)
+    inward = -np.einsum('ij,ij->i', engineOf(system).computeAccelerations()[rows], offsets) / distances
+    return np.einsum('ij,ij->i', system.velocities[rows], system.velocities[rows]) / distances / inward
+
+
+def test_planets_orbit_the_star():
+    system = Generators.keplerian(100, planetMass=1e-9, planetRadius=1e-6, seed=2)
+    np.testing.assert_allclose(radialBalance(system, system.positions[0], slice(1, None)), 1.0, rtol=1e-6)
+
+
+def test_rotating_disc_is_balanced():           # exact for the enclosed mass, up to shot noise for single bodies
+    system = Generators.uniformDisc(1000, bodyRadius=1e-6, seed=2)
+    assert np.median(radialBalance(system, Generators.DEFAULT_CENTER)) == pytest.approx(1.0, abs=0.01)
+    engine = engineOf(system)
+    virial = -float(np.sum(engine.masses * np.einsum('ij,ij->i', engine.positions, engine.computeAccelerations())))
+    assert 2 * kineticEnergy(system) == pytest.approx(virial, rel=1e-9)
+
+
+def test_combined_galaxies_are_centered():
+    system = Generators.collidingGalaxies(400, massRatio=0.5, center=(10.0, -20.0), seed=4)
+    assert len(system.masses) == 402            # two bulges
+    np.testing.assert_allclose(np.average(system.positions, axis=0, weights=system.masses), (10.0, -20.0))
+    assert system.colorTable == ["yellow", "light sky blue", "light salmon"]
+
+
+def test_hierarchical_binary_splits_mass():
+    system = Generators.hierarchicalBinary(5, totalMass=320.0, center=(0.0, 0.0), seed=5)
+    assert len(system.masses) == 32
+    np.testing.assert_allclose(system.masses, 10.0)
+    np.testing.assert_allclose(np.average(system.positions, axis=0, weights=system.masses), (0.0, 0.0), atol=1e-9)
+
+
+@pytest.mark.parametrize("name", ("system.json", "system.snap"))
+def test_written_systems_load_as_scenarios(name, tmp_path):
+    path = str(tmp_path / name)
+    Generators.main([path, "--seed", "3", "galaxies", "--count", "100"])
+    system = Generators.collidingGalaxies(100, seed=3)
+    masses, radii, positions, velocities, colors = Scenario.readArrays(path)
+    np.testing.assert_array_equal(masses, system.masses)
+    np.testing.assert_array_equal(positions, system.positions)
+    np.testing.assert_array_equal(velocities, system.velocities)
+    assert colors == [system.colorTable[index] for index in system.colorIndices]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from Diagnostics import measure
+from Engine import Engine
+from Integrators import BlockTimestepIntegrator, createIntegrator
+
+ORDERS = {"euler": 1, "leapfrog": 2, "yoshida": 4, "rk4": 4}
+
+
+def binaryEngine(integrator):               # light body on an eccentric orbit around a heavy one
+    engine = Engine(integrator=integrator)
+    engine.addMany(np.array([1000.0, 10.0]), np.array([1.0, 1.0]), np.array([[0.0, 0.0], [50.0, 0.0]]),
+                   np.array([[0.0, 0.0], [0.0, 6.0]]))
+    return engine
+
+
+def integrate(integrator, deltaTime, duration):
+    engine = binaryEngine(integrator)
+    for _ in range(int(round(duration / deltaTime))):
+        engine.integrator.step(engine, deltaTime)
+    return engine
+
+
+@pytest.mark.parametrize("name", ORDERS)
+def test_convergence_order(name):
+    duration = 4.0
+    reference = integrate(createIntegrator("yoshida"), 1 / 1024, duration).positions
+    errors = [np.abs(integrate(createIntegrator(name), deltaTime, duration).positions - reference).max()
+              for deltaTime in (1 / 8, 1 / 16)]
+    assert np.log2(errors[0] / errors[1]) == pytest.approx(ORDERS[name], abs=0.3)
+
+
+@pytest.mark.parametrize("name", ("leapfrog", "yoshida"))
+def test_symplectic_energy_stays_bounded(name):
+    engine = binaryEngine(createIntegrator(name))
+    initial = measure(engine).energy
+    drifts = []
+    for _ in range(20):
+        for _ in range(100):
+            engine.integrator.step(engine, 0.05)
+        drifts.append(abs(measure(engine).energy - initial))
+    assert max(drifts[10:]) < 2 * max(drifts[:10]) + 1e-9 * abs(initial)
+
+
+def test_block_timesteps_without_levels_are_leapfrog():
+    leapfrog = integrate(createIntegrator("leapfrog"), 0.05, 2.0)
+    block = integrate(BlockTimestepIntegrator(maxLevel=0), 0.05, 2.0)
+    np.testing.assert_allclose(block.positions, leapfrog.positions, rtol=1e-12)
+    np.testing.assert_allclose(block.velocities, leapfrog.velocities, rtol=1e-12)
+
+
+def test_block_timesteps_converge_to_fine_leapfrog():
+    reference = integrate(createIntegrator("leapfrog"), 1 / 512, 2.0).positions
+    coarse = integrate(createIntegrator("leapfrog"), 0.5, 2.0).positions
+    block = integrate(BlockTimestepIntegrator(eta=0.02), 0.5, 2.0)
+    assert np.abs(block.positions - reference).max() < 0.1 * np.abs(coarse - reference).max()
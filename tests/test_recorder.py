@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pytest
+from Recorder import Recorder, RecordingReader
+
+COUNT = 5
+
+
+def frameArrays(step):
+    handles = np.arange(COUNT) + (step // 10)    # bodies come and go every 10 steps
+    positions = np.column_stack((np.arange(COUNT) + step, np.full(COUNT, 0.5 * step)))
+    return handles, positions, -positions, np.full(COUNT, 1.0 + step)
+
+
+def record(recorder, steps, diagnosticsAfter=-1):   # like HeadlessSimulation, the resumed step has its row already
+    for step in steps:
+        recorder.record(step, 0.1 * step, *frameArrays(step))
+        if step > diagnosticsAfter:
+            recorder.recordDiagnostics({"step": step})
+
+
+def assertSameRecording(first, second):
+    assert len(first) == len(second)
+    for i in range(len(first)):
+        a, b = first.frame(i), second.frame(i)
+        assert (a.step, a.time) == (b.step, b.time)
+        for x, y in zip(a[2:], b[2:]):
+            np.testing.assert_array_equal(x, y)
+    assert first.diagnostics == second.diagnostics
+
+
+@pytest.mark.parametrize("compressionLevel", (0, 6))
+def test_frames_round_trip(tmp_path, compressionLevel):
+    recorder = Recorder(str(tmp_path / "run.rec"), every=3, chunkFrames=4, compressionLevel=compressionLevel)
+    recorder.addColors([0, 1], ["red", "blue"])
+    record(recorder, range(40))
+    recorder.close()
+    reader = RecordingReader(str(tmp_path / "run.rec"))
+    assert reader.steps.tolist() == list(range(0, 40, 3))
+    assert reader.colors == {0: "red", 1: "blue"}
+    frame = reader.frame(reader.frameIndexAtStep(20))
+    assert frame.step == 18
+    for recorded, expected in zip(frame[2:], frameArrays(18)):
+        np.testing.assert_array_equal(recorded, expected)
+
+
+@pytest.mark.parametrize("compressionLevel", (0, 6))
+def test_resume_cuts_inside_a_chunk(tmp_path, compressionLevel):
+    whole, resumed = str(tmp_path / "whole.rec"), str(tmp_path / "resumed.rec")
+    recorder = Recorder(whole, every=2, chunkFrames=8, compressionLevel=compressionLevel)
+    record(recorder, range(100))
+    recorder.close()
+    recorder = Recorder(resumed, every=2, chunkFrames=8, compressionLevel=compressionLevel)
+    record(recorder, range(71))             # ran on past the checkpoint at step 50
+    recorder.close()
+    recorder = Recorder(resumed, every=2, chunkFrames=8, compressionLevel=compressionLevel, resumeStep=50)
+    record(recorder, range(50, 100), diagnosticsAfter=50)
+    recorder.close()
+    assertSameRecording(RecordingReader(whole), RecordingReader(resumed))
+    if not compressionLevel:                # nothing left of the frames after the checkpoint
+        assert os.path.getsize(resumed) == os.path.getsize(whole)
+
+
+def test_writer_error_is_raised(tmp_path):
+    recorder = Recorder(str(tmp_path / "run.rec"), chunkFrames=1, compressionLevel=99)   # zlib rejects the level
+    with pytest.raises(Exception):
+        for step in range(1000):
+            recorder.record(step, 0.0, *frameArrays(step))
+    with pytest.raises(Exception):
+        recorder.close()
+
+
+def test_bounded_queue_keeps_every_frame(tmp_path):
+    recorder = Recorder(str(tmp_path / "run.rec"), chunkFrames=2, maxQueued=1)
+    record(recorder, range(200))
+    recorder.close()
+    assert len(RecordingReader(str(tmp_path / "run.rec"))) == 200
@@ -0,0 +1,33 @@
+import numpy as np
+from Renderer import RasterRenderer, toPPM
+
+
+def test_bodies_are_drawn_in_their_color():
+    renderer = RasterRenderer(20, 10)
+    colors = np.array([[255, 0, 0], [0, 255, 0]], dtype=np.uint8)
+    image = renderer.render(np.array([[3.0, 3.0], [15.0, 7.0]]), np.array([0.0, 0.0]), colors)
+    assert image.shape == (10, 20, 3)
+    assert tuple(image[3, 3]) == (255, 0, 0) and tuple(image[7, 15]) == (0, 255, 0)
+    assert image.sum() == 2 * 255
+    assert toPPM(image).startswith(b'P6 20 10 255 ')
+
+
+def test_density_counts_bodies_outside_dropped():
+    renderer = RasterRenderer(4, 4, mode="density")
+    image = renderer.render(np.array([[1.5, 1.5], [1.5, 1.5], [0.5, 2.5], [-5.0, 1.0]]), np.zeros(4))
+    assert tuple(image[1, 1]) == (255, 255, 255)     # the densest pixel is white
+    assert 0 < image[2, 0].sum() < image[1, 1].sum()
+    assert image.sum() == image[1, 1].sum() + image[2, 0].sum()
+
+
+def test_trails_fade_and_follow_the_camera():
+    renderer = RasterRenderer(20, 20, trails=True, trailFade=0.5)
+    color = np.array([[200, 200, 200]], dtype=np.uint8)
+    renderer.render(np.array([[5.0, 5.0]]), np.zeros(1), color)
+    image = renderer.render(np.array([[15.0, 15.0]]), np.zeros(1), color)
+    assert tuple(image[5, 5]) == (100, 100, 100)
+    renderer.moveTrails(2.0, (-3.0, 1.0))            # trail pixel 5 goes to pixel 7 in x, 11 in y
+    image = renderer.render(np.empty((0, 2)), np.empty(0), np.empty((0, 3), dtype=np.uint8))
+    assert tuple(image[11, 7]) == (50, 50, 50) and tuple(image[5, 5]) == (0, 0, 0)
+    renderer.clearTrails()
+    assert renderer.render(np.empty((0, 2)), np.empty(0), np.empty((0, 3), dtype=np.uint8)).sum() == 0
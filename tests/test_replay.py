@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from Recorder import Recorder
+from Replay import Replay
+
+
+@pytest.fixture
+def recording(tmp_path):                    # frames at steps 0, 4, ... 36, time 0.5 per step
+    path = str(tmp_path / "run.rec")
+    recorder = Recorder(path, every=4, chunkFrames=3)
+    for step in range(40):
+        positions = np.full((2, 2), float(step))
+        recorder.record(step, 0.5 * step, np.array([0, 1]), positions, -positions, np.ones(2))
+    recorder.close()
+    return path
+
+
+def test_cursor_is_clamped_to_the_recording(recording):
+    replay = Replay(recording)
+    assert (replay.startTime, replay.endTime) == (0.0, 18.0)
+    replay.seek(-5.0)
+    assert replay.time == 0.0 and replay.frame().step == 0
+    replay.seek(100.0)
+    assert replay.finished and replay.frame().step == 36
+    replay.seekFraction(0.5)
+    assert replay.time == 9.0 and replay.frame().step == 16    # last frame at or before the cursor
+
+
+def test_seek_step_and_frame_stepping(recording):
+    replay = Replay(recording)
+    replay.seekStep(23)
+    assert replay.frame().step == 20
+    np.testing.assert_array_equal(replay.frame().positions, np.full((2, 2), 20.0))
+    replay.stepFrames(2)
+    assert replay.frame().step == 28
+    replay.stepFrames(-100)
+    assert replay.frame().step == 0
+
+
+def test_advance_follows_direction_and_pause(recording):
+    replay = Replay(recording)
+    replay.advance(5.0)
+    assert replay.frame().step == 8
+    replay.reversed = True
+    replay.advance(3.0)
+    assert replay.time == 2.0 and replay.frame().step == 4
+    replay.playing = False
+    replay.advance(3.0)
+    assert replay.time == 2.0
+    replay.playing = True
+    replay.advance(10.0)
+    assert replay.finished and replay.frame().step == 0
+
+
+def test_empty_recording_cannot_be_replayed(tmp_path):
+    path = str(tmp_path / "empty.rec")
+    Recorder(path).close()
+    with pytest.raises(ValueError):
+        Replay(path)
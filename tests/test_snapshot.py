@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import Scenario
+import Snapshot
+from Body import Body
+from utility import Vector
+
+
+def randomArrays(count, seed=0):
+    random = np.random.default_rng(seed)
+    colors = [("red", "blue", "white", "żółty")[index] for index in random.integers(0, 4, count)]
+    return (random.uniform(1, 100, count), random.uniform(0.5, 5, count), random.normal(0, 300, (count, 2)),
+            random.normal(0, 10, (count, 2)), colors)
+
+
+@pytest.mark.parametrize("count", (0, 1, 7, 1000))     # odd counts pad the color indices
+def test_snapshot_round_trip(count, tmp_path):
+    path = str(tmp_path / "bodies.snap")
+    masses, radii, positions, velocities, colors = randomArrays(count)
+    Snapshot.writeSnapshot(path, masses, radii, positions, velocities, colors)
+    data = Snapshot.readSnapshot(path)
+    np.testing.assert_array_equal(data.masses, masses)
+    np.testing.assert_array_equal(data.radii, radii)
+    np.testing.assert_array_equal(data.positions, positions.reshape(count, 2))
+    np.testing.assert_array_equal(data.velocities, velocities.reshape(count, 2))
+    assert [data.colorTable[index] for index in data.colorIndices] == colors
+
+
+def test_scenario_reads_both_formats_alike(tmp_path):
+    arrays = randomArrays(50, seed=1)
+    for name in ("bodies.snap", "bodies.json"):
+        Scenario.writeArrays(str(tmp_path / name), *arrays)
+    fromSnapshot = Scenario.readArrays(str(tmp_path / "bodies.snap"))
+    fromJson = Scenario.readArrays(str(tmp_path / "bodies.json"))
+    for snapshotColumn, jsonColumn, original in zip(fromSnapshot[:4], fromJson[:4], arrays[:4]):
+        np.testing.assert_array_equal(snapshotColumn, original)
+        np.testing.assert_array_equal(jsonColumn, original)
+    assert fromSnapshot[4] == fromJson[4] == arrays[4]
+
+
+def test_bodies_round_trip(tmp_path):
+    path = str(tmp_path / "bodies.snap")
+    bodies = [Body(2.0, 10.0, "red", Vector(1.5, -2.0), Vector(0.25, 3.0)), Body(1.0, 0.5, "blue", Vector(), Vector())]
+    Scenario.writeBodies(path, bodies)
+    loaded = Scenario.readBodies(path)
+    assert [(body.radius, body.mass, body.color, body.position.toPair(), body.velocity.toPair()) for body in loaded] == \
+           [(body.radius, body.mass, body.color, body.position.toPair(), body.velocity.toPair()) for body in bodies]
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / "other.snap"
+    path.write_bytes(b"NOTASNAP" + bytes(24))
+    assert not Snapshot.isSnapshot(str(path))
+    with pytest.raises(ValueError):
+        Snapshot.readSnapshot(str(path))
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import Kernels
+from BarnesHut import BarnesHutSolver
+from Benchmark import TOLERANCES, syntheticEngine
+from Engine import DirectSolver, ReferenceSolver
+from Headless import createSolver
+
+SIZES = (2, 10, 200)
+SPREADS = (1.0, 0.05)                       # 0.05 packs the bodies so that many pairs are clamped at contact
+
+
+def relativeError(accelerations, reference):
+    scale = np.sqrt(np.mean(np.sum(reference**2, axis=1)))
+    return float(np.max(np.sqrt(np.sum((accelerations - reference)**2, axis=1)))) / scale
+
+
+def referenceEngine(count, spread):
+    engine = syntheticEngine(count, "reference", seed=count)
+    engine.positions[:] *= spread
+    return engine
+
+
+def numpyCompiledSolver(monkeypatch):
+    monkeypatch.setattr(Kernels, "NUMBA_AVAILABLE", False)
+    solver = Kernels.CompiledSolver()
+    assert solver.backend == "numpy"
+    return solver
+
+
+def solverUnderTest(name, monkeypatch):
+    if name == "compiled-numpy":
+        return numpyCompiledSolver(monkeypatch)
+    if name == "compiled" and not Kernels.NUMBA_AVAILABLE:
+        pytest.skip("numba is not installed")
+    return createSolver(name)
+
+
+@pytest.mark.parametrize("spread", SPREADS)
+@pytest.mark.parametrize("count", SIZES)
+@pytest.mark.parametrize("name", ("direct", "compiled", "compiled-numpy", "barnes-hut"))
+def test_accelerations_match_reference(name, count, spread, monkeypatch):
+    engine = referenceEngine(count, spread)
+    reference = engine.computeAccelerations().copy()
+    engine.forceSolver = solverUnderTest(name, monkeypatch)
+    tolerance = TOLERANCES[name.replace("-numpy", "")]
+    assert relativeError(engine.computeAccelerations(), reference) <= tolerance
+
+
+@pytest.mark.parametrize("name", ("direct", "compiled", "compiled-numpy"))
+def test_target_rows_match_reference(name, monkeypatch):
+    engine = referenceEngine(50, 0.05)
+    targets = np.array([0, 7, 49, 7])
+    reference = ReferenceSolver().accelerations(engine.positions, engine.masses, engine.radii, targets)
+    solver = solverUnderTest(name, monkeypatch)
+    accelerations = solver.accelerations(engine.positions, engine.masses, engine.radii, targets)
+    assert accelerations.shape == (len(targets), 2)
+    assert relativeError(accelerations, reference) <= TOLERANCES[name.replace("-numpy", "")]
+
+
+def test_small_tiles_give_the_same_forces():
+    engine = referenceEngine(100, 0.05)
+    arguments = (engine.positions, engine.masses, engine.radii)
+    np.testing.assert_allclose(DirectSolver(tileElements=1).accelerations(*arguments),
+                               DirectSolver().accelerations(*arguments), rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("name", ("direct", "compiled", "compiled-numpy"))
+def test_potential_from_force_pass_matches_engine(name, monkeypatch):
+    engine = referenceEngine(100, 0.05)
+    expected = engine.potentialEnergy()
+    solver = solverUnderTest(name, monkeypatch)
+    solver.withPotential = True
+    engine.forceSolver = solver
+    engine.computeAccelerations()
+    assert solver.lastPotentialEnergy == pytest.approx(expected, rel=1e-10)
+    assert engine.potentialEnergy() == pytest.approx(expected, rel=1e-10)
+
+
+@pytest.mark.parametrize("theta, tolerance", ((0.0, 1e-10), (0.5, 1e-2)))
+def test_barnes_hut_potential_from_tree_walk(theta, tolerance):
+    engine = referenceEngine(300, 0.05)
+    expected = engine.potentialEnergy()
+    engine.forceSolver = BarnesHutSolver(theta, withPotential=True)
+    engine.computeAccelerations()
+    assert engine.forceSolver.lastPotentialEnergy == pytest.approx(expected, rel=tolerance)
@@ -0,0 +1,9 @@
+import pytest
+from Benchmark import STARTUP_BUDGET, STARTUP_CASES, STARTUP_FORBIDDEN, benchmarkStartup
+
+
+@pytest.mark.parametrize("case", tuple(STARTUP_CASES))
+def test_cold_import_is_fast_and_lean(case):
+    result, = benchmarkStartup({case: STARTUP_CASES[case]}, repeats=3)     # each import in a fresh interpreter
+    assert result["forbiddenLoaded"] == [], f'{case} imports {", ".join(result["forbiddenLoaded"])}, none of {STARTUP_FORBIDDEN} may load'
+    assert result["seconds"] <= STARTUP_BUDGET, f'{case} takes {result["seconds"]:.3f} s to import'